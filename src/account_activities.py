@@ -0,0 +1,246 @@
+'''
+
+	Description:
+		local copy of the account's activities (fills, fees, interest, dividends, ...), kept in a sqlite database
+        so fee, interest, and fill queries don't need the API, and each sync only downloads what's new
+
+        sync_activities()
+            pages through GET /v2/account/activities oldest 1st (100 per page, the max), passing the id of the
+            last activity of each page as the page_token of the next, and upserts each page into the store.
+            the id of the newest activity stored is the "high water mark" of the sync, saved after every page,
+            so the next sync (or 1 that died halfway) starts right after it instead of from the beginning.
+            each set of activity_types synced has its own high water mark
+
+        ActivityStore
+            1 row per activity, keyed by its id, with the fields used for queries in their own indexed columns
+            (activity_type, date, symbol, ...) and the whole activity as json in the "raw" column
+            query() returns the activities of some types / symbols / dates as a pandas dataframe
+
+        activity ids start with the time of the activity (ex: 20240226093000123::8a8b...),
+        so sorting them by id sorts them by time
+
+	Sources:
+        https://docs.alpaca.markets/reference/getaccountactivities-2
+        https://docs.alpaca.markets/docs/account-activities
+        https://docs.python.org/3/library/sqlite3.html
+
+	'''
+
+# standard libraries
+import os
+import json
+import time
+import pathlib
+import sqlite3
+import threading
+
+# non-standard libraries
+import pandas as pd
+import requests
+from rate_budget import RateBudget
+
+
+REPO_PATH = str(pathlib.Path(__file__).resolve().parent.parent)
+ACTIVITY_STORE_PATH = os.path.join(REPO_PATH, "data", "account_activities", "activities.sqlite")
+MAX_PAGE_SIZE = 100 # max "page_size" allowed by the account activities endpoint
+ACTIVITY_COLUMNS = {
+    # column -> sqlite type, every other field is only in "raw"
+    'id'               : 'TEXT PRIMARY KEY',
+    'activity_type'    : 'TEXT',
+    'date'             : 'TEXT', # YYYY-MM-DD (the date of the transaction_time for fills)
+    'transaction_time' : 'TEXT', # fills only
+    'symbol'           : 'TEXT',
+    'side'             : 'TEXT', # fills only
+    'type'             : 'TEXT', # fills only: 'fill' or 'partial_fill'
+    'qty'              : 'REAL',
+    'price'            : 'REAL', # fills only
+    'cum_qty'          : 'REAL', # fills only
+    'leaves_qty'       : 'REAL', # fills only
+    'order_id'         : 'TEXT', # fills only
+    'net_amount'       : 'REAL', # non trade activities only
+    'per_share_amount' : 'REAL', # non trade activities only
+    'description'      : 'TEXT', # non trade activities only
+    'status'           : 'TEXT', # non trade activities only
+    'raw'              : 'TEXT', # the whole activity as json
+}
+INDEXED_COLUMNS = [('activity_type', 'date'), ('symbol', 'date'), ('order_id',)]
+ALL_TYPES = 'ALL'
+
+def activity_to_row(activity):
+    # activity dictionary from the API -> tuple of the ACTIVITY_COLUMNS values
+    row = dict(activity)
+    if row.get('date') == None and row.get('transaction_time') != None:
+        row['date'] = row['transaction_time'][:10]
+    row['raw'] = json.dumps(activity)
+    return tuple(row.get(column) for column in ACTIVITY_COLUMNS)
+
+class ActivityStore:
+
+    def __init__(self, store_path=ACTIVITY_STORE_PATH):
+        # store_path - string - sqlite file, made (with its directory) if it doesn't exist
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        self.store_path = store_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(store_path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS activities (' + \
+                ', '.join(f'{column} {sql_type}' for column, sql_type in ACTIVITY_COLUMNS.items()) + ')')
+            for columns in INDEXED_COLUMNS:
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS activities_{"_".join(columns)} ON activities ({", ".join(columns)})')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS sync_state (activity_types TEXT PRIMARY KEY, high_water_mark TEXT, synced_at REAL)')
+
+    def upsert(self, activities, activity_types=None):
+        # insert / replace activities by id, and move the high water mark of activity_types to the newest 1
+        # (in 1 transaction, so the high water mark never gets ahead of the activities stored)
+        rows = [activity_to_row(activity) for activity in activities]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f'INSERT OR REPLACE INTO activities VALUES ({", ".join("?" * len(ACTIVITY_COLUMNS))})', rows)
+            if len(rows) > 0:
+                self.connection.execute(
+                    'INSERT INTO sync_state VALUES (?, ?, ?) ON CONFLICT(activity_types) DO UPDATE SET ' + \
+                    'high_water_mark = MAX(high_water_mark, excluded.high_water_mark), synced_at = excluded.synced_at',
+                    (self.sync_key(activity_types), max(row[0] for row in rows), time.time()))
+        return len(rows)
+
+    def sync_key(self, activity_types=None):
+        return ALL_TYPES if not activity_types else ','.join(sorted(activity_types))
+
+    def high_water_mark(self, activity_types=None):
+        # id of the newest activity synced for activity_types (None if they were never synced)
+        with self.lock:
+            row = self.connection.execute('SELECT high_water_mark FROM sync_state WHERE activity_types = ?',
+                (self.sync_key(activity_types),)).fetchone()
+        return None if row == None else row[0]
+
+    def query(self, activity_types=None, symbols=None, start=None, end=None, columns=None):
+
+        ''' query()
+            description:
+                activities from the store, oldest 1st
+            args:
+                activity_types - list of strings - ex: ['FEE', 'INT', 'PTC', 'PTR'] or ['FILL'] (defaults to every type)
+                symbols - list of strings - ticker symbols (defaults to every symbol)
+                start - string - YYYY-MM-DD, 1st date to include
+                end - string - YYYY-MM-DD, last date to include
+                columns - list of strings - columns of ACTIVITY_COLUMNS to return (defaults to every 1 but "raw")
+            returns:
+                pandas dataframe - 1 row per activity
+            '''
+        columns = columns or [column for column in ACTIVITY_COLUMNS if column != 'raw']
+        conditions, params = [], []
+        for column, values in (('activity_type', activity_types), ('symbol', symbols)):
+            if values:
+                conditions.append(f'{column} IN ({", ".join("?" * len(values))})')
+                params += list(values)
+        if start != None:
+            conditions.append('date >= ?')
+            params.append(str(start))
+        if end != None:
+            conditions.append('date <= ?')
+            params.append(str(end))
+        sql = f'SELECT {", ".join(columns)} FROM activities' + \
+            ('' if len(conditions) == 0 else f' WHERE {" AND ".join(conditions)}') + ' ORDER BY id'
+        with self.lock:
+            df = pd.read_sql_query(sql, self.connection, params=params)
+        for column in df.columns:
+            if ACTIVITY_COLUMNS[column] == 'REAL':
+                df[column] = df[column].astype(float) # None -> NaN, even when every value is None
+        return df
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM activities').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def iter_activity_pages(
+    endpoint,
+    headers,
+    activity_types=None,
+    after=None,
+    page_token=None,
+    page_size=MAX_PAGE_SIZE,
+    budget=None,
+    session=None):
+
+    ''' iter_activity_pages()
+        description:
+            yield every page of account activities, oldest 1st
+        args:
+            endpoint - string - trading API endpoint, ex: https://paper-api.alpaca.markets
+            headers - dictionary - API key headers
+            activity_types - list of strings - ex: ['FEE', 'INT', 'PTC', 'PTR'] (defaults to every type)
+            after - string - RFC-3339 time (with a timezone), only activities after it
+            page_token - string - id of the last activity already downloaded, only activities after it
+            page_size - int - activities per page (max 100)
+            budget - RateBudget - shared API rate limit (see rate_budget.py)
+            session - requests.Session - reused connection
+        yields:
+            list of dictionaries - 1 page of activities
+        '''
+    budget = budget if budget != None else RateBudget()
+    session = session if session != None else requests.Session()
+    params = {'direction' : 'asc', 'page_size' : page_size}
+    if activity_types:
+        params['activity_types'] = ','.join(activity_types)
+    if after != None:
+        params['after'] = after
+    while True:
+        page_params = dict(params)
+        if page_token != None:
+            page_params['page_token'] = page_token
+        response = budget.get(f'{endpoint}/v2/account/activities', session=session, headers=headers, params=page_params)
+        page = response.json()
+        if len(page) == 0:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        page_token = page[-1]['id']
+
+def sync_activities(
+    store,
+    endpoint,
+    headers,
+    activity_types=None,
+    after=None,
+    budget=None,
+    session=None,
+    activities=None,
+    verbose=False):
+
+    ''' sync_activities()
+        description:
+            download the activities newer than the store's high water mark into the store
+        args:
+            store - ActivityStore
+            endpoint - string - trading API endpoint, ex: https://paper-api.alpaca.markets
+            headers - dictionary - API key headers
+            activity_types - list of strings - ex: ['FEE', 'INT', 'PTC', 'PTR'] (defaults to every type)
+            after - string - RFC-3339 time (with a timezone) to start from on the 1st sync
+            budget - RateBudget - shared API rate limit (see rate_budget.py)
+            session - requests.Session - reused connection
+            activities - list - if given, the activities downloaded are appended to it
+        returns:
+            int - number of activities downloaded
+        '''
+    start_time = time.time()
+    high_water_mark = store.high_water_mark(activity_types)
+    num_activities, num_pages = 0, 0
+    for page in iter_activity_pages(endpoint, headers,
+        activity_types=activity_types,
+        after=after if high_water_mark == None else None,
+        page_token=high_water_mark,
+        budget=budget,
+        session=session):
+        num_activities += store.upsert(page, activity_types)
+        if activities != None:
+            activities.extend(page)
+        num_pages += 1
+    if verbose:
+        print(f'synced {num_activities} new activit{"y" if num_activities == 1 else "ies"} in {num_pages} page(s) ' + \
+            f'in {"%.2f" % (time.time() - start_time)} second(s), {store.count()} in the store')
+    return num_activities
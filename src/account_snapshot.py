@@ -0,0 +1,196 @@
+'''
+
+	Description:
+		the whole state of the account (account, positions, open orders, and optionally the newest activities)
+        fetched with all the requests in flight at once, instead of get_account(), get_all_positions(), get_orders(), ...
+        1 after another (see get_account_details.py and get_position_details.py), so it takes about 1 round trip, not 3 or 4
+
+        fetch_account_snapshot()
+            sends each request from its own thread under the shared rate budget. alpaca-py's clients keep a
+            requests.Session with a pool of connections to the API (and the activities use pooled_session()),
+            so once they're open (warm start) every request goes out on an open connection
+            and the snapshot takes the time of the slowest 1 request
+
+        AccountSnapshot
+            the responses, and when they were requested / received. REST has no "as of" for the whole account,
+            so a snapshot is consistent to within its window (received_at - requested_at): a fill in that window
+            can be in 1 response and not another. the order book (see order_book.py) and the P&L engine (see pnl_engine.py)
+            replay the trade updates received after requested_at on top of it, so nothing in the window is lost
+            when they're seeded from a snapshot
+
+        example:
+            snapshot = fetch_account_snapshot(trading_client, budget=budget)
+            order_book.start(snapshot), pnl_engine.start(snapshot), pre_trade_risk.start(snapshot)
+
+	Sources:
+        https://alpaca.markets/sdks/python/api_reference/trading/account.html
+        https://alpaca.markets/sdks/python/api_reference/trading/positions.html
+        https://alpaca.markets/sdks/python/api_reference/trading/orders.html
+        https://requests.readthedocs.io/en/latest/user/advanced/#transport-adapters
+
+	'''
+
+# standard libraries
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# non-standard libraries
+import requests
+from requests.adapters import HTTPAdapter
+from alpaca.trading.enums import QueryOrderStatus
+from rate_budget import RateBudget
+from order_book import get_all_orders
+from account_activities import iter_activity_pages, sync_activities
+
+
+POOL_SIZE = 16 # connections kept open per host
+
+def pooled_session(session=None, pool_size=POOL_SIZE):
+    # requests.Session (a new 1 if session is None) that keeps up to pool_size connections open per host,
+    # so that many threads sharing it don't each open (and then drop) their own connection
+    session = session if session != None else requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+class AccountSnapshot:
+
+    def __init__(self, account, positions, orders, activities, requested_at, received_at, latencies):
+        self.account = account # alpaca.trading.models.TradeAccount
+        self.positions = positions # list of alpaca.trading.models.Position
+        self.orders = orders # list of alpaca.trading.models.Order (None if the orders weren't requested)
+        self.activities = activities # list of activity dictionaries (None if the activities weren't requested)
+        self.requested_at = requested_at # epoch seconds the 1st request was sent
+        self.received_at = received_at # epoch seconds the last response came back
+        self.latencies = latencies # request name -> seconds
+
+    @property
+    def window(self):
+        # seconds the state can be inconsistent over
+        return self.received_at - self.requested_at
+
+    def age(self):
+        return time.time() - self.requested_at
+
+    def positions_by_symbol(self):
+        return {position.symbol : position for position in self.positions}
+
+    def open_orders(self, symbol=None):
+        return [order for order in (self.orders or []) if symbol == None or order.symbol == symbol]
+
+    def summary(self):
+        # dictionary of the main fields, for printing / logging
+        return {
+            'equity'         : float(self.account.equity or 0.0),
+            'cash'           : float(self.account.cash or 0.0),
+            'buying_power'   : float(self.account.buying_power or 0.0),
+            'num_positions'  : len(self.positions),
+            'num_orders'     : None if self.orders == None else len(self.orders),
+            'num_activities' : None if self.activities == None else len(self.activities),
+            'requested_at'   : self.requested_at,
+            'window'         : self.window,
+            'latencies'      : dict(self.latencies),
+        }
+
+def fetch_account_snapshot(
+    trading_client,
+    budget=None,
+    orders=True,
+    order_status=QueryOrderStatus.OPEN,
+    endpoint=None,
+    headers=None,
+    activity_types=None,
+    activities_after=None,
+    activity_store=None,
+    session=None):
+
+    ''' fetch_account_snapshot()
+        description:
+            get the account, positions, orders, and activities all at once
+        args:
+            trading_client - alpaca.trading.client.TradingClient (or simulated_broker.SimulatedBroker)
+            budget - RateBudget - shared API rate limit (see rate_budget.py)
+            orders - bool - False to skip get_orders()
+            order_status - QueryOrderStatus - status of the orders to get
+            endpoint - string - trading API endpoint, ex: https://paper-api.alpaca.markets
+                       (the activities are only requested if endpoint and headers are given,
+                       alpaca-py has no activities request)
+            headers - dictionary - API key headers
+            activity_types - list of strings - ex: ['FILL'] (defaults to every type)
+            activities_after - string - RFC-3339 time (with a timezone), only activities after it
+            activity_store - ActivityStore - if given the activities are synced into it (see account_activities.py)
+                             and only the new ones are in the snapshot
+            session - requests.Session - for the activities, a pooled 1 is made if None
+        returns:
+            AccountSnapshot
+        '''
+    budget = budget if budget != None else RateBudget()
+    requests_to_send = {
+        'account'   : lambda : budget.call(trading_client.get_account),
+        'positions' : lambda : budget.call(trading_client.get_all_positions),
+    }
+    if orders:
+        # more than 500 orders take more than 1 request, see order_book.get_all_orders()
+        requests_to_send['orders'] = lambda : get_all_orders(trading_client, budget, status=order_status)
+    if endpoint != None and headers != None:
+        session = session if session != None else pooled_session()
+        def get_activities():
+            if activity_store != None:
+                new_activities = []
+                sync_activities(activity_store, endpoint, headers,
+                    activity_types=activity_types,
+                    after=activities_after,
+                    budget=budget,
+                    session=session,
+                    activities=new_activities)
+                return new_activities
+            return [activity for page in iter_activity_pages(endpoint, headers,
+                activity_types=activity_types,
+                after=activities_after,
+                budget=budget,
+                session=session) for activity in page]
+        requests_to_send['activities'] = get_activities
+
+    def send(name):
+        sent_at = time.time()
+        response = requests_to_send[name]()
+        return response, time.time() - sent_at
+    requested_at = time.time()
+    with ThreadPoolExecutor(max_workers=len(requests_to_send)) as executor:
+        futures = {name : executor.submit(send, name) for name in requests_to_send}
+        results = {name : future.result() for name, future in futures.items()} # raises the 1st error
+    received_at = time.time()
+    return AccountSnapshot(
+        account=results['account'][0],
+        positions=results['positions'][0],
+        orders=results['orders'][0] if 'orders' in results else None,
+        activities=results['activities'][0] if 'activities' in results else None,
+        requested_at=requested_at,
+        received_at=received_at,
+        latencies={name : latency for name, (response, latency) in results.items()})
+
+
+
+if __name__ == '__main__':
+
+    # sequential vs concurrent on a simulated broker with 30 milliseconds of latency per request
+    from simulated_broker import SimulatedBroker
+    class SlowBroker(SimulatedBroker):
+        def get_account(self):
+            time.sleep(0.03)
+            return super().get_account()
+        def get_all_positions(self):
+            time.sleep(0.03)
+            return super().get_all_positions()
+        def get_orders(self, filter=None):
+            time.sleep(0.03)
+            return super().get_orders(filter)
+    broker = SlowBroker()
+    budget = RateBudget(calls_per_minute=1e9)
+    start_time = time.time()
+    broker.get_account(), broker.get_all_positions(), broker.get_orders()
+    print(f'sequential: {"%.1f" % (1e3 * (time.time() - start_time))} milliseconds')
+    snapshot = fetch_account_snapshot(broker, budget=budget)
+    print(f'snapshot:   {"%.1f" % (1e3 * snapshot.window)} milliseconds')
+    print(snapshot.summary())
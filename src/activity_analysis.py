@@ -0,0 +1,212 @@
+'''
+
+	Description:
+		margin cost and realized P&L of the account, computed from the local activity store (see account_activities.py)
+        with numpy, in 1 pass over typed arrays instead of a python loop over the activity dictionaries
+
+        load_activity_columns()
+            activities from the store -> dictionary of numpy arrays (see ACTIVITY_DTYPES), 1 element per activity
+        fees_by_period()
+            sum of net_amount per day / month (rows) and activity type (columns), ex: of FEE, INT, PTC, PTR,
+            with 1 np.bincount over the (period, type) pair of each activity
+        borrow_cost_by_symbol()
+            total borrow cost (pass thru charges - rebates, and fees) of each symbol, with 1 np.bincount
+        realized_pnl()
+            FIFO realized P&L of every fill. the k-th share bought of a symbol is always matched with its k-th share
+            sold, so the cost of the 1st m shares bought is np.interp(m, cumulative qty bought, cumulative cost),
+            and the realized P&L up to a fill is
+                proceeds of the 1st m shares sold - cost of the 1st m shares bought, m = min(qty bought, qty sold) so far
+            which works for long and short positions, and is 1 np.interp per side for every symbol at once
+
+	Sources:
+        https://docs.alpaca.markets/docs/account-activities
+        https://numpy.org/doc/stable/reference/generated/numpy.bincount.html
+        https://numpy.org/doc/stable/reference/generated/numpy.interp.html
+
+	'''
+
+# standard libraries
+import time
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from account_activities import ActivityStore
+
+
+FEE_TYPES = ['FEE', 'INT', 'PTC', 'PTR']
+BORROW_TYPES = ['FEE', 'PTC', 'PTR'] # per symbol margin / short selling costs (PTR rebates are positive)
+ACTIVITY_DTYPES = {
+    'activity_type' : 'U8',
+    'symbol'        : object, # '' if the activity isn't of a symbol
+    'date'          : 'datetime64[D]',
+    'time'          : 'datetime64[ns]', # UTC transaction_time of fills, midnight of the date for other activities
+    'net_amount'    : np.float64, # non trade activities, NaN for fills
+    'qty'           : np.float64,
+    'price'         : np.float64, # fills, NaN for other activities
+    'side'          : np.int8, # fills: 1 buy, -1 sell / sell_short, 0 for other activities
+}
+
+def load_activity_columns(store, activity_types=None, start=None, end=None):
+
+    ''' load_activity_columns()
+        description:
+            activities from the store as typed numpy arrays, oldest 1st
+        args:
+            store - ActivityStore - see account_activities.py
+            activity_types - list of strings - ex: FEE_TYPES or ['FILL'] (defaults to every type)
+            start - string - YYYY-MM-DD, 1st date to include
+            end - string - YYYY-MM-DD, last date to include
+        returns:
+            dictionary - column -> numpy array with the dtype in ACTIVITY_DTYPES
+        '''
+    df = store.query(activity_types=activity_types, start=start, end=end,
+        columns=['activity_type', 'symbol', 'date', 'transaction_time', 'net_amount', 'qty', 'price', 'side'])
+    times = pd.to_datetime(df['transaction_time'].fillna(df['date']), utc=True, format='mixed')
+    side = df['side'].to_numpy(dtype=object)
+    return {
+        'activity_type' : df['activity_type'].to_numpy(dtype=ACTIVITY_DTYPES['activity_type']),
+        'symbol'        : df['symbol'].fillna('').to_numpy(dtype=object),
+        'date'          : df['date'].to_numpy(dtype='datetime64[D]'),
+        'time'          : times.dt.tz_convert(None).to_numpy(dtype='datetime64[ns]'),
+        'net_amount'    : df['net_amount'].to_numpy(dtype=np.float64),
+        'qty'           : df['qty'].to_numpy(dtype=np.float64),
+        'price'         : df['price'].to_numpy(dtype=np.float64),
+        'side'          : np.where(side == 'buy', 1, np.where(pd.isna(side), 0, -1)).astype(np.int8),
+    }
+
+def select(columns, mask):
+    # rows of a column dictionary where mask is True
+    return {column : values[mask] for column, values in columns.items()}
+
+def fees_by_period(columns, freq='M', activity_types=FEE_TYPES):
+
+    ''' fees_by_period()
+        description:
+            sum of net_amount of each activity type per period (negative = paid)
+        args:
+            columns - dictionary - from load_activity_columns()
+            freq - string - 'D' (daily), 'W' (weekly), 'M' (monthly), or 'Y' (yearly)
+            activity_types - list of strings - types to sum
+        returns:
+            pandas dataframe - 1 row per period with activities, 1 column per activity type, and a 'total' column
+        '''
+    columns = select(columns, np.isin(columns['activity_type'], activity_types))
+    periods = columns['date'].astype(f'datetime64[{freq}]')
+    unique_periods, period_index = np.unique(periods, return_inverse=True)
+    unique_types, type_index = np.unique(columns['activity_type'], return_inverse=True)
+    sums = np.bincount(
+        period_index * len(unique_types) + type_index,
+        weights=np.nan_to_num(columns['net_amount']),
+        minlength=len(unique_periods) * len(unique_types)).reshape(len(unique_periods), len(unique_types))
+    df = pd.DataFrame(sums, index=pd.Index(unique_periods, name='period'), columns=unique_types)
+    df['total'] = sums.sum(axis=1)
+    return df
+
+def borrow_cost_by_symbol(columns, activity_types=BORROW_TYPES):
+
+    ''' borrow_cost_by_symbol()
+        description:
+            cost of each symbol's borrow / margin related activities (positive = paid)
+        args:
+            columns - dictionary - from load_activity_columns()
+            activity_types - list of strings - types counted as borrow costs
+        returns:
+            pandas dataframe - 1 row per symbol: cost, num_activities, first_date, last_date, sorted by cost
+        '''
+    columns = select(columns, np.isin(columns['activity_type'], activity_types) & (columns['symbol'] != ''))
+    symbols, symbol_index = np.unique(columns['symbol'].astype(str), return_inverse=True)
+    costs = -np.bincount(symbol_index, weights=np.nan_to_num(columns['net_amount']), minlength=len(symbols))
+    num_activities = np.bincount(symbol_index, minlength=len(symbols))
+    dates = columns['date'].astype(np.int64)
+    first_dates = np.full(len(symbols), np.iinfo(np.int64).max)
+    last_dates = np.full(len(symbols), np.iinfo(np.int64).min)
+    np.minimum.at(first_dates, symbol_index, dates)
+    np.maximum.at(last_dates, symbol_index, dates)
+    return pd.DataFrame({
+        'cost'           : costs,
+        'num_activities' : num_activities,
+        'first_date'     : first_dates.astype('datetime64[D]'),
+        'last_date'      : last_dates.astype('datetime64[D]'),
+    }, index=pd.Index(symbols, name='symbol')).sort_values(by='cost', ascending=False)
+
+def cost_of_first(qty, group_index, group_sides, sides_qty, sides_value):
+    # value of the 1st qty shares traded on 1 side (buys or sells) of each symbol, by FIFO
+    # sides_qty / sides_value - qty and qty * price of the fills of that side, sorted by symbol then time
+    # group_sides - boolean array of which fills are on that side
+    cumulative_qty = np.concatenate([[0.0], np.cumsum(sides_qty)])
+    cumulative_value = np.concatenate([[0.0], np.cumsum(sides_value)])
+    # qty traded on this side before each symbol's 1st fill, so the symbols can share 1 interp
+    num_groups = group_index.max() + 1 if len(group_index) > 0 else 0
+    group_start = np.zeros(num_groups)
+    np.add.at(group_start, group_index[group_sides], sides_qty)
+    group_start = np.concatenate([[0.0], np.cumsum(group_start)[:-1]])
+    value_at_start = np.interp(group_start, cumulative_qty, cumulative_value)
+    return np.interp(group_start[group_index] + qty, cumulative_qty, cumulative_value) - value_at_start[group_index]
+
+def realized_pnl(columns):
+
+    ''' realized_pnl()
+        description:
+            FIFO realized P&L of every fill and of every symbol (see the description at the top of this file)
+        args:
+            columns - dictionary - from load_activity_columns() (only the FILL activities are used)
+        returns:
+            tuple of:
+                fills - pandas dataframe - 1 row per fill sorted by symbol then time: symbol, time, side, qty, price,
+                        position (qty held after the fill), realized_pnl (of the fill)
+                by_symbol - pandas dataframe - 1 row per symbol: realized_pnl, bought_qty, sold_qty, position
+        '''
+    columns = select(columns, columns['activity_type'] == 'FILL')
+    symbols, group_index = np.unique(columns['symbol'].astype(str), return_inverse=True)
+    order = np.lexsort((columns['time'], group_index))
+    group_index = group_index[order]
+    side, qty, price = columns['side'][order], columns['qty'][order], columns['price'][order]
+    buys, sells = side > 0, side < 0
+
+    # cumulative qty bought / sold of each symbol after each fill (cumsum minus the total of the symbols before it)
+    def cumulative_by_group(values):
+        cumulative = np.cumsum(values)
+        group_totals = np.bincount(group_index, weights=values, minlength=len(symbols))
+        return cumulative - np.concatenate([[0.0], np.cumsum(group_totals)[:-1]])[group_index]
+    bought = cumulative_by_group(np.where(buys, qty, 0.0))
+    sold = cumulative_by_group(np.where(sells, qty, 0.0))
+
+    matched = np.minimum(bought, sold)
+    cumulative_pnl = cost_of_first(matched, group_index, sells, qty[sells], qty[sells] * price[sells]) - \
+        cost_of_first(matched, group_index, buys, qty[buys], qty[buys] * price[buys])
+    # per fill P&L is the change of the cumulative P&L of its symbol
+    previous = np.concatenate([[0.0], cumulative_pnl[:-1]])
+    first_of_group = np.concatenate([[True], group_index[1:] != group_index[:-1]])
+    fill_pnl = cumulative_pnl - np.where(first_of_group, 0.0, previous)
+
+    fills = pd.DataFrame({
+        'symbol'       : symbols[group_index],
+        'time'         : columns['time'][order],
+        'side'         : np.where(buys, 'buy', 'sell'),
+        'qty'          : qty,
+        'price'        : price,
+        'position'     : bought - sold,
+        'realized_pnl' : fill_pnl,
+    })
+    by_symbol = pd.DataFrame({
+        'realized_pnl' : np.bincount(group_index, weights=fill_pnl, minlength=len(symbols)),
+        'bought_qty'   : np.bincount(group_index, weights=np.where(buys, qty, 0.0), minlength=len(symbols)),
+        'sold_qty'     : np.bincount(group_index, weights=np.where(sells, qty, 0.0), minlength=len(symbols)),
+    }, index=pd.Index(symbols, name='symbol'))
+    by_symbol['position'] = by_symbol['bought_qty'] - by_symbol['sold_qty']
+    return fills, by_symbol
+
+
+
+if __name__ == '__main__':
+
+    # margin costs and realized P&L of everything synced by get_account_activity.py
+    start_time = time.time()
+    store = ActivityStore()
+    columns = load_activity_columns(store)
+    print(f'loaded {len(columns["date"])} activities in {"%.2f" % (time.time() - start_time)} second(s)')
+    print(f'\nmonthly fees and interest:\n{fees_by_period(columns, freq="M")}')
+    print(f'\nborrow cost by symbol:\n{borrow_cost_by_symbol(columns)}')
+    fills, by_symbol = realized_pnl(columns)
+    print(f'\nrealized P&L by symbol:\n{by_symbol}')
@@ -0,0 +1,179 @@
+'''
+
+	Description:
+		on disk cache of the list of assets on Alpaca, so scripts that need a few assets
+        (or all ~31,000 of them) don't each download the whole list or query 1 asset at a time
+
+        the list is downloaded with 1 get_all_assets() call, loaded into a pandas dataframe
+        (see asset_filter.assets_to_frame) and saved to data/asset_cache/:
+            assets.csv - 1 row per asset with the columns of asset_filter.ASSET_COLUMNS
+            meta.json  - when the list was downloaded and the search params used
+        it's only downloaded again once it's older than the cache's ttl (time to live)
+
+        lookups go through 2 dictionaries built when the list is loaded:
+            symbol   -> row
+            asset id -> row
+        so getting N assets is N dictionary lookups and 1 dataframe take, not N API calls
+
+        example:
+            asset_cache = AssetCache(trading_client)
+            asset_cache.get('AAPL')['shortable']                 # 1 asset  -> dictionary
+            asset_cache.get_many(['AAPL', 'JNJ', 'CVX'])          # N assets -> dataframe
+            asset_cache.frame()                                  # every asset, see asset_filter.py to filter it
+
+	Sources:
+        https://docs.alpaca.markets/reference/get-v2-assets-1
+        https://alpaca.markets/sdks/python/api_reference/trading/assets.html#get-all-assets
+
+	'''
+
+# standard libraries
+import os
+import json
+import time
+import threading
+import pathlib
+REPO_PATH = str(pathlib.Path(__file__).resolve().parent.parent)
+ASSET_CACHE_PATH = os.path.join(REPO_PATH, "data", "asset_cache")
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from alpaca.trading.requests import GetAssetsRequest
+from alpaca.trading.enums import AssetClass
+from asset_filter import assets_to_frame, ASSET_COLUMNS, FLAG_COLUMNS
+from rate_budget import RateBudget
+
+
+DEFAULT_TTL = 24 * 60 * 60 # seconds, asset flags (shortable, easy_to_borrow, ...) change at most about daily
+
+class AssetCache:
+
+    def __init__(
+        self,
+        trading_client,
+        cache_path=ASSET_CACHE_PATH,
+        ttl=DEFAULT_TTL,
+        asset_class=AssetClass.US_EQUITY,
+        budget=None):
+
+        ''' AssetCache()
+            args:
+                trading_client - alpaca.trading.client.TradingClient - used to download the list of assets
+                cache_path - string - directory to save the list to
+                ttl - float - seconds before the saved list is downloaded again
+                asset_class - AssetClass - class of assets to cache (None for every class)
+                budget - RateBudget - shared API rate limit (see rate_budget.py)
+            '''
+        self.trading_client = trading_client
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.asset_class = asset_class
+        self.budget = budget if budget != None else RateBudget()
+        self.assets_filepath = os.path.join(cache_path, 'assets.csv')
+        self.meta_filepath = os.path.join(cache_path, 'meta.json')
+        self.lock = threading.Lock()
+        self.num_downloads = 0
+        self.df = None
+        self.downloaded_at = 0.0 # epoch seconds
+        self.row_by_symbol = {}
+        self.row_by_id = {}
+        self.load()
+
+    def search_params(self):
+        # what the saved list was downloaded with, a saved list with other params is ignored
+        return {'asset_class' : None if self.asset_class == None else getattr(self.asset_class, 'value', self.asset_class)}
+
+    def load(self):
+        if not (os.path.exists(self.assets_filepath) and os.path.exists(self.meta_filepath)):
+            return
+        with open(self.meta_filepath) as f:
+            meta = json.load(f)
+        if meta.get('search_params') != self.search_params():
+            return
+        df = pd.read_csv(self.assets_filepath, dtype={column : str for column in ASSET_COLUMNS if column not in FLAG_COLUMNS})
+        for column in FLAG_COLUMNS:
+            df[column] = df[column].eq(True)
+        self.set_frame(df, meta['downloaded_at'])
+
+    def save(self):
+        # temp files then rename, so a crash can't leave half a list
+        os.makedirs(self.cache_path, exist_ok=True)
+        self.df.to_csv(self.assets_filepath + '.tmp', index=False)
+        os.replace(self.assets_filepath + '.tmp', self.assets_filepath)
+        with open(self.meta_filepath + '.tmp', 'w') as f:
+            json.dump({'downloaded_at' : self.downloaded_at, 'search_params' : self.search_params()}, f)
+        os.replace(self.meta_filepath + '.tmp', self.meta_filepath)
+
+    def set_frame(self, df, downloaded_at):
+        df = df.reset_index(drop=True)
+        self.row_by_symbol = dict(zip(df['symbol'], range(len(df))))
+        self.row_by_id = dict(zip(df['id'], range(len(df))))
+        self.df = df
+        self.downloaded_at = downloaded_at
+
+    def age(self):
+        # seconds since the list was downloaded (inf if it never was)
+        return np.inf if self.df is None else time.time() - self.downloaded_at
+
+    def is_stale(self):
+        return self.age() > self.ttl
+
+    def download(self):
+        search_params = GetAssetsRequest(asset_class=self.asset_class) if self.asset_class != None else None
+        return self.budget.call(self.trading_client.get_all_assets, search_params)
+
+    def refresh(self, force=False, verbose=False):
+        # download the list again if it's older than the ttl (or force is True)
+        # returns True if it was downloaded
+        with self.lock:
+            if not force and not self.is_stale():
+                return False
+            start_time = time.time()
+            assets = self.download()
+            self.num_downloads += 1
+            self.set_frame(assets_to_frame(assets), time.time())
+            self.save()
+        if verbose:
+            print(f'downloaded {len(self.df)} asset(s) in {"%.1f" % (time.time() - start_time)} second(s)')
+        return True
+
+    def frame(self):
+        # every cached asset as a pandas dataframe (1 row per asset)
+        self.refresh()
+        return self.df
+
+    def snapshot(self):
+        # (frame, symbol -> row, asset id -> row) of the same version of the list, refreshed 1st if it's stale,
+        # so row numbers looked up in it can't index a newer frame downloaded in between
+        self.refresh()
+        with self.lock:
+            return self.df, self.row_by_symbol, self.row_by_id
+
+    def rows(self, symbols_or_ids, snapshot=None):
+        # list of symbols and/or asset ids -> row numbers of the ones that are cached (in the frame of snapshot if given)
+        _, row_by_symbol, row_by_id = snapshot if snapshot != None else self.snapshot()
+        rows = []
+        for key in symbols_or_ids:
+            row = row_by_symbol.get(key)
+            if row == None:
+                row = row_by_id.get(str(key))
+            if row != None:
+                rows.append(row)
+        return rows
+
+    def get(self, symbol_or_id):
+        # 1 asset as a dictionary (see asset_filter.ASSET_COLUMNS), or None if it's not on Alpaca
+        snapshot = self.snapshot()
+        rows = self.rows([symbol_or_id], snapshot)
+        if len(rows) == 0:
+            return None
+        return snapshot[0].iloc[rows[0]].to_dict()
+
+    def get_many(self, symbols_or_ids):
+        # many assets as a pandas dataframe, in the order requested, assets not on Alpaca are left out
+        snapshot = self.snapshot()
+        return snapshot[0].iloc[self.rows(symbols_or_ids, snapshot)].reset_index(drop=True)
+
+    def symbols(self):
+        return self.frame()['symbol'].tolist()
@@ -0,0 +1,130 @@
+'''
+
+	Description:
+		declarative filters for the list of assets on Alpaca
+
+        the asset list is loaded once into a pandas dataframe (1 column per asset field)
+        and filters are built by combining predicates with & (and), | (or), and ~ (not),
+        each predicate is evaluated on whole columns at once and returns a boolean mask,
+        so filtering all ~31,000 assets takes milliseconds instead of a python loop over every asset
+
+        example:
+            universe = assets_to_frame(trading_client.get_all_assets(search_params))
+            shortable_stocks = filter_assets(universe,
+                US_EQUITY & ACTIVE & TRADABLE & MARGINABLE & SHORTABLE & ~symbol_in(sp500_tickers))
+
+        price / volume thresholds use columns joined on from another table, ex:
+            universe = join_metrics(universe, screen_stocks(...)) # see screen_stocks.py
+            liquid_stocks = filter_assets(universe, SHORTABLE & between('average_dollar_volume', min_value=1e6))
+
+	Sources:
+        https://docs.alpaca.markets/reference/get-v2-assets-1
+        https://alpaca.markets/sdks/python/api_reference/trading/models.html#alpaca.trading.models.Asset
+
+	'''
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+
+
+ASSET_COLUMNS = [
+    'id',
+    'symbol',
+    'name',
+    'asset_class',
+    'exchange',
+    'status',
+    'tradable',
+    'marginable',
+    'shortable',
+    'easy_to_borrow',
+    'fractionable',
+]
+FLAG_COLUMNS = ['tradable', 'marginable', 'shortable', 'easy_to_borrow', 'fractionable']
+
+def asset_field(asset, field):
+    # works for alpaca-py Asset models, alpaca_trade_api Asset entities, and dictionaries from the REST API
+    if isinstance(asset, dict):
+        value = asset.get('class' if field == 'asset_class' else field)
+    else:
+        value = getattr(asset, field, None)
+    if hasattr(value, 'value'): # enums, ex: AssetClass.US_EQUITY -> 'us_equity'
+        value = value.value
+    return value
+
+def assets_to_frame(assets):
+    # list of assets -> pandas dataframe with ASSET_COLUMNS, 1 row per asset
+    df = pd.DataFrame({field : [asset_field(asset, field) for asset in assets] for field in ASSET_COLUMNS})
+    df['id'] = df['id'].astype(str)
+    for column in FLAG_COLUMNS:
+        df[column] = df[column].eq(True) # None -> False
+    return df
+
+class Predicate:
+
+    def __init__(self, evaluate, description):
+        self.evaluate = evaluate # function: dataframe -> numpy boolean array
+        self.description = description
+
+    def __call__(self, df):
+        return np.asarray(self.evaluate(df), dtype=bool)
+
+    def __and__(self, other):
+        return Predicate(lambda df : self(df) & other(df), f'({self.description} & {other.description})')
+
+    def __or__(self, other):
+        return Predicate(lambda df : self(df) | other(df), f'({self.description} | {other.description})')
+
+    def __invert__(self):
+        return Predicate(lambda df : ~self(df), f'~{self.description}')
+
+    def __repr__(self):
+        return f'Predicate({self.description})'
+
+def flag(column):
+    return Predicate(lambda df : df[column].to_numpy(dtype=bool), column)
+
+def equals(column, value):
+    return Predicate(lambda df : (df[column] == value).to_numpy(), f'{column} == {value!r}')
+
+def isin(column, values):
+    # hash lookup per row instead of scanning a list per row
+    values = set(values)
+    return Predicate(lambda df : df[column].isin(values).to_numpy(), f'{column} in {len(values)} value(s)')
+
+def between(column, min_value=None, max_value=None):
+    # inclusive, rows with NaN in column never pass
+    def evaluate(df):
+        values = df[column].to_numpy(dtype=np.float64)
+        mask = ~np.isnan(values)
+        if min_value != None:
+            mask &= values >= min_value
+        if max_value != None:
+            mask &= values <= max_value
+        return mask
+    return Predicate(evaluate, f'{min_value} <= {column} <= {max_value}')
+
+def exchange_in(*exchanges):
+    return isin('exchange', exchanges)
+
+def symbol_in(symbols):
+    # ex: index membership, symbol_in(sp500_tickers)
+    return isin('symbol', symbols)
+
+TRADABLE = flag('tradable')
+MARGINABLE = flag('marginable')
+SHORTABLE = flag('shortable')
+EASY_TO_BORROW = flag('easy_to_borrow')
+FRACTIONABLE = flag('fractionable')
+ACTIVE = equals('status', 'active')
+US_EQUITY = equals('asset_class', 'us_equity')
+
+def join_metrics(df, metrics, on='symbol', metrics_on='ticker'):
+    # add columns of another table (ex: the output of screen_stocks.py) to the assets so they can be filtered on
+    metrics = metrics.rename(columns={metrics_on : on}) if metrics_on != on else metrics
+    return df.merge(metrics, on=on, how='left')
+
+def filter_assets(df, predicate):
+    # rows of df that pass predicate
+    return df[predicate(df)]
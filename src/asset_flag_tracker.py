@@ -0,0 +1,203 @@
+'''
+
+	Description:
+		tracks which assets flipped shortable, easy_to_borrow, etc. between refreshes of the asset list
+        (instead of rerunning get_all_stocks.py and diffing the csv files by hand)
+
+        each refresh takes a snapshot of the flags of every asset in the asset cache (see asset_cache.py):
+            symbols - sorted numpy array of ticker symbols
+            flags   - numpy uint8 array, 1 bit per flag of TRACKED_FLAGS
+        so a snapshot of ~31,000 assets is a few hundred KB. snapshots are saved to
+        data/asset_flags/<version>.npz (only when something changed, the newest MAX_SNAPSHOTS are kept)
+        and versions.json lists every saved version and when it was taken
+
+        the new snapshot is compared to the last one all at once with numpy (align the symbols on their union
+        with np.union1d and np.isin, then xor the bitmasks), and only the assets that changed are published to
+        subscribers and appended to changes.csv. the columns of the changes are:
+            symbol
+            change          - 'added', 'removed', or 'changed'
+            <flag>_before   - for each flag of TRACKED_FLAGS (False for added assets)
+            <flag>_after    - for each flag of TRACKED_FLAGS (False for removed assets)
+            version         - version of the new snapshot
+
+        example:
+            tracker = AssetFlagTracker()
+            tracker.subscribe(lambda changes : print(flipped(changes, 'shortable', False)['symbol'].tolist()))
+            tracker.refresh(AssetCache(trading_client))
+
+	'''
+
+# standard libraries
+import os
+import json
+import time
+import threading
+import pathlib
+REPO_PATH = str(pathlib.Path(__file__).resolve().parent.parent)
+TRACKER_PATH = os.path.join(REPO_PATH, "data", "asset_flags")
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+
+
+TRACKED_FLAGS = ['active', 'tradable', 'marginable', 'shortable', 'easy_to_borrow', 'fractionable']
+MAX_SNAPSHOTS = 30
+
+def pack_flags(df):
+    # dataframe of assets (see asset_filter.assets_to_frame) -> (sorted symbols, uint8 bitmask of each)
+    df = df.sort_values(by='symbol', kind='stable').drop_duplicates(subset='symbol', keep='last')
+    flags = np.zeros(len(df), dtype=np.uint8)
+    for bit, flag in enumerate(TRACKED_FLAGS):
+        values = (df['status'] == 'active').to_numpy() if flag == 'active' else df[flag].to_numpy(dtype=bool)
+        flags |= values.astype(np.uint8) << bit
+    return df['symbol'].to_numpy(dtype=str), flags
+
+def unpack_flag(flags, flag):
+    return ((flags >> TRACKED_FLAGS.index(flag)) & 1).astype(bool)
+
+def diff_snapshots(old_symbols, old_flags, new_symbols, new_flags):
+
+    ''' diff_snapshots()
+        description:
+            assets that were added, removed, or had a flag change between 2 snapshots
+        args:
+            old_symbols, new_symbols - numpy arrays of strings - sorted ticker symbols
+            old_flags, new_flags - numpy uint8 arrays - bitmask of TRACKED_FLAGS of each symbol
+        returns:
+            pandas dataframe - 1 row per changed asset (see the description at the top of this file)
+        '''
+    symbols = np.union1d(old_symbols, new_symbols)
+    before = np.zeros(len(symbols), dtype=np.uint8)
+    after = np.zeros(len(symbols), dtype=np.uint8)
+    in_old = np.isin(symbols, old_symbols, assume_unique=True)
+    in_new = np.isin(symbols, new_symbols, assume_unique=True)
+    before[in_old] = old_flags
+    after[in_new] = new_flags
+    changed = (in_old != in_new) | ((before ^ after) != 0)
+    change = np.where(~in_old[changed], 'added', np.where(~in_new[changed], 'removed', 'changed'))
+    changes = {'symbol' : symbols[changed], 'change' : change}
+    for flag in TRACKED_FLAGS:
+        changes[f'{flag}_before'] = unpack_flag(before[changed], flag)
+        changes[f'{flag}_after'] = unpack_flag(after[changed], flag)
+    return pd.DataFrame(changes)
+
+def flipped(changes, flag, to=None):
+    # changes where flag went from not to (True or False), or either way if to is None
+    mask = changes[f'{flag}_before'] != changes[f'{flag}_after']
+    if to != None:
+        mask &= changes[f'{flag}_after'] == to
+    return changes[mask]
+
+class AssetFlagTracker:
+
+    def __init__(self, tracker_path=TRACKER_PATH, max_snapshots=MAX_SNAPSHOTS):
+        self.tracker_path = tracker_path
+        self.max_snapshots = max_snapshots
+        self.versions_filepath = os.path.join(tracker_path, 'versions.json')
+        self.changes_filepath = os.path.join(tracker_path, 'changes.csv')
+        self.lock = threading.Lock()
+        self.subscribers = []
+        if os.path.exists(self.versions_filepath):
+            with open(self.versions_filepath) as f:
+                self.versions = json.load(f)
+        else:
+            self.versions = [] # [{'version' : int, 'taken_at' : epoch seconds, 'num_assets' : int}, ...] oldest first
+        self.symbols, self.flags = self.load_snapshot(self.versions[-1]['version']) \
+            if len(self.versions) > 0 else (None, None)
+
+    def snapshot_filepath(self, version):
+        return os.path.join(self.tracker_path, f'{version}.npz')
+
+    def load_snapshot(self, version):
+        # returns (symbols, flags) of a saved version
+        with np.load(self.snapshot_filepath(version)) as snapshot:
+            return snapshot['symbols'], snapshot['flags']
+
+    def save_snapshot(self, symbols, flags):
+        # caller must hold self.lock, returns the new version
+        os.makedirs(self.tracker_path, exist_ok=True)
+        version = self.versions[-1]['version'] + 1 if len(self.versions) > 0 else 0
+        with open(self.snapshot_filepath(version) + '.tmp', 'wb') as f:
+            np.savez_compressed(f, symbols=symbols, flags=flags)
+        os.replace(self.snapshot_filepath(version) + '.tmp', self.snapshot_filepath(version))
+        self.versions.append({'version' : version, 'taken_at' : time.time(), 'num_assets' : len(symbols)})
+        for old in self.versions[:-self.max_snapshots]:
+            if os.path.exists(self.snapshot_filepath(old['version'])):
+                os.remove(self.snapshot_filepath(old['version']))
+        self.versions = self.versions[-self.max_snapshots:]
+        with open(self.versions_filepath + '.tmp', 'w') as f:
+            json.dump(self.versions, f)
+        os.replace(self.versions_filepath + '.tmp', self.versions_filepath)
+        return version
+
+    def subscribe(self, callback):
+        # callback(changes) is called with the dataframe of changed assets after each refresh that has any
+        self.subscribers.append(callback)
+
+    def update(self, df):
+
+        ''' update()
+            description:
+                snapshot the flags of the assets in df, and publish the ones that changed since the last snapshot
+            args:
+                df - pandas dataframe - assets with the columns of asset_filter.ASSET_COLUMNS
+            returns:
+                pandas dataframe - the changed assets (empty if nothing changed)
+            '''
+        symbols, flags = pack_flags(df)
+        with self.lock:
+            if self.symbols is None:
+                # 1st snapshot, nothing to compare to
+                self.save_snapshot(symbols, flags)
+                self.symbols, self.flags = symbols, flags
+                return diff_snapshots(symbols, flags, symbols, flags)
+            changes = diff_snapshots(self.symbols, self.flags, symbols, flags)
+            if len(changes) == 0:
+                return changes
+            changes['version'] = self.save_snapshot(symbols, flags)
+            self.symbols, self.flags = symbols, flags
+            changes.to_csv(self.changes_filepath, mode='a', index=False,
+                header=not os.path.exists(self.changes_filepath))
+        for callback in self.subscribers:
+            callback(changes)
+        return changes
+
+    def refresh(self, asset_cache, verbose=False):
+        # download the list of assets again (see asset_cache.py) and update() with it
+        asset_cache.refresh(force=True)
+        changes = self.update(asset_cache.frame())
+        if verbose:
+            print(f'{len(changes)} asset(s) changed since the last snapshot')
+            for flag in ('shortable', 'easy_to_borrow'):
+                print(f'    {len(flipped(changes, flag, True))} became {flag}, {len(flipped(changes, flag, False))} stopped being {flag}')
+        return changes
+
+    def changes_between(self, old_version, new_version):
+        # diff of any 2 saved versions
+        old_symbols, old_flags = self.load_snapshot(old_version)
+        new_symbols, new_flags = self.load_snapshot(new_version)
+        return diff_snapshots(old_symbols, old_flags, new_symbols, new_flags)
+
+
+
+if __name__ == '__main__':
+
+    from alpaca.trading.client import TradingClient
+    from asset_cache import AssetCache
+
+    # API constants
+    LIVE_TRADING = False
+    with open('credentials.json') as f:
+        creds = json.load(f)
+    API_KEY    = creds['live_trading' if LIVE_TRADING else 'paper_trading']['API_KEY_ID']
+    API_SECRET = creds['live_trading' if LIVE_TRADING else 'paper_trading']['SECRET_KEY']
+
+    # check for changes every hour, only print the stocks that can't be shorted anymore
+    tracker = AssetFlagTracker()
+    tracker.subscribe(lambda changes : print(
+        'no longer shortable:', flipped(changes, 'shortable', False)['symbol'].tolist()))
+    asset_cache = AssetCache(TradingClient(API_KEY, API_SECRET))
+    while True:
+        tracker.refresh(asset_cache, verbose=True)
+        time.sleep(60 * 60)
@@ -0,0 +1,300 @@
+'''
+
+	Description:
+		persistent local cache of price bars from the stocks/bars endpoint
+
+        raw bars are saved to 1 numpy file per symbol in:
+            data/bar_cache/<timeframe>/raw/<symbol>.npz
+        and each <timeframe>/raw directory has a coverage.json
+        that records which time intervals have already been downloaded for each symbol
+        (a day with no trades is still "covered" even though it has no bars)
+
+        get_bars() only downloads the intervals that aren't covered yet, then returns
+        the cached bars merged with the new ones. symbols missing the exact same interval
+        (ex: everything since yesterday's refresh) are put in the same multi-symbol request,
+        so a daily refresh of the whole universe costs ~1 small request per batch of symbols
+
+        split / dividend / all adjusted bars are made from the raw bars when they're read,
+        with the table of corporate actions in data/bar_cache/corporate_actions (see corporate_actions.py),
+        so a split or dividend doesn't make the cached history stale
+
+	Sources:
+        https://docs.alpaca.markets/reference/stockbars
+
+	'''
+
+# standard libraries
+import os
+import re
+import json
+import pathlib
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+REPO_PATH = str(pathlib.Path(__file__).resolve().parent.parent)
+CACHE_PATH = os.path.join(REPO_PATH, "data", "bar_cache")
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+import requests
+from rate_budget import RateBudget
+from corporate_actions import CorporateActions
+from bar_pager import iter_bar_pages, concat_chunks, REORDERED_COLUMNS
+
+
+SYMBOLS_PER_REQUEST = 100
+
+def timeframe_to_timedelta(timeframe):
+    # '5Min' -> 5 minutes, '1Hour' -> 1 hour, '1Day' -> 1 day, ...
+    # see here for valid timeframes: https://docs.alpaca.markets/reference/stockbars
+    match = re.fullmatch(r'(\d+)(Min|T|Hour|H|Day|D|Week|W|Month|M)', timeframe)
+    if match == None:
+        raise ValueError(f'invalid timeframe: {timeframe}')
+    n, unit = int(match.group(1)), match.group(2)
+    if unit in ('Min', 'T'):
+        return np.timedelta64(n, 'm')
+    if unit in ('Hour', 'H'):
+        return np.timedelta64(n, 'h')
+    if unit in ('Day', 'D'):
+        return np.timedelta64(n, 'D')
+    if unit in ('Week', 'W'):
+        return np.timedelta64(7 * n, 'D')
+    return np.timedelta64(31 * n, 'D') # longest month
+
+def to_utc_datetime64(t):
+    # string / datetime / pandas Timestamp -> numpy datetime64[ns] in UTC
+    t = pd.Timestamp(t)
+    if t.tzinfo != None:
+        t = t.tz_convert('UTC').tz_localize(None)
+    return t.to_datetime64().astype('datetime64[ns]')
+
+def to_rfc3339(t):
+    return np.datetime_as_string(t, unit='s') + 'Z'
+
+def merge_intervals(intervals):
+    # list of [start, end] -> sorted list of non-overlapping [start, end]
+    merged = []
+    for start, end in sorted(intervals):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def missing_intervals(covered, start, end):
+    # parts of [start, end] that aren't in any of the (merged) covered intervals
+    missing = []
+    for covered_start, covered_end in covered:
+        if covered_end < start:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > start:
+            missing.append((start, covered_start))
+        start = max(start, covered_end)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+class BarCache:
+
+    def __init__(
+        self,
+        headers,
+        cache_path=CACHE_PATH,
+        feed='iex',
+        budget=None,
+        symbols_per_request=SYMBOLS_PER_REQUEST,
+        max_workers=4):
+
+        self.headers = headers
+        self.cache_path = cache_path
+        self.feed = feed
+        self.budget = budget if budget != None else RateBudget()
+        self.symbols_per_request = symbols_per_request
+        self.max_workers = max_workers
+        self.num_requests = 0
+        self.corporate_actions = CorporateActions(
+            headers,
+            os.path.join(cache_path, 'corporate_actions'),
+            budget=self.budget,
+            symbols_per_request=symbols_per_request)
+
+    ####### files #######
+
+    def dir_path(self, timeframe):
+        # only raw bars are saved, see corporate_actions.py for how they're adjusted
+        return os.path.join(self.cache_path, timeframe, 'raw')
+
+    def load_coverage(self, timeframe):
+        # returns dictionary of symbol -> list of [start, end] as numpy datetime64
+        filepath = os.path.join(self.dir_path(timeframe), 'coverage.json')
+        if not os.path.exists(filepath):
+            return {}
+        with open(filepath) as f:
+            coverage = json.load(f)
+        return {symbol : [[np.datetime64(start.rstrip('Z'), 'ns'), np.datetime64(end.rstrip('Z'), 'ns')] \
+            for start, end in intervals] for symbol, intervals in coverage.items()}
+
+    def save_coverage(self, coverage, timeframe):
+        # written to a temp file then renamed so a crash can't leave a half written index
+        dir_path = self.dir_path(timeframe)
+        os.makedirs(dir_path, exist_ok=True)
+        filepath = os.path.join(dir_path, 'coverage.json')
+        with open(filepath + '.tmp', 'w') as f:
+            json.dump({symbol : [[to_rfc3339(start), to_rfc3339(end)] for start, end in intervals] \
+                for symbol, intervals in sorted(coverage.items())}, f)
+        os.replace(filepath + '.tmp', filepath)
+
+    def load_raw(self, symbol, timeframe):
+        # returns dictionary of numpy arrays (see bar_pager.REORDERED_COLUMNS) of every cached bar of symbol
+        filepath = os.path.join(self.dir_path(timeframe), f'{symbol}.npz')
+        if not os.path.exists(filepath):
+            return concat_chunks([])
+        with np.load(filepath) as npz:
+            return {column : npz[column] for column in REORDERED_COLUMNS}
+
+    def load(self, symbol, timeframe, adjustment):
+        # same as load_raw() but with the adjustment applied, no downloading
+        return self.corporate_actions.adjust(symbol, self.load_raw(symbol, timeframe), adjustment)
+
+    def load_range(self, symbol, start, end, timeframe, adjustment):
+        # same as load() but only the bars between start and end (inclusive), no downloading
+        # (the whole history is adjusted first, a dividend's factor depends on the close before it)
+        columns = self.load(symbol, timeframe, adjustment)
+        i0 = np.searchsorted(columns['time'], to_utc_datetime64(start), side='left')
+        i1 = len(columns['time']) if end == None else \
+            np.searchsorted(columns['time'], to_utc_datetime64(end), side='right')
+        return {column : values[i0:i1] for column, values in columns.items()}
+
+    def save_raw(self, symbol, columns, timeframe):
+        dir_path = self.dir_path(timeframe)
+        os.makedirs(dir_path, exist_ok=True)
+        filepath = os.path.join(dir_path, f'{symbol}.npz')
+        with open(filepath + '.tmp', 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(filepath + '.tmp', filepath)
+
+    ####### downloading #######
+
+    def download(self, symbols, start, end, timeframe):
+        # returns (dictionary of symbol -> list of raw column chunks, number of requests made)
+        chunks = {}
+        num_requests = 0
+        for chunk, _ in iter_bar_pages(
+            symbols,
+            to_rfc3339(start),
+            to_rfc3339(end),
+            timeframe,
+            self.headers,
+            adjustment='raw',
+            feed=self.feed,
+            budget=self.budget,
+            session=requests.Session()):
+            num_requests += 1
+            for symbol, columns in chunk.items():
+                chunks.setdefault(symbol, []).append(columns)
+        return chunks, num_requests
+
+    def update(self, symbols, start, end, timeframe, adjustment='raw', verbose=False):
+
+        ''' update()
+            description:
+                download whatever part of [start, end] isn't cached yet for each symbol
+                (and any corporate actions since start that haven't been downloaded yet if adjustment isn't 'raw')
+            args:
+                symbols - list of strings - ticker symbols
+                start - string / datetime - start of the date range
+                end - string / datetime - end of the date range (defaults to now)
+                timeframe - string - see here for valid timeframes: https://docs.alpaca.markets/reference/stockbars
+                adjustment - string - 'raw', 'split', 'dividend', or 'all'
+            returns:
+                number of requests made
+                (raises RuntimeError if any batch failed, after the batches that didn't are saved)
+            '''
+        start = to_utc_datetime64(start)
+        now = to_utc_datetime64(datetime.now(timezone.utc))
+        end = now if end == None else min(to_utc_datetime64(end), now)
+        # the bar that is still being built isn't final yet,
+        # so it isn't marked as covered and gets downloaded again next time
+        covered_end = min(end, now - timeframe_to_timedelta(timeframe))
+        num_requests = 0
+        if adjustment != 'raw':
+            # actions after end still change the bars before end, so they're needed up to today
+            num_requests += self.corporate_actions.update(symbols, pd.Timestamp(start), verbose=verbose)
+        coverage = self.load_coverage(timeframe)
+
+        # group symbols by the exact interval they're missing
+        # so they can share multi-symbol requests
+        symbols_by_interval = {}
+        for symbol in sorted(set(symbols)):
+            for interval in missing_intervals(coverage.get(symbol, []), start, end):
+                symbols_by_interval.setdefault(interval, []).append(symbol)
+        jobs = []
+        for (interval_start, interval_end), interval_symbols in symbols_by_interval.items():
+            for i in range(0, len(interval_symbols), self.symbols_per_request):
+                jobs.append((interval_symbols[i:i + self.symbols_per_request], interval_start, interval_end))
+        if len(jobs) == 0:
+            self.num_requests += num_requests
+            return num_requests
+        if verbose:
+            print(f'downloading {len(symbols_by_interval)} missing interval(s) in {len(jobs)} batch(es) of symbols')
+
+        # merge each batch's bars into its symbols' files and mark them covered as soon as the batch comes in,
+        # so an error or Ctrl-C only loses the batches still downloading (a re-run only downloads what isn't covered)
+        updated_symbols, failed_batches = set(), []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.download, batch, interval_start, interval_end, timeframe) : \
+                (batch, interval_start, interval_end) for batch, interval_start, interval_end in jobs}
+            for future in as_completed(futures):
+                batch, interval_start, interval_end = futures[future]
+                try:
+                    chunks, batch_num_requests = future.result()
+                except Exception as e:
+                    print(f'failed to download {len(batch)} symbol(s) from {to_rfc3339(interval_start)} to {to_rfc3339(interval_end)}: {e}')
+                    failed_batches.append((batch, e))
+                    continue
+                num_requests += batch_num_requests
+                for symbol, symbol_chunks in chunks.items():
+                    columns = concat_chunks([self.load_raw(symbol, timeframe)] + symbol_chunks)
+                    # the newest bars win if an interval was downloaded twice
+                    _, reversed_index = np.unique(columns['time'][::-1], return_index=True)
+                    keep = len(columns['time']) - 1 - reversed_index
+                    self.save_raw(symbol, {column : values[keep] for column, values in columns.items()}, timeframe)
+                    updated_symbols.add(symbol)
+                interval = [interval_start, min(interval_end, covered_end)]
+                if interval[0] < interval[1]:
+                    for symbol in batch:
+                        coverage[symbol] = merge_intervals(coverage.get(symbol, []) + [interval])
+                    self.save_coverage(coverage, timeframe)
+        self.num_requests += num_requests
+        if verbose:
+            print(f'updated {len(updated_symbols)} symbol(s) with {num_requests} request(s)')
+        if len(failed_batches) > 0:
+            # everything else is saved, running it again only downloads the failed batches
+            raise RuntimeError(f'{len(failed_batches)} of {len(jobs)} batch(es) failed to download') from failed_batches[0][1]
+        return num_requests
+
+    def get_bars(self, symbols, start, end=None, timeframe='1Day', adjustment='raw', verbose=False):
+
+        ''' get_bars()
+            description:
+                get bars of each symbol between start and end, only downloading what isn't cached yet
+            args:
+                same as update()
+            returns:
+                dictionary with:
+                    keys - string - each symbol requested that has bars
+                    values - pandas dataframe - with columns bar_pager.REORDERED_COLUMNS, time is in UTC
+            '''
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        self.update(symbols, start, end, timeframe, adjustment, verbose=verbose)
+        dfs = {}
+        for symbol in symbols:
+            columns = self.load_range(symbol, start, end, timeframe, adjustment)
+            if len(columns['time']) > 0:
+                df = pd.DataFrame(columns)
+                df['time'] = df['time'].dt.tz_localize('UTC')
+                dfs[symbol] = df
+        return dfs
@@ -0,0 +1,160 @@
+'''
+
+	Description:
+		generator that pages through the stocks/bars endpoint and yields
+        each page as typed numpy columns (1 set of columns per symbol)
+
+        the request for the next page is sent in a background thread while
+        the caller is still processing the current page, and the raw json of
+        each page is converted to columns (and dropped) before the next page
+        is requested, so at most 1 page of raw json is ever in memory
+
+        NOTE: the stocks/bars endpoint caps "limit" at 10000 rows per page (in total, not per symbol),
+        if there are more rows than that the response has a "next_page_token" that must be passed
+        as "page_token" to get the next page, this continues until "next_page_token" is null
+
+	Sources:
+        https://docs.alpaca.markets/reference/stockbars
+		https://docs.alpaca.markets/docs/market-data-faq
+
+	'''
+
+# standard libraries
+from concurrent.futures import ThreadPoolExecutor
+
+# non-standard libraries
+import numpy as np
+import requests
+from rate_budget import RateBudget
+
+
+BARS_URL = "https://data.alpaca.markets/v2/stocks/bars"
+MAX_ROWS_PER_PAGE = 10000 # max "limit" allowed by the stocks/bars endpoint
+# i asked in alpaca's slack what "n" stands for and their AI said
+# "number of trades that occurred during the bar's time period"
+# and it said "vw" was "volume-weighted average price of the stock during the bar's time period."
+# https://alpaca-community.slack.com/archives/CEL9HCSN4/p1704602713177009
+COLUMN_NAMES = {
+    'c' : "close",
+    'h' : "high",
+    'l' : "low",
+    'n' : "number_of_trades",
+    'o' : "open",
+    't' : "time",
+    'v' : "volume",
+    'vw' : "volumn_weighted_average_price"
+}
+COLUMN_DTYPES = {
+    "time"                          : 'datetime64[ns]', # UTC
+    "open"                          : np.float64,
+    "high"                          : np.float64,
+    "low"                           : np.float64,
+    "close"                         : np.float64,
+    "number_of_trades"              : np.int64,
+    "volume"                        : np.float64, # float b/c crypto and fractional volumes aren't whole numbers
+    "volumn_weighted_average_price" : np.float64,
+}
+REORDERED_COLUMNS = list(COLUMN_DTYPES.keys())
+
+def bars_to_columns(bars):
+    # list of bar dictionaries from the API -> dictionary of typed numpy arrays
+    columns = {}
+    for key, column in COLUMN_NAMES.items():
+        if column == "time":
+            # numpy doesn't parse the "Z" at the end, all bar times are UTC
+            values = [bar[key].rstrip('Z') for bar in bars]
+        else:
+            values = [bar.get(key, 0) for bar in bars]
+        columns[column] = np.array(values, dtype=COLUMN_DTYPES[column])
+    return {column : columns[column] for column in REORDERED_COLUMNS}
+
+def get_bar_page(params, headers, budget, session, page_token=None):
+    # query 1 page and convert it to columns
+    # the raw json goes out of scope when this returns
+    page_params = dict(params)
+    if page_token != None:
+        page_params['page_token'] = page_token
+    response = budget.get(BARS_URL, session=session, headers=headers, params=page_params)
+    data = response.json()
+    chunk = {symbol : bars_to_columns(bars) for symbol, bars in (data.get('bars') or {}).items() if len(bars) > 0}
+    return chunk, data.get('next_page_token')
+
+def iter_bar_pages(
+    symbols,
+    start,
+    end,
+    timeframe,
+    headers,
+    adjustment='raw',
+    feed='iex',
+    budget=None,
+    session=None,
+    page_token=None,
+    limit=MAX_ROWS_PER_PAGE,
+    prefetch=True):
+
+    ''' iter_bar_pages()
+        description:
+            yield every page of bars for symbols between start and end
+        args:
+            symbols - string or list of strings - ticker symbol(s)
+            start - string - RFC-3339 or YYYY-MM-DD
+            end - string - RFC-3339 or YYYY-MM-DD
+            timeframe - string - see here for valid timeframes: https://docs.alpaca.markets/reference/stockbars
+            headers - dictionary - API key headers
+            adjustment - string - 'raw', 'split', 'dividend', or 'all'
+            feed - string - 'iex' or 'sip'
+            budget - RateBudget - shared API rate limit, a new one is made if None
+            session - requests.Session - reused connection, a new one is made if None
+            page_token - string - page to start at (to resume a previous download)
+            limit - int - max rows per page
+            prefetch - boolean - request the next page while the current one is being processed
+        yields:
+            tuple of:
+                chunk - dictionary with:
+                    keys - string - each symbol that has bars in this page
+                    values - dictionary of numpy arrays with keys REORDERED_COLUMNS
+                next_page_token - string or None - token of the page after this one
+        '''
+    if budget == None:
+        budget = RateBudget()
+    if session == None:
+        session = requests.Session()
+    if not isinstance(symbols, str):
+        symbols = ','.join(symbols)
+    params = {
+        'symbols'    : symbols,
+        'timeframe'  : timeframe,
+        'start'      : start,
+        'end'        : end,
+        'limit'      : limit,
+        'adjustment' : adjustment,
+        'feed'       : feed,
+        'sort'       : 'asc',
+    }
+    if not prefetch:
+        while True:
+            chunk, page_token = get_bar_page(params, headers, budget, session, page_token)
+            yield chunk, page_token
+            if page_token == None:
+                return
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(get_bar_page, params, headers, budget, session, page_token)
+        while future != None:
+            chunk, page_token = future.result()
+            future = None if page_token == None else \
+                executor.submit(get_bar_page, params, headers, budget, session, page_token)
+            try:
+                yield chunk, page_token
+            except GeneratorExit:
+                if future != None:
+                    future.cancel()
+                raise
+
+def concat_chunks(chunks):
+    # list of column dictionaries (of the same symbol) -> 1 column dictionary
+    if len(chunks) == 0:
+        return {column : np.array([], dtype=dtype) for column, dtype in COLUMN_DTYPES.items()}
+    if len(chunks) == 1:
+        return chunks[0]
+    return {column : np.concatenate([chunk[column] for chunk in chunks]) for column in REORDERED_COLUMNS}
@@ -0,0 +1,190 @@
+'''
+
+	Description:
+		memory mapped columnar store of bars of every symbol for 1 timeframe,
+        for cross sectional scans over the whole universe without opening 1 file per ticker
+
+        each column (open, high, low, close, ...) is 1 numpy .npy file holding a 2D array:
+            rows    - every bar time of the timeframe (sorted, the union of all symbols' bar times)
+            columns - 1 per symbol, the symbol -> column offset index is saved in index.json
+        a symbol without a bar at a time has NaN there (0 for number_of_trades)
+
+        the files are opened with np.load(mmap_mode='r') so nothing is read from disk until it's used,
+        and because each row is contiguous in memory, slicing returns views instead of copies:
+            close of every symbol at 1 time   - store.cross_section('close', time)     -> 1 row
+            last 20 bars of every symbol      - store.last_n('close', 20)              -> 20 rows
+            whole history of 1 symbol         - store.symbol_history('AAPL', 'close')  -> 1 (strided) column
+
+        the store is built from the bar cache (see bar_cache.py) and
+        written to a temp directory that is renamed when done, so readers never see half a store
+
+	Sources:
+        https://numpy.org/doc/stable/reference/generated/numpy.lib.format.open_memmap.html
+        https://numpy.org/doc/stable/reference/generated/numpy.load.html
+
+	'''
+
+# standard libraries
+import os
+import json
+import time
+import shutil
+import pathlib
+REPO_PATH = str(pathlib.Path(__file__).resolve().parent.parent)
+STORE_PATH = os.path.join(REPO_PATH, "data", "bar_store")
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from bar_pager import COLUMN_DTYPES, REORDERED_COLUMNS
+from bar_cache import BarCache, to_utc_datetime64
+
+
+VALUE_COLUMNS = [column for column in REORDERED_COLUMNS if column != "time"]
+
+def fill_value(column):
+    return 0 if np.issubdtype(COLUMN_DTYPES[column], np.integer) else np.nan
+
+def build_bar_store(symbols, load, store_path, verbose=False):
+
+    ''' build_bar_store()
+        description:
+            pack bars of many symbols into 1 memory mapped file per column
+        args:
+            symbols - list of strings - ticker symbols, in the order of the store's columns
+            load - function - load(symbol) returns a dictionary of numpy arrays (see bar_pager.REORDERED_COLUMNS)
+            store_path - string - directory to save the store to (replaced if it exists)
+        returns:
+            BarStore - the new store
+        '''
+    # 1st pass: the union of every symbol's bar times
+    times = np.unique(np.concatenate([np.asarray(load(symbol)['time'], dtype='datetime64[ns]') \
+        for symbol in symbols] + [np.array([], dtype='datetime64[ns]')]))
+    tmp_path = store_path.rstrip(os.sep) + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, 'time.npy'), times)
+    columns = {}
+    for column in VALUE_COLUMNS:
+        columns[column] = np.lib.format.open_memmap(
+            os.path.join(tmp_path, f'{column}.npy'),
+            mode='w+',
+            dtype=COLUMN_DTYPES[column],
+            shape=(len(times), len(symbols)))
+        columns[column][:] = fill_value(column)
+
+    # 2nd pass: put each symbol's bars in its column
+    for j, symbol in enumerate(symbols):
+        bars = load(symbol)
+        rows = np.searchsorted(times, np.asarray(bars['time'], dtype='datetime64[ns]'))
+        for column in VALUE_COLUMNS:
+            columns[column][rows, j] = bars[column]
+        if verbose and (j + 1) % 500 == 0:
+            print(f'packed {j + 1} of {len(symbols)} symbol(s)')
+    for column in VALUE_COLUMNS:
+        columns[column].flush()
+    del columns
+    with open(os.path.join(tmp_path, 'index.json'), 'w') as f:
+        json.dump({'symbols' : {symbol : j for j, symbol in enumerate(symbols)}}, f)
+
+    # swap the new store in: the old 1 is renamed aside 1st and only deleted once the new 1 is in its place
+    # (a reader that opens the store between the 2 renames, or after a crash between them, gets the old 1, see BarStore)
+    old_path = store_path.rstrip(os.sep) + '.old'
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    if os.path.exists(store_path):
+        os.replace(store_path, old_path)
+    os.replace(tmp_path, store_path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    if verbose:
+        print(f'saved {len(times)} bar time(s) of {len(symbols)} symbol(s) to {store_path}')
+    return BarStore(store_path)
+
+def build_bar_store_from_cache(bar_cache, symbols, timeframe, adjustment='raw', store_path=None, verbose=False):
+    # pack every cached bar of symbols into data/bar_store/<timeframe>/<adjustment>
+    if store_path == None:
+        store_path = os.path.join(STORE_PATH, timeframe, adjustment)
+    os.makedirs(os.path.dirname(store_path.rstrip(os.sep)), exist_ok=True)
+    symbols = sorted(set(symbols))
+    return build_bar_store(
+        symbols,
+        lambda symbol : bar_cache.load(symbol, timeframe, adjustment),
+        store_path,
+        verbose=verbose)
+
+class BarStore:
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        if not os.path.exists(store_path) and os.path.exists(store_path.rstrip(os.sep) + '.old'):
+            # a new store is being swapped in (see build_bar_store)
+            store_path = store_path.rstrip(os.sep) + '.old'
+        with open(os.path.join(store_path, 'index.json')) as f:
+            self.symbol_offsets = json.load(f)['symbols']
+        self.symbols = sorted(self.symbol_offsets, key=self.symbol_offsets.get)
+        self.times = np.load(os.path.join(store_path, 'time.npy'), mmap_mode='r')
+        self.columns = {column : np.load(os.path.join(store_path, f'{column}.npy'), mmap_mode='r') \
+            for column in VALUE_COLUMNS}
+
+    def row(self, time, side='right'):
+        # index of the last bar at or before time (side='right'), or the first bar at or after time (side='left')
+        time = to_utc_datetime64(time)
+        if side == 'right':
+            return int(np.searchsorted(self.times, time, side='right')) - 1
+        return int(np.searchsorted(self.times, time, side='left'))
+
+    def offsets(self, symbols):
+        # list of symbols -> numpy array of their column offsets
+        return np.array([self.symbol_offsets[symbol] for symbol in symbols], dtype=np.int64)
+
+    def cross_section(self, column, time):
+        # value of column for every symbol at the last bar time at or before time (a view, not a copy)
+        # returns (bar time, 1D array in the order of self.symbols)
+        i = self.row(time)
+        if i < 0:
+            raise KeyError(f'no bars at or before {time}')
+        return self.times[i], self.columns[column][i]
+
+    def last_n(self, column, n, end=None, symbols=None):
+        # last n bars of column ending at end (defaults to the newest bar)
+        # returns (bar times, 2D array of shape (n, number of symbols))
+        # a view if symbols is None, otherwise only the requested symbols' columns are copied
+        i1 = len(self.times) if end == None else self.row(end) + 1
+        i0 = max(i1 - n, 0)
+        values = self.columns[column][i0:i1]
+        if symbols != None:
+            values = values[:, self.offsets(symbols)]
+        return self.times[i0:i1], values
+
+    def window(self, column, start, end, symbols=None):
+        # every bar of column between start and end (inclusive), same return type as last_n()
+        i0 = self.row(start, side='left')
+        i1 = self.row(end) + 1
+        values = self.columns[column][i0:i1]
+        if symbols != None:
+            values = values[:, self.offsets(symbols)]
+        return self.times[i0:i1], values
+
+    def symbol_history(self, symbol, column):
+        # every bar of column for 1 symbol (a strided view)
+        return self.times, self.columns[column][:, self.symbol_offsets[symbol]]
+
+
+
+if __name__ == '__main__':
+
+    # pack the cached daily bars of every shortable stock and time a few scans
+    input_filename = "all_shortable_alpaca_stocks.csv"
+    tickers = pd.read_csv(os.path.join(REPO_PATH, "data", "ticker_data", input_filename))['ticker'].tolist()
+    store = build_bar_store_from_cache(BarCache(headers=None), tickers, '1Day', adjustment='all', verbose=True)
+
+    t0 = time.perf_counter()
+    bar_time, closes = store.cross_section('close', store.times[-1])
+    t1 = time.perf_counter()
+    times, volumes = store.last_n('volume', 20)
+    average_volumes = np.nanmean(volumes, axis=0)
+    t2 = time.perf_counter()
+    print(f'close of {len(closes)} symbol(s) at {bar_time}: {"%.3f" % (1000 * (t1 - t0))} ms')
+    print(f'average volume of last 20 bars of {volumes.shape[1]} symbol(s): {"%.3f" % (1000 * (t2 - t1))} ms')
@@ -0,0 +1,229 @@
+'''
+
+	Description:
+		submit many orders at once (ex: rebalancing a whole portfolio) instead of 1 submit_order() at a time
+
+        each order is a dictionary (an "order spec"):
+            symbol          - string - ticker symbol
+            side            - string - 'buy' or 'sell'
+            qty             - float - number of shares (either qty or notional)
+            notional        - float - dollar amount (market orders only)
+            type            - string - 'market' (default) or 'limit'
+            limit_price     - float - required for limit orders
+            time_in_force   - string - 'day' (default), 'gtc', 'ioc', 'fok', 'opg', or 'cls'
+            extended_hours  - boolean - optional
+            client_order_id - string - optional, a random 1 is made if it's missing
+
+        1. every spec is checked locally first (see validate_order_spec), so a bad spec costs no API call
+           and doesn't stop the rest of the batch
+        2. the valid specs are submitted from a pool of threads, each call waits for the shared
+           rate budget (see rate_budget.py) so the batch can't go over the API rate limit
+        3. each spec gets a result dictionary:
+            spec            - the order spec
+            client_order_id - sent with the order, so a retried order can't be placed twice
+            status          - 'submitted', 'invalid' (failed validation), or 'rejected' (the API returned an error)
+            order           - alpaca.trading.models.Order returned by the API (None if it wasn't submitted)
+            error           - error message (None if it was submitted)
+            submitted_at    - epoch seconds when the request was sent
+            latency         - seconds from sending the request to receiving the order back (the ack)
+
+	Sources:
+        https://alpaca.markets/sdks/python/api_reference/trading/orders.html#submit-order
+        https://docs.alpaca.markets/docs/orders-at-alpaca
+        https://forum.alpaca.markets/t/executing-orders/12029/2
+
+	'''
+
+# standard libraries
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# non-standard libraries
+import numpy as np
+from alpaca.trading.requests import MarketOrderRequest, LimitOrderRequest
+from alpaca.trading.enums import OrderSide, TimeInForce
+from rate_budget import RateBudget
+
+
+ORDER_TYPES = ('market', 'limit')
+MAX_WORKERS = 16
+
+def is_fractional(qty):
+    return qty != None and float(qty) != int(float(qty))
+
+def validate_order_spec(spec, asset=None, position_qty=None):
+
+    ''' validate_order_spec()
+        description:
+            check an order spec without calling the API
+        args:
+            spec - dictionary - see the description at the top of this file
+            asset - dictionary - optional, the asset of spec['symbol'] (see asset_cache.py)
+                to also check if it's tradable, shortable, and fractionable
+            position_qty - float - optional, shares held of spec['symbol'] (negative if short),
+                a sell of more than that opens a short, so the asset has to be shortable
+                (without it a sell can't be told apart from closing a long, and shortable isn't checked)
+        returns:
+            list of strings - what's wrong with the spec (empty if it's valid)
+        '''
+    errors = []
+    if not spec.get('symbol'):
+        errors.append('missing symbol')
+    if spec.get('side') not in ('buy', 'sell'):
+        errors.append(f'invalid side: {spec.get("side")}')
+    order_type = spec.get('type', 'market')
+    if order_type not in ORDER_TYPES:
+        errors.append(f'invalid type: {order_type}')
+    qty, notional = spec.get('qty'), spec.get('notional')
+    if (qty == None) == (notional == None):
+        errors.append('exactly 1 of qty or notional is required')
+    elif qty != None and not float(qty) > 0:
+        errors.append(f'qty must be positive: {qty}')
+    elif notional != None and not float(notional) > 0:
+        errors.append(f'notional must be positive: {notional}')
+    if notional != None and order_type != 'market':
+        errors.append('notional only works with market orders')
+    if order_type == 'limit' and not (spec.get('limit_price') != None and float(spec['limit_price']) > 0):
+        errors.append('limit orders need a positive limit_price')
+    time_in_force = spec.get('time_in_force', 'day')
+    if time_in_force not in [t.value for t in TimeInForce]:
+        errors.append(f'invalid time_in_force: {time_in_force}')
+    elif (is_fractional(qty) or notional != None) and time_in_force != 'day':
+        errors.append('fractional orders must be DAY orders')
+    if asset != None:
+        if not asset['tradable']:
+            errors.append(f'{spec["symbol"]} is not tradable')
+        if (is_fractional(qty) or notional != None) and not asset['fractionable']:
+            errors.append(f'{spec["symbol"]} is not fractionable')
+        if spec.get('side') == 'sell' and qty != None and position_qty != None and \
+            float(qty) > max(position_qty, 0.0) and not asset['shortable']:
+            errors.append(f'{spec["symbol"]} is not shortable')
+    return errors
+
+def spec_to_request(spec, client_order_id):
+    # order spec -> alpaca-py order request
+    kwargs = {
+        'symbol'          : spec['symbol'],
+        'side'            : OrderSide(spec['side']),
+        'time_in_force'   : TimeInForce(spec.get('time_in_force', 'day')),
+        'client_order_id' : client_order_id,
+    }
+    for key in ('qty', 'notional', 'extended_hours'):
+        if spec.get(key) != None:
+            kwargs[key] = spec[key]
+    if spec.get('type', 'market') == 'limit':
+        return LimitOrderRequest(limit_price=spec['limit_price'], **kwargs)
+    return MarketOrderRequest(**kwargs)
+
+def submit_order_spec(trading_client, spec, client_order_id, budget, tracer=None):
+    # submit 1 order, returns its result dictionary (see the description at the top of this file)
+    # tracer - OrderTracer - optional, to record the submit and ack times (see order_tracing.py)
+    result = {
+        'spec'            : spec,
+        'client_order_id' : client_order_id,
+        'status'          : None,
+        'order'           : None,
+        'error'           : None,
+        'submitted_at'    : None,
+        'latency'         : None,
+    }
+    try:
+        order_data = spec_to_request(spec, client_order_id)
+    except Exception as e: # pydantic validation
+        result.update(status='invalid', error=str(e))
+        return result
+    budget.acquire()
+    for i in range(budget.max_retries + 1):
+        result['submitted_at'] = time.time()
+        start_time = time.perf_counter()
+        try:
+            result['order'] = trading_client.submit_order(order_data=order_data)
+            result['latency'] = time.perf_counter() - start_time
+            result['status'] = 'submitted'
+            if tracer != None:
+                tracer.record_submit(client_order_id, spec['symbol'], spec.get('type', 'market'), spec['side'],
+                    result['submitted_at'], result['submitted_at'] + result['latency'])
+            return result
+        except Exception as e:
+            result['latency'] = time.perf_counter() - start_time
+            if getattr(e, 'status_code', None) == 429 and i < budget.max_retries:
+                # same client_order_id, so if the 1st request did go through the retry is rejected as a duplicate
+                budget.wait_for_reset()
+                budget.acquire()
+                continue
+            result.update(status='rejected', error=str(e))
+            return result
+
+def submit_orders_in_bulk(
+    trading_client,
+    specs,
+    budget=None,
+    asset_cache=None,
+    tracer=None,
+    risk=None,
+    prices=None,
+    max_workers=MAX_WORKERS,
+    verbose=True):
+
+    ''' submit_orders_in_bulk()
+        description:
+            validate and submit many orders concurrently under the shared rate budget
+        args:
+            trading_client - alpaca.trading.client.TradingClient
+            specs - list of dictionaries - order specs (see the description at the top of this file)
+            budget - RateBudget - shared API rate limit (see rate_budget.py)
+            asset_cache - AssetCache - optional, to check assets are tradable / fractionable (see asset_cache.py)
+            tracer - OrderTracer - optional, to measure the latency of each stage of each order (see order_tracing.py)
+            risk - PreTradeRisk - optional, to check buying power, exposure, PDT, and shortability locally (see pre_trade_risk.py)
+            prices - dictionary - optional, symbol -> expected price, for the risk checks of qty orders without a limit_price
+            max_workers - int - number of orders in flight at once
+        returns:
+            list of dictionaries - 1 result per spec, in the same order as specs
+        '''
+    budget = budget if budget != None else RateBudget()
+    start_time = time.time()
+    results = [None] * len(specs)
+    to_submit = []
+    client_order_ids = set()
+    for i, spec in enumerate(specs):
+        client_order_id = spec.get('client_order_id') or str(uuid.uuid4())
+        asset = asset_cache.get(spec['symbol']) if asset_cache != None and spec.get('symbol') else None
+        position_qty = risk.order_book.qty(spec['symbol']) if risk != None and spec.get('symbol') else None
+        errors = validate_order_spec(spec, asset, position_qty)
+        if asset_cache != None and spec.get('symbol') and asset == None:
+            errors.append(f'{spec["symbol"]} is not on Alpaca')
+        if client_order_id in client_order_ids:
+            errors.append(f'duplicate client_order_id: {client_order_id}')
+        client_order_ids.add(client_order_id)
+        if len(errors) == 0 and risk != None:
+            errors = risk.approve(dict(spec, client_order_id=client_order_id), (prices or {}).get(spec['symbol']))
+        if len(errors) > 0:
+            results[i] = {
+                'spec'            : spec,
+                'client_order_id' : client_order_id,
+                'status'          : 'invalid',
+                'order'           : None,
+                'error'           : '; '.join(errors),
+                'submitted_at'    : None,
+                'latency'         : None,
+            }
+        else:
+            to_submit.append((i, spec, client_order_id))
+    if len(to_submit) > 0:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(to_submit))) as executor:
+            futures = {i : executor.submit(submit_order_spec, trading_client, spec, client_order_id, budget, tracer) \
+                for i, spec, client_order_id in to_submit}
+            for i, future in futures.items():
+                results[i] = future.result()
+                if risk != None and results[i]['status'] != 'submitted':
+                    risk.release(results[i]['client_order_id'])
+    if verbose:
+        statuses = [result['status'] for result in results]
+        latencies = np.array([result['latency'] for result in results if result['status'] == 'submitted'])
+        print(f'submitted {statuses.count("submitted")} of {len(specs)} order(s) in {"%.2f" % (time.time() - start_time)} second(s)' + \
+            ('' if len(latencies) == 0 else f', submit -> ack latency: median {"%.3f" % np.median(latencies)} s, max {"%.3f" % latencies.max()} s'))
+        for result in results:
+            if result['status'] != 'submitted':
+                print(f'    {result["status"]} order to {result["spec"].get("side")} {result["spec"].get("symbol")}: {result["error"]}')
+    return results
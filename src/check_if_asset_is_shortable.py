@@ -18,6 +18,7 @@ pd.set_option('display.max_columns', 10)
 from alpaca.trading.client import TradingClient
 from alpaca.trading.requests import GetAssetsRequest
 from alpaca.trading.enums import AssetClass, AssetStatus
+from asset_cache import AssetCache
 
 
 # API constants
@@ -31,18 +32,25 @@ API_SECRET = creds['live_trading' if LIVE_TRADING else 'paper_trading']['SECRET_
 trading_client = TradingClient(API_KEY, API_SECRET)
 
 # https://alpaca.markets/sdks/python/api_reference/trading/assets.html#get-asset
+# looked up in the cached list of all assets (see asset_cache.py) instead of 1 request per symbol
+asset_cache = AssetCache(trading_client)
 symbol = "SOFI"
-asset = trading_client.get_asset(symbol)
-
-print(f'name:\t\t{asset.name}')
-print(f'symbol:\t\t{asset.symbol}')
-print(f'asset_class:\t{asset.asset_class}')
-print(f'status:\t\t{asset.status}')
-print(f'tradable:\t{asset.tradable}')
-print(f'marginable:\t{asset.marginable}')
-print(f'shortable:\t{asset.shortable}')
-print(f'fractionable:\t{asset.fractionable}')
-print(f'alpaca uuid:\t{asset.id}')
+asset = asset_cache.get(symbol)
+
+if asset == None:
+    # get() returns None for symbols that aren't on Alpaca
+    print(f'{symbol} is not in the list of assets on Alpaca')
+else:
+    print(f'name:\t\t{asset["name"]}')
+    print(f'symbol:\t\t{asset["symbol"]}')
+    print(f'asset_class:\t{asset["asset_class"]}')
+    print(f'status:\t\t{asset["status"]}')
+    print(f'tradable:\t{asset["tradable"]}')
+    print(f'marginable:\t{asset["marginable"]}')
+    print(f'shortable:\t{asset["shortable"]}')
+    print(f'fractionable:\t{asset["fractionable"]}')
+    print(f'alpaca uuid:\t{asset["id"]}')
+    print(f'as of:\t\t{"%.0f" % (asset_cache.age() / 60)} minute(s) ago')
 
 
 
@@ -0,0 +1,162 @@
+'''
+
+	Description:
+		close positions and cancel orders in parallel, and confirm they're done with
+        the trade_updates stream (see trade_updates.py) instead of sleeping
+
+        close_positions_in_parallel()
+            1 close_position() request per symbol, sent from a pool of threads under the shared rate budget,
+            then waits for the fill (or cancel / reject) of every closing order
+        cancel_orders_in_parallel()
+            1 cancel_order_by_id() request per order, sent from a pool of threads under the shared rate budget,
+            then waits for the canceled (or fill if it filled first) update of every order
+        cancel_all_orders_and_confirm()
+            1 cancel_orders() request, then waits for the canceled update of every order it canceled
+
+        so flattening the whole portfolio takes about 1 round trip and 1 stream update,
+        not 1 round trip per position plus a sleep
+
+        each returns a list of result dictionaries:
+            symbol   - ticker symbol (close only)
+            order_id - id of the closing order (close) or of the canceled order (cancel)
+            status   - the confirming event ('fill', 'canceled', ...), 'timeout' if none came in time,
+                       or 'error' if the request failed
+            error    - error message of the request (None if it didn't fail)
+            latency  - seconds from sending the request to the confirming update
+
+	Sources:
+        https://alpaca.markets/sdks/python/api_reference/trading/positions.html#close-a-position
+        https://alpaca.markets/sdks/python/api_reference/trading/orders.html#cancel-order-by-id
+        https://docs.alpaca.markets/docs/websocket-streaming#trade-updates
+
+	'''
+
+# standard libraries
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# non-standard libraries
+from rate_budget import RateBudget
+from trade_updates import DONE_EVENTS
+
+
+MAX_WORKERS = 16
+TIMEOUT = 10.0 # seconds
+
+def call_each_in_parallel(function, keys, budget, max_workers):
+    # function(key) for each key from a pool of threads under the budget
+    # returns list of (key, return value or None, error message or None, epoch seconds when sent)
+    def call(key):
+        sent_at = time.time()
+        try:
+            return key, budget.call(function, key), None, sent_at
+        except Exception as e:
+            return key, None, str(e), sent_at
+    if len(keys) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as executor:
+        return list(executor.map(call, keys))
+
+def confirm(listener, calls, order_id_of, events, timeout):
+    # wait for the trade updates of the orders of each call, returns the result dictionaries
+    order_ids = [str(order_id_of(key, value)) for key, value, error, _ in calls if error == None]
+    confirmed = listener.wait_for(order_ids, events, timeout=timeout)
+    results = []
+    for key, value, error, sent_at in calls:
+        result = {'order_id' : None, 'status' : 'error', 'error' : error, 'latency' : None}
+        if error == None:
+            order_id = str(order_id_of(key, value))
+            event, _ = confirmed[order_id]
+            entry = listener.events_by_order_id.get(order_id)
+            result.update(
+                order_id=order_id,
+                status='timeout' if event == None else event,
+                latency=None if event == None else max(entry[2] - sent_at, 0.0))
+        results.append((key, result))
+    return results
+
+def close_positions_in_parallel(
+    trading_client,
+    listener,
+    symbols=None,
+    budget=None,
+    max_workers=MAX_WORKERS,
+    timeout=TIMEOUT,
+    verbose=False):
+
+    ''' close_positions_in_parallel()
+        description:
+            close positions concurrently and wait for their closing orders to fill
+        args:
+            trading_client - alpaca.trading.client.TradingClient
+            listener - TradeUpdateListener - already started (see trade_updates.py)
+            symbols - list of strings - positions to close (defaults to every open position)
+            budget - RateBudget - shared API rate limit (see rate_budget.py)
+            max_workers - int - number of requests in flight at once
+            timeout - float - max seconds to wait for the fills
+        returns:
+            list of dictionaries - 1 result per symbol (see the description at the top of this file)
+        '''
+    budget = budget if budget != None else RateBudget()
+    start_time = time.time()
+    if symbols == None:
+        symbols = [position.symbol for position in budget.call(trading_client.get_all_positions)]
+    calls = call_each_in_parallel(trading_client.close_position, list(symbols), budget, max_workers)
+    results = [dict(symbol=symbol, **result) for symbol, result in \
+        confirm(listener, calls, lambda symbol, order : order.id, DONE_EVENTS, timeout)]
+    if verbose:
+        print(f'\nclosed {sum(result["status"] == "fill" for result in results)} of {len(results)} position(s) ' + \
+            f'in {"%.2f" % (time.time() - start_time)} second(s):')
+        for result in results:
+            print(f'    {result["symbol"]}: {result["status"]}' + \
+                ('' if result['latency'] == None else f' after {"%.3f" % result["latency"]} s') + \
+                ('' if result['error'] == None else f' ({result["error"]})'))
+    return results
+
+def cancel_orders_in_parallel(
+    trading_client,
+    listener,
+    order_ids,
+    budget=None,
+    max_workers=MAX_WORKERS,
+    timeout=TIMEOUT,
+    verbose=False):
+
+    ''' cancel_orders_in_parallel()
+        description:
+            cancel orders by id concurrently and wait for their canceled updates
+        args:
+            trading_client - alpaca.trading.client.TradingClient
+            listener - TradeUpdateListener - already started (see trade_updates.py)
+            order_ids - list of strings / UUIDs - orders to cancel
+            budget - RateBudget - shared API rate limit (see rate_budget.py)
+            max_workers - int - number of requests in flight at once
+            timeout - float - max seconds to wait for the cancels
+        returns:
+            list of dictionaries - 1 result per order (see the description at the top of this file)
+        '''
+    budget = budget if budget != None else RateBudget()
+    start_time = time.time()
+    calls = call_each_in_parallel(trading_client.cancel_order_by_id, list(order_ids), budget, max_workers)
+    results = [result for _, result in confirm(listener, calls, lambda order_id, _ : order_id, DONE_EVENTS, timeout)]
+    if verbose:
+        print(f'\ncanceled {sum(result["status"] == "canceled" for result in results)} of {len(results)} order(s) ' + \
+            f'in {"%.2f" % (time.time() - start_time)} second(s)')
+        for result in results:
+            if result['status'] != 'canceled':
+                print(f'    {result["order_id"]}: {result["status"]}' + \
+                    ('' if result['error'] == None else f' ({result["error"]})'))
+    return results
+
+def cancel_all_orders_and_confirm(trading_client, listener, budget=None, timeout=TIMEOUT, verbose=False):
+    # 1 cancel_orders() request, then wait for the canceled update of every order it canceled
+    budget = budget if budget != None else RateBudget()
+    sent_at = time.time()
+    responses = budget.call(trading_client.cancel_orders) # list of CancelOrderResponse
+    calls = [(response.id, response, None if response.status < 300 else str(response.body), sent_at) \
+        for response in responses]
+    results = [result for _, result in confirm(listener, calls, lambda order_id, _ : order_id, DONE_EVENTS, timeout)]
+    if verbose:
+        print(f'\ncanceled {sum(result["status"] == "canceled" for result in results)} of {len(results)} order(s) ' + \
+            f'in {"%.2f" % (time.time() - sent_at)} second(s)')
+    return results
@@ -0,0 +1,206 @@
+'''
+
+	Description:
+		computes per stock metrics of the whole universe on a pool of processes
+        (so ranking ~10,000 stocks isn't limited to 1 python thread)
+
+        the bars are read from the memory mapped bar store (see bar_store.py), not passed to the workers:
+            1. the symbols are split into chunks
+            2. each worker process opens the store itself (np.load(mmap_mode='r'), so nothing is copied
+               between processes) and computes the metrics of its chunk's columns with numpy
+            3. the workers only send back a small dataframe of metrics, which are joined into 1 table and ranked
+
+        metrics (over the last num_bars bars of the store, NaN where there's not enough data):
+            num_bars              - number of bars the stock has in the window
+            last_close            - close of the last bar
+            volatility            - standard deviation of the log returns between bars
+            annualized_volatility - volatility * sqrt(periods_per_year)
+            atr                   - average true range
+            atr_percent           - atr / last_close
+            average_spread        - Corwin-Schultz estimate of the bid ask spread from the high and low of
+                                    consecutive bars (a fraction of price), since the bars have no quotes
+            average_dollar_volume - average of close * volume of each bar
+            beta                  - covariance of the stock's returns with the benchmark's / variance of the benchmark's
+
+	Sources:
+        https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+        https://en.wikipedia.org/wiki/Average_true_range
+        Corwin, S. A. and Schultz, P. (2012), A Simple Way to Estimate Bid-Ask Spreads from Daily High and Low Prices
+
+	'''
+
+# standard libraries
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from bar_store import BarStore
+
+
+SYMBOLS_PER_CHUNK = 256
+BENCHMARK = 'SPY'
+PERIODS_PER_YEAR = 252 # daily bars
+FEATURE_COLUMNS = [
+    'ticker',
+    'num_bars',
+    'last_close',
+    'volatility',
+    'annualized_volatility',
+    'atr',
+    'atr_percent',
+    'average_spread',
+    'average_dollar_volume',
+    'beta',
+]
+
+def log_returns(close):
+    # (bars, symbols) -> (bars - 1, symbols), NaN where either bar is missing
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.diff(np.log(close), axis=0)
+
+def true_range(high, low, close):
+    # max of high - low, |high - previous close|, |low - previous close| of each bar after the 1st
+    previous_close = close[:-1]
+    return np.fmax(high[1:] - low[1:], np.fmax(np.abs(high[1:] - previous_close), np.abs(low[1:] - previous_close)))
+
+def corwin_schultz_spread(high, low):
+    # spread estimate of each pair of consecutive bars, negative estimates are set to 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = np.log(high[:-1] / low[:-1]) ** 2 + np.log(high[1:] / low[1:]) ** 2
+        gamma = np.log(np.fmax(high[:-1], high[1:]) / np.fmin(low[:-1], low[1:])) ** 2
+        k = 3.0 - 2.0 * np.sqrt(2.0)
+        alpha = (np.sqrt(2.0 * beta) - np.sqrt(beta)) / k - np.sqrt(gamma / k)
+        spread = 2.0 * (np.exp(alpha) - 1.0) / (1.0 + np.exp(alpha))
+    return np.where(np.isnan(spread), np.nan, np.fmax(spread, 0.0))
+
+def nan_beta(returns, benchmark_returns):
+    # beta of each column of returns (bars, symbols) against benchmark_returns (bars,), using bars where both exist
+    both = ~np.isnan(returns) & ~np.isnan(benchmark_returns)[:, None]
+    n = both.sum(axis=0)
+    r = np.where(both, returns, 0.0)
+    b = np.where(both, benchmark_returns[:, None], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_mean = r.sum(axis=0) / n
+        b_mean = b.sum(axis=0) / n
+        covariance = (np.where(both, (r - r_mean) * (b - b_mean), 0.0)).sum(axis=0) / (n - 1)
+        variance = (np.where(both, (b - b_mean) ** 2, 0.0)).sum(axis=0) / (n - 1)
+        beta = covariance / variance
+    return np.where(n > 2, beta, np.nan)
+
+def compute_chunk_features(store_path, symbols, num_bars, end=None, benchmark=BENCHMARK, periods_per_year=PERIODS_PER_YEAR):
+
+    ''' compute_chunk_features()
+        description:
+            metrics of a chunk of symbols, run in a worker process
+        args:
+            store_path - string - directory of the bar store (see bar_store.py)
+            symbols - list of strings - ticker symbols in the store
+            num_bars - int - number of bars to compute the metrics over
+            end - datetime - last bar time of the window (defaults to the newest bar in the store)
+            benchmark - string - ticker symbol to compute beta against (beta is NaN if it's not in the store)
+            periods_per_year - int - number of bars in a year, to annualize the volatility
+        returns:
+            pandas dataframe - 1 row per symbol with FEATURE_COLUMNS
+        '''
+    store = BarStore(store_path)
+    # 1 extra bar, so the 1st bar of the window has a previous close
+    _, close = store.last_n('close', num_bars + 1, end=end, symbols=symbols)
+    _, high = store.last_n('high', num_bars + 1, end=end, symbols=symbols)
+    _, low = store.last_n('low', num_bars + 1, end=end, symbols=symbols)
+    _, volume = store.last_n('volume', num_bars + 1, end=end, symbols=symbols)
+    volume = volume[1:] # same rows as close[1:], even if the store has fewer than num_bars + 1 bars
+    returns = log_returns(close)
+    bar_count = (~np.isnan(close[1:])).sum(axis=0)
+    # last non NaN close of each symbol
+    last_row = close.shape[0] - 1 - np.argmax(~np.isnan(close[::-1]), axis=0)
+    last_close = close[last_row, np.arange(close.shape[1])]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning) # symbols without enough bars get NaN
+        volatility = np.nanstd(returns, axis=0, ddof=1)
+        atr = np.nanmean(true_range(high, low, close), axis=0)
+        average_spread = np.nanmean(corwin_schultz_spread(high, low), axis=0)
+        average_dollar_volume = np.nanmean(close[1:] * volume, axis=0)
+    if benchmark in store.symbol_offsets:
+        _, benchmark_close = store.last_n('close', num_bars + 1, end=end, symbols=[benchmark])
+        beta = nan_beta(returns, log_returns(benchmark_close)[:, 0])
+    else:
+        beta = np.full(len(symbols), np.nan)
+    return pd.DataFrame({
+        'ticker'                : symbols,
+        'num_bars'              : bar_count,
+        'last_close'            : last_close,
+        'volatility'            : volatility,
+        'annualized_volatility' : volatility * np.sqrt(periods_per_year),
+        'atr'                   : atr,
+        'atr_percent'           : atr / last_close,
+        'average_spread'        : average_spread,
+        'average_dollar_volume' : average_dollar_volume,
+        'beta'                  : beta,
+    })
+
+def compute_features(
+    store_path,
+    symbols=None,
+    num_bars=31,
+    end=None,
+    benchmark=BENCHMARK,
+    periods_per_year=PERIODS_PER_YEAR,
+    sort_by='average_dollar_volume',
+    ascending=False,
+    symbols_per_chunk=SYMBOLS_PER_CHUNK,
+    max_workers=None,
+    verbose=True):
+
+    ''' compute_features()
+        description:
+            metrics of every symbol (see the description at the top of this file), computed on a pool of processes
+        args:
+            store_path - string - directory of the bar store (see bar_store.py)
+            symbols - list of strings - ticker symbols (defaults to every symbol in the store)
+            num_bars - int - number of bars to compute the metrics over
+            end - datetime - last bar time of the window (defaults to the newest bar in the store)
+            benchmark - string - ticker symbol to compute beta against
+            periods_per_year - int - number of bars in a year (252 for daily bars)
+            sort_by - string - column to rank by
+            ascending - boolean - rank order
+            symbols_per_chunk - int - number of symbols each task computes
+            max_workers - int - number of processes (defaults to the number of cpus), 1 computes in this process
+        returns:
+            pandas dataframe - 1 row per symbol with FEATURE_COLUMNS and a rank column, sorted by rank
+        '''
+    start_time = time.time()
+    if symbols == None:
+        symbols = BarStore(store_path).symbols
+    chunks = [symbols[i:i + symbols_per_chunk] for i in range(0, len(symbols), symbols_per_chunk)]
+    args = (num_bars, end, benchmark, periods_per_year)
+    if max_workers == 1 or len(chunks) <= 1:
+        results = [compute_chunk_features(store_path, chunk, *args) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # map keeps the chunks in order
+            results = list(executor.map(compute_chunk_features,
+                [store_path] * len(chunks), chunks, *[[arg] * len(chunks) for arg in args]))
+    df = pd.concat(results, ignore_index=True) if len(results) > 0 else pd.DataFrame(columns=FEATURE_COLUMNS)
+    df = df.sort_values(by=sort_by, ascending=ascending, na_position='last').reset_index(drop=True)
+    df['rank'] = np.arange(1, len(df) + 1)
+    if verbose:
+        print(f'computed features of {len(symbols)} symbol(s) in {"%.2f" % (time.time() - start_time)} second(s) ' + \
+            f'with {max_workers or os.cpu_count()} process(es)')
+    return df
+
+
+
+if __name__ == '__main__':
+
+    import pathlib
+    REPO_PATH = str(pathlib.Path(__file__).resolve().parent.parent)
+
+    # rank the shortable stocks in the daily bar store built by get_price_history.py
+    store_path = os.path.join(REPO_PATH, "data", "bar_store", "1Day", "all")
+    df = compute_features(store_path, num_bars=31)
+    print(df)
+    df.to_csv(os.path.join(REPO_PATH, "data", "ticker_data", "stock_features.csv"), index=False)
@@ -0,0 +1,226 @@
+'''
+
+	Description:
+		local table of splits and dividends, used to adjust raw bars when they're read
+        (see bar_cache.py) instead of downloading split/dividend adjusted bars
+
+        with adjustment='split' or adjustment='all' in the request, every bar before a split
+        changes when the split happens, so a cache of adjusted bars would have to be downloaded again.
+        instead only raw bars are cached, and this table of corporate actions is applied on read.
+        so a new split or dividend only costs downloading the action itself
+
+        the table is saved to data/bar_cache/corporate_actions/actions.csv with columns:
+            symbol  - ticker symbol
+            type    - 'split' (forward splits, reverse splits, and stock dividends) or 'dividend' (cash dividends)
+            ex_date - YYYY-MM-DD, bars before midnight New York time of this date get adjusted
+            ratio   - new shares per old share of a split (1.0 for dividends)
+            amount  - cash per share of a dividend (0.0 for splits)
+        and coverage.json records which ex_date range has been downloaded for each symbol
+
+        adjustments (same as the adjustment param of the stocks/bars endpoint):
+            split    - prices of bars before a split are divided by ratio, volumes are multiplied by it
+            dividend - prices of bars before a dividend are multiplied by 1 - amount / close before the ex_date
+            all      - both
+        the factors of every action after a bar are multiplied together with a reversed cumulative product,
+        then each bar finds its factor with a binary search on the ex dates, so no python loop over bars
+
+	Sources:
+        https://docs.alpaca.markets/reference/corporateactions-1
+        https://docs.alpaca.markets/docs/historical-stock-data-1#adjustment
+
+	'''
+
+# standard libraries
+import os
+import json
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+import requests
+from rate_budget import RateBudget
+
+
+CORPORATE_ACTIONS_URL = "https://data.alpaca.markets/v1/corporate-actions"
+ACTION_TYPES = "forward_split,reverse_split,stock_dividend,cash_dividend"
+STOCK_MARKET_TIMEZONE = 'America/New_York'
+SYMBOLS_PER_REQUEST = 100
+TABLE_COLUMNS = ['symbol', 'type', 'ex_date', 'ratio', 'amount']
+
+def parse_corporate_actions(corporate_actions):
+    # "corporate_actions" of 1 response page -> list of rows of the table
+    rows = []
+    for action in corporate_actions.get('forward_splits', []) + corporate_actions.get('reverse_splits', []):
+        rows.append((action['symbol'], 'split', action['ex_date'], float(action['new_rate']) / float(action['old_rate']), 0.0))
+    for action in corporate_actions.get('stock_dividends', []):
+        # ex: rate = 0.05 means 5 new shares for every 100 shares
+        rows.append((action['symbol'], 'split', action['ex_date'], 1.0 + float(action['rate']), 0.0))
+    for action in corporate_actions.get('cash_dividends', []):
+        rows.append((action['symbol'], 'dividend', action['ex_date'], 1.0, float(action['rate'])))
+    return rows
+
+class CorporateActions:
+
+    def __init__(self, headers, cache_path, budget=None, symbols_per_request=SYMBOLS_PER_REQUEST):
+        self.headers = headers
+        self.cache_path = cache_path
+        self.budget = budget if budget != None else RateBudget()
+        self.symbols_per_request = symbols_per_request
+        self.table_filepath = os.path.join(cache_path, 'actions.csv')
+        self.coverage_filepath = os.path.join(cache_path, 'coverage.json')
+        if os.path.exists(self.table_filepath):
+            self.table = pd.read_csv(self.table_filepath, dtype={'symbol' : str, 'type' : str, 'ex_date' : str})
+        else:
+            self.table = pd.DataFrame(columns=TABLE_COLUMNS)
+        if os.path.exists(self.coverage_filepath):
+            with open(self.coverage_filepath) as f:
+                self.coverage = json.load(f)
+        else:
+            self.coverage = {}
+        self.factors_by_symbol = None
+
+    def save(self):
+        # temp file then rename, so a crash can't leave half a table
+        os.makedirs(self.cache_path, exist_ok=True)
+        self.table.to_csv(self.table_filepath + '.tmp', index=False)
+        os.replace(self.table_filepath + '.tmp', self.table_filepath)
+        with open(self.coverage_filepath + '.tmp', 'w') as f:
+            json.dump(self.coverage, f)
+        os.replace(self.coverage_filepath + '.tmp', self.coverage_filepath)
+
+    def download(self, symbols, start, end):
+        # returns (list of rows, number of requests made)
+        rows = []
+        num_requests = 0
+        session = requests.Session()
+        params = {
+            'symbols' : ','.join(symbols),
+            'types'   : ACTION_TYPES,
+            'start'   : start,
+            'end'     : end,
+            'limit'   : 1000,
+        }
+        while True:
+            response = self.budget.get(CORPORATE_ACTIONS_URL, session=session, headers=self.headers, params=params)
+            num_requests += 1
+            data = response.json()
+            rows += parse_corporate_actions(data.get('corporate_actions') or {})
+            if data.get('next_page_token') == None:
+                return rows, num_requests
+            params['page_token'] = data['next_page_token']
+
+    def update(self, symbols, start, end=None, verbose=False):
+
+        ''' update()
+            description:
+                download the corporate actions of each symbol with an ex_date between start and end
+                that haven't been downloaded yet
+            args:
+                symbols - list of strings - ticker symbols
+                start - string / datetime - start of the date range
+                end - string / datetime - end of the date range (defaults to today)
+            returns:
+                number of requests made
+            '''
+        start = pd.Timestamp(start).strftime('%Y-%m-%d')
+        today = datetime.now(ZoneInfo(STOCK_MARKET_TIMEZONE)).strftime('%Y-%m-%d')
+        end = today if end == None else min(pd.Timestamp(end).strftime('%Y-%m-%d'), today)
+
+        # each symbol's coverage is 1 date range that only ever grows,
+        # so it's missing at most 1 range before it and 1 after it
+        symbols_by_range = {}
+        for symbol in sorted(set(symbols)):
+            if symbol not in self.coverage:
+                missing = [(start, end)]
+            else:
+                covered_start, covered_end = self.coverage[symbol]
+                missing = []
+                if start < covered_start:
+                    missing.append((start, covered_start))
+                if end > covered_end:
+                    missing.append((covered_end, end))
+            for date_range in missing:
+                symbols_by_range.setdefault(date_range, []).append(symbol)
+        if len(symbols_by_range) == 0:
+            return 0
+
+        rows = []
+        num_requests = 0
+        for (range_start, range_end), range_symbols in symbols_by_range.items():
+            for i in range(0, len(range_symbols), self.symbols_per_request):
+                batch_rows, batch_num_requests = self.download(
+                    range_symbols[i:i + self.symbols_per_request], range_start, range_end)
+                rows += batch_rows
+                num_requests += batch_num_requests
+        if len(rows) > 0:
+            self.table = pd.concat([self.table, pd.DataFrame(rows, columns=TABLE_COLUMNS)]) \
+                .drop_duplicates(subset=['symbol', 'type', 'ex_date'], keep='last') \
+                .sort_values(by=['symbol', 'ex_date']) \
+                .reset_index(drop=True)
+            self.factors_by_symbol = None
+        for symbol in set(symbols):
+            covered_start, covered_end = self.coverage.get(symbol, (start, end))
+            self.coverage[symbol] = [min(covered_start, start), max(covered_end, end)]
+        self.save()
+        if verbose:
+            print(f'downloaded {len(rows)} corporate action(s) of {len(set(symbols))} symbol(s) with {num_requests} request(s)')
+        return num_requests
+
+    def actions(self, symbol):
+        # returns (ex dates as int64 UTC nanoseconds, split ratios, dividend amounts) sorted by ex date
+        if self.factors_by_symbol == None:
+            ex_ns = pd.DatetimeIndex(pd.to_datetime(self.table['ex_date'])).tz_localize(STOCK_MARKET_TIMEZONE) \
+                .tz_convert('UTC').tz_localize(None).as_unit('ns').asi8
+            ratios = self.table['ratio'].to_numpy(dtype=np.float64)
+            amounts = self.table['amount'].to_numpy(dtype=np.float64)
+            self.factors_by_symbol = {}
+            for symbol_, index in self.table.groupby('symbol').indices.items():
+                order = index[np.argsort(ex_ns[index], kind='stable')]
+                self.factors_by_symbol[symbol_] = (ex_ns[order], ratios[order], amounts[order])
+        empty = np.array([], dtype=np.int64)
+        return self.factors_by_symbol.get(symbol, (empty, empty.astype(np.float64), empty.astype(np.float64)))
+
+    def adjust(self, symbol, columns, adjustment):
+
+        ''' adjust()
+            description:
+                apply split and/or dividend adjustments to raw bars of 1 symbol
+            args:
+                symbol - string - ticker symbol
+                columns - dictionary of numpy arrays - raw bars sorted by time (see bar_pager.REORDERED_COLUMNS)
+                adjustment - string - 'raw', 'split', 'dividend', or 'all'
+            returns:
+                dictionary of numpy arrays - the adjusted bars (columns is not modified)
+            '''
+        if adjustment == 'raw':
+            return columns
+        if adjustment not in ('split', 'dividend', 'all'):
+            raise ValueError(f'invalid adjustment: {adjustment}')
+        ex_ns, ratios, amounts = self.actions(symbol)
+        if len(ex_ns) == 0 or len(columns['time']) == 0:
+            return columns
+        bar_ns = columns['time'].astype('datetime64[ns]').astype(np.int64)
+        price_factors = np.ones(len(ex_ns))
+        volume_factors = np.ones(len(ex_ns))
+        if adjustment in ('split', 'all'):
+            price_factors /= ratios
+            volume_factors *= ratios
+        if adjustment in ('dividend', 'all'):
+            # close of the last raw bar before each ex date
+            previous = np.searchsorted(bar_ns, ex_ns, side='left') - 1
+            previous_close = columns['close'][np.clip(previous, 0, None)]
+            valid = (previous >= 0) & (amounts > 0) & (previous_close > amounts)
+            price_factors *= np.where(valid, 1.0 - amounts / np.where(valid, previous_close, 1.0), 1.0)
+        # factor of each bar = product of the factors of every action with an ex date after the bar
+        price_suffix = np.append(np.cumprod(price_factors[::-1])[::-1], 1.0)
+        volume_suffix = np.append(np.cumprod(volume_factors[::-1])[::-1], 1.0)
+        i = np.searchsorted(ex_ns, bar_ns, side='right')
+        price_factor = price_suffix[i]
+        volume_factor = volume_suffix[i]
+        adjusted = dict(columns)
+        for column in ("open", "high", "low", "close", "volumn_weighted_average_price"):
+            adjusted[column] = columns[column] * price_factor
+        adjusted["volume"] = columns["volume"] * volume_factor
+        return adjusted
@@ -0,0 +1,144 @@
+'''
+
+	Description:
+		checkpoint file for long downloads (see get_price_history_in_bulk.py)
+        so a download that dies halfway through the universe (network blip, 429, Ctrl+C)
+        can pick up where it left off instead of starting over
+
+        the manifest is a json file in the output directory that records:
+            params  - the query params of the download, a manifest is only resumed if they match
+            batches - for each batch of symbols queried together:
+                symbols    - the symbols in the request (page tokens only work for the same request)
+                page_token - token of the next page to query (null before the 1st page)
+                status     - 'pending', 'done', or 'failed' (with the error)
+            symbols - for each symbol:
+                status     - 'pending', 'in_progress', 'done', 'no_data', or 'failed'
+                page_token - token of the page after the last 1 written for this symbol
+                rows       - number of rows written to the symbol's csv so far
+                checksum   - sha256 of the symbol's csv, set when the symbol is done
+
+        it is rewritten (to a temp file that is then renamed, so it's never half written)
+        after every page, which is also when symbols complete
+
+        NOTE: the stocks/bars endpoint returns multi symbol pages sorted by symbol, then time,
+        so once a page has bars of a symbol, every symbol before it in the batch is complete
+
+	'''
+
+# standard libraries
+import os
+import json
+import hashlib
+import threading
+
+
+def file_checksum(filepath):
+    if not os.path.exists(filepath):
+        return None
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda : f.read(1 << 20), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+class DownloadManifest:
+
+    def __init__(self, filepath, params):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.params = params
+        self.batches = {}
+        self.symbols = {}
+        if os.path.exists(filepath):
+            with open(filepath) as f:
+                manifest = json.load(f)
+            if manifest['params'] == params:
+                self.batches = manifest['batches']
+                self.symbols = manifest['symbols']
+
+    def save(self):
+        # caller must hold self.lock
+        with open(self.filepath + '.tmp', 'w') as f:
+            json.dump({
+                'params'  : self.params,
+                'batches' : self.batches,
+                'symbols' : self.symbols,
+            }, f)
+        os.replace(self.filepath + '.tmp', self.filepath)
+
+    def is_complete(self, symbol):
+        return self.symbols.get(symbol, {}).get('status') in ('done', 'no_data')
+
+    def add_batch(self, symbols):
+        # returns the new batch's id
+        with self.lock:
+            batch_id = str(len(self.batches))
+            self.batches[batch_id] = {'symbols' : symbols, 'page_token' : None, 'status' : 'pending'}
+            for symbol in symbols:
+                self.symbols[symbol] = {'status' : 'pending', 'page_token' : None, 'rows' : 0, 'checksum' : None}
+            self.save()
+            return batch_id
+
+    def unfinished_batches(self):
+        # batches that were interrupted or failed last time, with the page token to resume them from
+        return {batch_id : batch for batch_id, batch in self.batches.items() if batch['status'] != 'done'}
+
+    def restart_batch(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+            batch['page_token'] = None
+            batch['status'] = 'pending'
+            for symbol in batch['symbols']:
+                self.symbols[symbol] = {'status' : 'pending', 'page_token' : None, 'rows' : 0, 'checksum' : None}
+            self.save()
+
+    def page_done(self, batch_id, rows_per_symbol, next_page_token, output_dir_path):
+
+        ''' page_done()
+            description:
+                record that 1 page of a batch was written to disk
+            args:
+                batch_id - string - id from add_batch()
+                rows_per_symbol - dictionary - symbol -> number of rows of the page written for it
+                next_page_token - string or None - token of the next page of the batch
+                output_dir_path - string - directory of the csv files (to checksum completed symbols)
+            '''
+        with self.lock:
+            batch = self.batches[batch_id]
+            for symbol, rows in rows_per_symbol.items():
+                entry = self.symbols[symbol]
+                entry['rows'] += rows
+                entry['status'] = 'in_progress'
+                entry['page_token'] = next_page_token
+            if next_page_token == None:
+                completed = batch['symbols']
+                batch['status'] = 'done'
+            else:
+                last_symbol = max(rows_per_symbol) if len(rows_per_symbol) > 0 else ''
+                completed = [symbol for symbol in batch['symbols'] if symbol < last_symbol]
+            for symbol in completed:
+                entry = self.symbols[symbol]
+                if entry['status'] in ('done', 'no_data'):
+                    continue
+                if entry['rows'] == 0:
+                    entry['status'] = 'no_data'
+                else:
+                    entry['status'] = 'done'
+                    entry['checksum'] = file_checksum(os.path.join(output_dir_path, f'{symbol}.csv'))
+            batch['page_token'] = next_page_token
+            self.save()
+
+    def batch_failed(self, batch_id, error):
+        with self.lock:
+            batch = self.batches[batch_id]
+            batch['status'] = 'failed'
+            batch['error'] = error
+            for symbol in batch['symbols']:
+                if not self.is_complete(symbol):
+                    self.symbols[symbol]['status'] = 'failed'
+            self.save()
+
+    def verify(self, output_dir_path):
+        # symbols marked done whose csv is missing or changed since it was written
+        return [symbol for symbol, entry in self.symbols.items() if entry['status'] == 'done' and \
+            file_checksum(os.path.join(output_dir_path, f'{symbol}.csv')) != entry['checksum']]
@@ -0,0 +1,489 @@
+'''
+
+	Description:
+		exits managed on this computer instead of by Alpaca: stops, take profits, trailing stops,
+        time exits, OCO groups, and brackets, triggered by our own quote stream
+
+        each exit is a dictionary (an "exit spec"):
+            symbol          - string - ticker symbol
+            side            - string - 'sell' to exit a long position, 'buy' to exit a short position
+            qty             - float - number of shares to exit
+            type            - string - 'stop', 'take_profit', 'trailing_stop', or 'time'
+            stop_price      - float - stop: fires once the price gets to stop_price against the position
+            limit_price     - float - take_profit: fires once the price gets to limit_price in favor of the position
+            trail_price     - float - trailing_stop: dollars behind the best price since the exit was armed
+            trail_percent   - float - trailing_stop: or percent behind it (1.0 = 1 %)
+            expires_at      - datetime or epoch seconds - time: fires at this time
+            oco             - string - optional group, once 1 exit of the group fires the others are canceled
+            client_order_id - string - optional, of the exit order (a random 1 is made if it's missing)
+
+        when an exit fires, a market order of side and qty is submitted (see bulk_orders.py).
+        sells are triggered by the bid and buys by the ask
+
+        every symbol has a "trigger index": a sorted list of the trigger prices of its exits, 1 per side and direction
+        (ex: the sell stops fire when the bid falls to their trigger), so a quote bisects straight to the exits
+        it crosses, O(log n), and never looks at the others. trailing stops also sit in a heap by their
+        best price so far, and a quote only moves the triggers of the trailing stops it's a new best price for.
+        time exits are in a heap by expires_at, checked on every quote and every second by start()
+
+        example:
+            engine = ExitEngine(trading_client, listener, order_book=order_book)
+            engine.bracket({'symbol' : 'AAPL', 'side' : 'buy', 'qty' : 10}, limit_price=200, trail_percent=1.0)
+            wss_client.subscribe_quotes(engine.on_stream_quote, 'AAPL')
+
+	Sources:
+        https://docs.alpaca.markets/docs/orders-at-alpaca#bracket-orders
+        https://docs.alpaca.markets/docs/orders-at-alpaca#oco-orders
+        https://docs.alpaca.markets/docs/orders-at-alpaca#trailing-stop-orders
+        https://docs.python.org/3/library/bisect.html
+
+	'''
+
+# standard libraries
+import time
+import uuid
+import heapq
+import bisect
+import itertools
+import threading
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# non-standard libraries
+from rate_budget import RateBudget
+from trade_updates import event_name
+from bulk_orders import submit_order_spec
+
+
+EXIT_TYPES = ('stop', 'take_profit', 'trailing_stop', 'time')
+MAX_WORKERS = 16
+TIME_CHECK_INTERVAL = 1.0 # seconds
+
+def direction_of(exit):
+    # 'down' if the exit fires when the price falls to its trigger, 'up' if it fires when it rises to it
+    if exit['type'] == 'take_profit':
+        return 'up' if exit['side'] == 'sell' else 'down'
+    return 'down' if exit['side'] == 'sell' else 'up'
+
+def trailing_trigger(exit, best_price):
+    # trigger price of a trailing stop whose best price so far is best_price
+    sign = -1 if exit['side'] == 'sell' else 1
+    if exit.get('trail_price') != None:
+        return best_price + sign * float(exit['trail_price'])
+    return best_price * (1 + sign * float(exit['trail_percent']) / 100)
+
+def validate_exit_spec(exit):
+    # list of strings - what's wrong with an exit spec (empty if it's valid)
+    errors = []
+    if not exit.get('symbol'):
+        errors.append('missing symbol')
+    if exit.get('side') not in ('buy', 'sell'):
+        errors.append(f'invalid side: {exit.get("side")}')
+    if not (exit.get('qty') != None and float(exit['qty']) > 0):
+        errors.append(f'qty must be positive: {exit.get("qty")}')
+    exit_type = exit.get('type')
+    if exit_type not in EXIT_TYPES:
+        errors.append(f'invalid type: {exit_type}')
+    elif exit_type == 'stop' and exit.get('stop_price') == None:
+        errors.append('stop exits need a stop_price')
+    elif exit_type == 'take_profit' and exit.get('limit_price') == None:
+        errors.append('take_profit exits need a limit_price')
+    elif exit_type == 'trailing_stop' and (exit.get('trail_price') == None) == (exit.get('trail_percent') == None):
+        errors.append('trailing_stop exits need exactly 1 of trail_price or trail_percent')
+    elif exit_type == 'time' and exit.get('expires_at') == None:
+        errors.append('time exits need an expires_at')
+    return errors
+
+class ExitEngine:
+
+    def __init__(
+        self,
+        trading_client,
+        listener=None,
+        order_book=None,
+        budget=None,
+        tracer=None,
+        max_workers=MAX_WORKERS):
+
+        ''' ExitEngine()
+            args:
+                trading_client - alpaca.trading.client.TradingClient (or SimulatedBroker, see simulated_broker.py)
+                listener - TradeUpdateListener - needed to arm the exits of brackets when their entry fills (see trade_updates.py)
+                order_book - OrderBook - optional, to never exit more than the position (see order_book.py)
+                budget - RateBudget - shared API rate limit (see rate_budget.py)
+                tracer - OrderTracer - optional, to trace the exit orders (see order_tracing.py)
+                max_workers - int - number of exit orders in flight at once,
+                    0 to submit them in the thread of the quote (ex: to replay quotes on a SimulatedBroker)
+            '''
+        self.trading_client = trading_client
+        self.order_book = order_book
+        self.budget = budget if budget != None else RateBudget()
+        self.tracer = tracer
+        self.executor = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 0 else None
+        self.lock = threading.RLock()
+        self.exits = {} # exit id (client_order_id of its order) -> exit dictionary
+        self.oco_groups = {} # oco group -> set of the exit ids in it
+        self.triggers = {} # symbol -> {(side, direction) : sorted list of (trigger price, seq, exit id)}
+        self.trailing = {} # symbol -> {side : heap of (best price so far, negated for buys, seq, exit id)}
+        self.waiting_for_quote = {} # symbol -> list of trailing stop exit ids armed before its 1st quote
+        self.time_exits = [] # heap of (expires_at in epoch seconds, seq, exit id)
+        self.brackets = {} # client_order_id of an entry order -> exit specs to arm when it fills
+        self.quotes = {} # symbol -> (bid, ask)
+        self.seq = itertools.count()
+        self.num_quotes = 0
+        self.num_fired = 0
+        self.time_thread = None
+        self.stop_event = threading.Event()
+        if listener != None:
+            listener.subscribe(self.on_trade_update)
+
+    ####### arming #######
+
+    def arm(self, exit):
+
+        ''' arm()
+            description:
+                start watching an exit, it fires on a later quote (or time check)
+            args:
+                exit - dictionary - exit spec (see the description at the top of this file)
+            returns:
+                string - exit id, the client_order_id of the exit order once it fires
+            '''
+        errors = validate_exit_spec(exit)
+        if len(errors) > 0:
+            raise ValueError('; '.join(errors))
+        exit_id = exit.get('client_order_id') or str(uuid.uuid4())
+        exit = dict(exit, client_order_id=exit_id, status='armed', result=None, seq=next(self.seq))
+        with self.lock:
+            if exit_id in self.exits:
+                raise ValueError(f'duplicate client_order_id: {exit_id}')
+            self.exits[exit_id] = exit
+            if exit.get('oco') != None:
+                self.oco_groups.setdefault(exit['oco'], set()).add(exit_id)
+            if exit['type'] == 'time':
+                expires_at = exit['expires_at']
+                expires_at = expires_at.timestamp() if isinstance(expires_at, datetime) else float(expires_at)
+                heapq.heappush(self.time_exits, (expires_at, exit['seq'], exit_id))
+            elif exit['type'] == 'trailing_stop':
+                if exit['symbol'] in self.quotes:
+                    self.add_trailing(exit)
+                else:
+                    self.waiting_for_quote.setdefault(exit['symbol'], []).append(exit_id)
+            else:
+                self.index(exit, float(exit['stop_price'] if exit['type'] == 'stop' else exit['limit_price']))
+        return exit_id
+
+    def oco(self, exits, group=None):
+        # arm exits as 1 OCO group, returns their exit ids
+        group = group or str(uuid.uuid4())
+        return [self.arm(dict(exit, oco=group)) for exit in exits]
+
+    def bracket(self, entry_spec, stop_price=None, limit_price=None, trail_price=None, trail_percent=None, expires_at=None):
+
+        ''' bracket()
+            description:
+                submit an entry order, and once it fills arm its exits as 1 OCO group for the filled qty
+                (a partially filled entry that's canceled / expires arms them for what did fill)
+            args:
+                entry_spec - dictionary - order spec of the entry (see bulk_orders.py)
+                stop_price - float - optional stop
+                limit_price - float - optional take profit
+                trail_price - float - optional trailing stop in dollars
+                trail_percent - float - optional trailing stop in percent
+                expires_at - datetime or epoch seconds - optional time exit
+            returns:
+                dictionary - result of the entry order (see bulk_orders.py)
+            '''
+        side = 'sell' if entry_spec['side'] == 'buy' else 'buy'
+        exits = []
+        if stop_price != None:
+            exits.append({'type' : 'stop', 'stop_price' : stop_price})
+        if limit_price != None:
+            exits.append({'type' : 'take_profit', 'limit_price' : limit_price})
+        if trail_price != None or trail_percent != None:
+            exits.append({'type' : 'trailing_stop', 'trail_price' : trail_price, 'trail_percent' : trail_percent})
+        if expires_at != None:
+            exits.append({'type' : 'time', 'expires_at' : expires_at})
+        exits = [dict(exit, symbol=entry_spec['symbol'], side=side, qty=1) for exit in exits]
+        for exit in exits:
+            errors = validate_exit_spec(exit)
+            if len(errors) > 0:
+                raise ValueError('; '.join(errors))
+        client_order_id = entry_spec.get('client_order_id') or str(uuid.uuid4())
+        with self.lock:
+            self.brackets[client_order_id] = exits
+        result = submit_order_spec(self.trading_client, entry_spec, client_order_id, self.budget, self.tracer)
+        if result['status'] != 'submitted':
+            with self.lock:
+                self.brackets.pop(client_order_id, None)
+        return result
+
+    def cancel(self, exit_id):
+        # stop watching an exit, returns True if it was armed
+        with self.lock:
+            exit = self.exits.get(exit_id)
+            if exit == None or exit['status'] != 'armed':
+                return False
+            self.disarm(exit, 'canceled')
+            return True
+
+    def armed(self, symbol=None):
+        # exits still watched, of 1 symbol if symbol isn't None
+        with self.lock:
+            return [exit for exit in self.exits.values() \
+                if exit['status'] == 'armed' and (symbol == None or exit['symbol'] == symbol)]
+
+    ####### trigger index #######
+
+    def index(self, exit, trigger):
+        # caller must hold self.lock
+        entry = (trigger, exit['seq'], exit['client_order_id'])
+        exit['trigger'] = trigger
+        exit['index_entry'] = entry
+        triggers = self.triggers.setdefault(exit['symbol'], {})
+        bisect.insort(triggers.setdefault((exit['side'], direction_of(exit)), []), entry)
+
+    def unindex(self, exit):
+        # caller must hold self.lock
+        entry = exit.pop('index_entry', None)
+        if entry == None:
+            return
+        triggers = self.triggers[exit['symbol']][(exit['side'], direction_of(exit))]
+        i = bisect.bisect_left(triggers, entry)
+        if i < len(triggers) and triggers[i] == entry:
+            del triggers[i]
+
+    def add_trailing(self, exit):
+        # caller must hold self.lock
+        bid, ask = self.quotes[exit['symbol']]
+        best_price = bid if exit['side'] == 'sell' else ask
+        exit['best_price'] = best_price
+        heap = self.trailing.setdefault(exit['symbol'], {}).setdefault(exit['side'], [])
+        heapq.heappush(heap, (best_price if exit['side'] == 'sell' else -best_price, exit['seq'], exit['client_order_id']))
+        self.index(exit, trailing_trigger(exit, best_price))
+
+    def ratchet(self, symbol, side, price):
+        # caller must hold self.lock
+        # move the triggers of the trailing stops that price is a new best price for
+        # (highest bid since armed for sells, lowest ask for buys)
+        heap = self.trailing.get(symbol, {}).get(side)
+        if not heap:
+            return
+        key = price if side == 'sell' else -price
+        while len(heap) > 0 and heap[0][0] < key:
+            _, seq, exit_id = heapq.heappop(heap)
+            exit = self.exits[exit_id]
+            if exit['status'] != 'armed':
+                continue # fired or canceled since it was pushed
+            self.unindex(exit)
+            exit['best_price'] = price
+            self.index(exit, trailing_trigger(exit, price))
+            heapq.heappush(heap, (key, seq, exit_id))
+
+    def crossed(self, symbol, side, price):
+        # caller must hold self.lock
+        # pop the exit ids of side whose triggers price has crossed
+        triggers = self.triggers.get(symbol)
+        if triggers == None:
+            return []
+        fired = []
+        down = triggers.get((side, 'down'))
+        if down:
+            # fires when the price falls to the trigger: every trigger >= price
+            i = bisect.bisect_left(down, (price,))
+            fired += [entry[2] for entry in down[i:]]
+            del down[i:]
+        up = triggers.get((side, 'up'))
+        if up:
+            # fires when the price rises to the trigger: every trigger <= price
+            i = bisect.bisect_right(up, (price, float('inf')))
+            fired += [entry[2] for entry in up[:i]]
+            del up[:i]
+        return fired
+
+    ####### firing #######
+
+    def on_quote(self, symbol, bid, ask, timestamp=None):
+
+        ''' on_quote()
+            description:
+                fire the exits of symbol that a new quote triggers, and the time exits that are due
+            args:
+                symbol - string - ticker symbol
+                bid - float - bid price
+                ask - float - ask price
+                timestamp - datetime or epoch seconds - time of the quote (for time exits), defaults to now
+            returns:
+                list of strings - ids of the exits that fired
+            '''
+        bid, ask = float(bid), float(ask)
+        now = time.time() if timestamp == None else \
+            timestamp.timestamp() if isinstance(timestamp, datetime) else float(timestamp)
+        with self.lock:
+            self.num_quotes += 1
+            self.quotes[symbol] = (bid, ask)
+            for exit_id in self.waiting_for_quote.pop(symbol, []):
+                if self.exits[exit_id]['status'] == 'armed':
+                    self.add_trailing(self.exits[exit_id])
+            fired = []
+            if bid > 0:
+                self.ratchet(symbol, 'sell', bid)
+                fired += self.crossed(symbol, 'sell', bid)
+            if ask > 0:
+                self.ratchet(symbol, 'buy', ask)
+                fired += self.crossed(symbol, 'buy', ask)
+            fired += self.due(now)
+            fired = self.fire(fired)
+        self.submit(fired)
+        return [exit['client_order_id'] for exit in fired]
+
+    async def on_stream_quote(self, quote):
+        # quote handler for alpaca.data.live.StockDataStream.subscribe_quotes()
+        self.on_quote(quote.symbol, quote.bid_price, quote.ask_price, quote.timestamp)
+
+    def due(self, now):
+        # caller must hold self.lock
+        # pop the ids of the time exits due at now
+        exit_ids = []
+        while len(self.time_exits) > 0 and self.time_exits[0][0] <= now:
+            exit_ids.append(heapq.heappop(self.time_exits)[2])
+        return exit_ids
+
+    def check_time(self, now=None):
+        # fire the time exits that are due (now defaults to the current time)
+        with self.lock:
+            fired = self.fire(self.due(time.time() if now == None else now))
+        self.submit(fired)
+        return [exit['client_order_id'] for exit in fired]
+
+    def fire(self, exit_ids):
+        # caller must hold self.lock
+        # mark the exits as fired and cancel the rest of their OCO groups, returns the exits to submit
+        fired = []
+        for exit_id in exit_ids:
+            exit = self.exits[exit_id]
+            if exit['status'] != 'armed':
+                continue # canceled by an OCO sibling that fired on the same quote, or already popped
+            self.disarm(exit, 'fired')
+            self.num_fired += 1
+            fired.append(exit)
+        return fired
+
+    def disarm(self, exit, status):
+        # caller must hold self.lock
+        exit['status'] = status
+        exit['disarmed_at'] = time.time()
+        self.unindex(exit)
+        group = exit.get('oco')
+        if group != None:
+            exit_ids = self.oco_groups.pop(group, set())
+            for exit_id in exit_ids - {exit['client_order_id']}:
+                sibling = self.exits[exit_id]
+                if sibling['status'] == 'armed':
+                    sibling['status'] = 'canceled'
+                    sibling['disarmed_at'] = exit['disarmed_at']
+                    self.unindex(sibling)
+
+    def submit(self, exits):
+        # submit the market order of each fired exit (trailing stop and time heap entries are dropped lazily)
+        for exit in exits:
+            qty = float(exit['qty'])
+            if self.order_book != None:
+                # never exit more than is held, or exit a position that's already flat
+                position_qty = self.order_book.qty(exit['symbol'])
+                qty = min(qty, abs(position_qty)) if (position_qty > 0) == (exit['side'] == 'sell') else 0.0
+            if qty <= 0:
+                exit['result'] = {'status' : 'invalid', 'error' : f'no {exit["symbol"]} position to exit'}
+                continue
+            spec = {'symbol' : exit['symbol'], 'side' : exit['side'], 'qty' : qty, 'type' : 'market', 'time_in_force' : 'day'}
+            if self.executor == None:
+                self.submit_exit(exit, spec)
+            else:
+                self.executor.submit(self.submit_exit, exit, spec)
+
+    def submit_exit(self, exit, spec):
+        try:
+            exit['result'] = submit_order_spec(self.trading_client, spec, exit['client_order_id'], self.budget, self.tracer)
+            if exit['result']['status'] != 'submitted':
+                print(f'\nexit order to {spec["side"]} {spec["qty"]} {spec["symbol"]} failed: {exit["result"]["error"]}')
+        except Exception:
+            print(f'\nException in exit engine submit!!!')
+            print(f'{traceback.format_exc()}')
+
+    def on_trade_update(self, update):
+        # arm the exits of a bracket once its entry is done
+        event = event_name(update)
+        if event not in ('fill', 'canceled', 'expired', 'rejected', 'done_for_day'):
+            return
+        order = update.order
+        with self.lock:
+            exits = self.brackets.pop(str(order.client_order_id), None)
+        filled_qty = 0.0 if order.filled_qty == None else float(order.filled_qty)
+        if exits == None or filled_qty <= 0:
+            return
+        self.oco([dict(exit, qty=filled_qty) for exit in exits])
+
+    ####### time exits #######
+
+    def start(self, interval=TIME_CHECK_INTERVAL):
+        # check the time exits every interval seconds in a daemon thread (not for replayed quotes, whose time isn't now)
+        if self.time_thread != None:
+            return
+        def check_forever():
+            while not self.stop_event.wait(interval):
+                try:
+                    self.check_time()
+                except Exception:
+                    print(f'\nException in exit engine time check!!!')
+                    print(f'{traceback.format_exc()}')
+        self.time_thread = threading.Thread(target=check_forever, daemon=True)
+        self.time_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.time_thread != None:
+            self.time_thread.join()
+            self.time_thread = None
+        if self.executor != None:
+            self.executor.shutdown(wait=True)
+
+
+
+if __name__ == '__main__':
+
+    # benchmark: 10,000 armed exits on 100 symbols (a stop / take profit OCO pair and a trailing stop per position),
+    # fired by a random walk of quotes on a simulated broker (see simulated_broker.py)
+    import numpy as np
+    from trade_updates import TradeUpdateListener
+    from order_book import OrderBook
+    from simulated_broker import SimulatedBroker
+
+    listener = TradeUpdateListener()
+    broker = SimulatedBroker(cash=1e9, listener=listener)
+    order_book = OrderBook(broker, listener, reconcile_interval=None)
+    order_book.start()
+    engine = ExitEngine(broker, listener, budget=RateBudget(calls_per_minute=1e9), max_workers=0) # no rate limit offline
+    rng = np.random.default_rng(0)
+    symbols = [f'S{i}' for i in range(100)]
+    for symbol in symbols:
+        broker.set_quote(symbol, 99.99, 100.01)
+        engine.on_quote(symbol, 99.99, 100.01)
+        for i in range(33):
+            engine.bracket({'symbol' : symbol, 'side' : 'buy', 'qty' : 1},
+                stop_price=100 - rng.uniform(0.5, 5), limit_price=100 + rng.uniform(0.5, 5), trail_percent=rng.uniform(0.5, 5))
+    print(f'{len(engine.armed())} exits armed on {len(symbols)} symbols')
+    num_quotes = 100000
+    quote_symbols = rng.choice(symbols, num_quotes)
+    mids = {symbol : 100.0 for symbol in symbols}
+    steps = rng.normal(0, 0.05, num_quotes)
+    start_time = time.time()
+    for symbol, step in zip(quote_symbols, steps):
+        mids[symbol] += step
+        bid, ask = mids[symbol] - 0.01, mids[symbol] + 0.01
+        engine.on_quote(symbol, bid, ask)
+        broker.set_quote(symbol, bid, ask)
+    seconds = time.time() - start_time
+    print(f'{num_quotes} quotes in {"%.2f" % seconds} second(s) ({"%.1f" % (1e6 * seconds / num_quotes)} microseconds per quote ' + \
+        f'with the simulated broker), {engine.num_fired} exits fired, {len(engine.armed())} still armed')
+    print(f'positions left: {len(order_book.all_positions())}')
@@ -1,7 +1,8 @@
 import os, json, pathlib
 from datetime import datetime
-import requests
 from zoneinfo import ZoneInfo
+from account_activities import ActivityStore, sync_activities
+from activity_analysis import load_activity_columns, fees_by_period, borrow_cost_by_symbol
 
 '''
 
@@ -42,21 +43,21 @@ HEADERS = {
 }
 TIMEZONE = 'US/Eastern' # 'US/Pacific' # 'UTC'
 
-url = f"{ENDPOINT}/v2/account/activities"
+# the activities are synced into a local store (see account_activities.py), only what's new since the last run is downloaded
+# and every page is fetched (the endpoint returns at most 100 activities per request)
 # url = f"{ENDPOINT}/v2/account/activities?activity_types=FEE%2CINT%2CPTC%2CPTR?after=2024-02-26T00%3A00%3A00" # specify a list of activity types to filter by
 # url = f"{ENDPOINT}/v2/account/activities/after=2024-02-26T00%3A00%3A00"
-params = {
-    'activity_types': ['FEE', 'INT', 'PTC', 'PTR'],
-    'after': datetime(2024, 2, 26, tzinfo=ZoneInfo(TIMEZONE)).isoformat(),
-}
+activity_types = ['FEE', 'INT', 'PTC', 'PTR']
+after = datetime(2024, 2, 26, tzinfo=ZoneInfo(TIMEZONE)).isoformat() # only used by the 1st sync
 # error w/ datetime iso format: https://forum.alpaca.markets/t/what-is-the-correct-after-input-for-getorders/12021/2
 # resolved w/ specifying timezone
 
-response = requests.get(url, headers=HEADERS, params=params)
-# print(response.text)
-activities = json.loads(response.text)
-print(f'\n{len(activities)} activit{"y" if len(activities) == 1 else "ies"} found:\n')
-for activity in activities:
-    print(json.dumps(activity, indent=4))
-
-
+store = ActivityStore()
+sync_activities(store, ENDPOINT, HEADERS, activity_types=activity_types, after=after, verbose=True)
+columns = load_activity_columns(store, activity_types=activity_types, start=after[:10])
+print(f'\n{len(columns["date"])} activit{"y" if len(columns["date"]) == 1 else "ies"} found')
+print(f'\nmonthly fees and interest:\n{fees_by_period(columns, freq="M")}')
+print(f'\nborrow cost by symbol:\n{borrow_cost_by_symbol(columns)}')
+# to see each activity:
+# for activity in store.query(activity_types=activity_types, start=after[:10], columns=['raw'])['raw'].map(json.loads):
+#     print(json.dumps(activity, indent=4))
@@ -35,6 +35,8 @@ pd.set_option('display.max_columns', 10)
 from alpaca.trading.client import TradingClient
 from alpaca.trading.requests import GetAssetsRequest
 from alpaca.trading.enums import AssetClass, AssetStatus
+from asset_cache import AssetCache
+from asset_filter import filter_assets, US_EQUITY, ACTIVE, TRADABLE, MARGINABLE, SHORTABLE
 
 
 # API constants
@@ -74,36 +76,21 @@ trading_client = TradingClient(API_KEY, API_SECRET)
 search_params = GetAssetsRequest(asset_class=AssetClass.US_EQUITY)
 
 # https://alpaca.markets/sdks/python/api_reference/trading/assets.html
-assets = trading_client.get_all_assets(search_params)
-
-# print(type(assets)) # list
-print(f"found {len(assets)} assets(s)") # found 31024 asset(s)
-assets_to_save = []
-for i, asset in enumerate(assets):
-	# print(type(asset)) # alpaca.trading.models.Asset
-	# https://alpaca.markets/sdks/python/api_reference/trading/models.html
-
-	print(f'\nasset {i + 1} of {len(assets)}')
-	# print(f'name:\t\t{asset.name}')
-	# print(f'symbol:\t\t{asset.symbol}')
-	# print(f'asset_class:\t{asset.asset_class}')
-	# print(f'status:\t\t{asset.status}')
-	# print(f'tradable:\t{asset.tradable}')
-	# print(f'marginable:\t{asset.marginable}')
-	# print(f'shortable:\t{asset.shortable}')
-	# print(f'fractionable:\t{asset.fractionable}')
-	# print(f'alpaca uuid:\t{asset.id}')
-
-	if \
-		asset.asset_class == AssetClass.US_EQUITY and \
-		asset.status == AssetStatus.ACTIVE and \
-		asset.tradable and \
-		asset.marginable and \
-		asset.shortable:# and \
-		# asset.fractionable:
-
-		assets_to_save.append(asset.symbol)
-assets_to_save = sorted(assets_to_save)
+# the list is only downloaded again once the copy in data/asset_cache is older than a day (see asset_cache.py)
+asset_cache = AssetCache(trading_client)
+asset_cache.refresh(verbose=True)
+
+# the assets are already loaded into columns, filter them all at once (see asset_filter.py)
+universe = asset_cache.frame()
+print(f"found {len(universe)} assets(s)") # found 31024 asset(s)
+shortable_stocks = filter_assets(universe,
+	US_EQUITY & \
+	ACTIVE & \
+	TRADABLE & \
+	MARGINABLE & \
+	SHORTABLE)# & \
+	# FRACTIONABLE)
+assets_to_save = sorted(shortable_stocks['symbol'].tolist())
 
 filename = "all_shortable_alpaca_stocks.csv"
 # filename = "all_fractional_and_non_fractionable_alpaca_stocks.csv"
@@ -29,12 +29,17 @@ DATA_PATH = os.path.join(REPO_PATH, "data", "price_data")
 
 # non-standard libraries
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 pd.set_option('display.max_columns', 10)
 pd.set_option('display.width', 1000)
 from alpaca.trading.client import TradingClient
 from alpaca.trading.requests import GetAssetsRequest
 from alpaca.trading.enums import AssetClass
+from bar_pager import iter_bar_pages, concat_chunks, REORDERED_COLUMNS
+from bar_cache import BarCache
+from bar_store import build_bar_store_from_cache
+from asset_cache import AssetCache
 
 
 # API constants
@@ -51,6 +56,7 @@ HEADERS = {
 }
 
 trading_client = TradingClient(API_KEY, API_SECRET)
+asset_cache = AssetCache(trading_client) # see asset_cache.py
 
 
 input_filename = "all_shortable_alpaca_stocks.csv"
@@ -67,40 +73,16 @@ start_date = (now - timedelta(days=365)).strftime('%Y-%m-%d') # one year ago
 interval = '1Day' # see here for valid intervals: https://docs.alpaca.markets/reference/stockbars
 exchange = 'iex' # 'sip'
 def get_price_history(ticker):
-    url = f"https://data.alpaca.markets/v2/stocks/bars?symbols={ticker}&timeframe={interval}&start={start_date}&end={end_date}&limit=1000&adjustment=all&feed={exchange}&sort=asc"
-    response = requests.get(url, headers=HEADERS)
-    # NOTE: if you request more than 1000 data points (in total, not per symbol), you'll have to concatinate paginated responses
-    data = json.loads(response.text)
-    # print(json.dumps(data, indent=4))
-    if "bars" not in data.keys() or ticker not in data["bars"].keys():
+    # pages through the whole date range (the old version requested limit=1000 and ignored next_page_token,
+    # so longer ranges / intraday intervals were silently cut off)
+    chunks = [chunk[ticker] for chunk, _ in iter_bar_pages(
+        ticker, start_date, end_date, interval, HEADERS, adjustment='all', feed=exchange) if ticker in chunk]
+    if len(chunks) == 0:
         print(f"no price data found for {ticker}")
         return None
-    df = pd.DataFrame(data['bars'][ticker])
-    # i asked in alpaca's slack what "n" stands for and their AI said
-    # "number of trades that occurred during the bar's time period"
-    # and it said "vw" was "volume-weighted average price of the stock during the bar's time period."
-    # https://alpaca-community.slack.com/archives/CEL9HCSN4/p1704602713177009
-    df.rename(columns={
-         'c' : "close",
-         'h' : "high",
-         'l' : "low",
-         'n' : "number_of_trades",
-         'o' : "open",
-         't' : "time",
-         'v' : "volume",
-         'vw' : "volumn_weighted_average_price"
-    }, inplace=True)
-    reordered_columns = [
-         "time",
-         "open",
-         "high",
-         "low",
-         "close",
-         "number_of_trades",
-         "volume",
-         "volumn_weighted_average_price"
-    ]
-    df = df[reordered_columns]
+    # see bar_pager.COLUMN_NAMES for what each column stands for
+    df = pd.DataFrame(concat_chunks(chunks))[REORDERED_COLUMNS]
+    df['time'] = np.datetime_as_string(df['time'].values, unit='s', timezone='UTC') # same format as the API, ex: 2024-01-02T05:00:00Z
     return df
 
 ''' get_ohlcv_candle_history()
@@ -164,56 +146,29 @@ def get_ohlcv_candle_history(self, symbol, start_date, end_date, candle_interval
         print('invalid candle interval')
         sys.exit()
     exchange = 'sip' # sip is free for the datafeed, but not for trading
-    df = None
-    next_page_token = ''
-    while next_page_token != None:
-        start_date_str = start_date.strftime('%Y-%m-%d')
-        end_date_str = end_date.strftime('%Y-%m-%d') # NOTE: end date is inclusive
-        url = f"https://data.alpaca.markets/v2/stocks/bars?symbols={symbol}&timeframe={api_interval_str}&start={start_date_str}&end={end_date_str}&limit=1000&adjustment=split&feed={exchange}&page_token={next_page_token}&sort=asc"
-        response = requests.get(url, headers=self.headers)
-        # NOTE: if you request more than 1000 ohlcv rows (rows aka candles) (1000 in total, not per symbol), you'll have to concatinate paginated responses
-        time.sleep(1)
-        data = json.loads(response.text)
-        # print(json.dumps(data, indent=4))
-        if "bars" not in data.keys() or symbol not in data["bars"].keys():
-            print(f"            no price data found for {symbol} between {start_date_str} and {end_date_str}")
-            return None
-        df = pd.concat([df, pd.DataFrame(data['bars'][symbol])])
-        next_page_token = data['next_page_token']
-        # print(pd.DataFrame(data['bars'][symbol]))
-        # print('next_page_token', next_page_token)
-        # input()
-    # i asked in alpaca's slack what "n" stands for and their AI said
-    # "number of trades that occurred during the bar's time period"
-    # and it said "vw" was "volume-weighted average price of the stock during the bar's time period."
-    # https://alpaca-community.slack.com/archives/CEL9HCSN4/p1704602713177009
-    df.rename(columns={
-        'c' : "close",
-        'h' : "high",
-        'l' : "low",
-        # 'n' : "number_of_trades", # NOTE: excluded to match return columns of SchwabExchange.get_ohlcv_candle_history
-        'o' : "open",
-        't' : "time",
-        'v' : "volume",
-        # 'vw' : "volumn_weighted_average_price" # NOTE: excluded to match return columns of SchwabExchange.get_ohlcv_candle_history
-    }, inplace=True)
+    start_date_str = start_date.strftime('%Y-%m-%d')
+    end_date_str = end_date.strftime('%Y-%m-%d') # NOTE: end date is inclusive
+    # pages are collected as numpy columns and joined once at the end
+    # (instead of pd.concat-ing a DataFrame and sleeping 1 second after every page)
+    chunks = [chunk[symbol] for chunk, _ in iter_bar_pages(
+        symbol, start_date_str, end_date_str, api_interval_str, self.headers, adjustment='split', feed=exchange) if symbol in chunk]
+    if len(chunks) == 0:
+        print(f"            no price data found for {symbol} between {start_date_str} and {end_date_str}")
+        return None
+    # see bar_pager.COLUMN_NAMES for what each column stands for
     reordered_columns = [
         "time",
         "open",
         "high",
         "low",
         "close",
-        # "number_of_trades",
+        # "number_of_trades", # NOTE: excluded to match return columns of SchwabExchange.get_ohlcv_candle_history
         "volume",
-        # "volumn_weighted_average_price"
+        # "volumn_weighted_average_price" # NOTE: excluded to match return columns of SchwabExchange.get_ohlcv_candle_history
     ]
-    df = df[reordered_columns]
+    df = pd.DataFrame(concat_chunks(chunks))[reordered_columns]
     stock_market_timezone = 'America/New_York'
-    df['time'] = pd.to_datetime(
-        df['time'],
-        format='%Y-%m-%dT%H:%M:%SZ',
-        errors='coerce',
-        utc=True).dt.tz_convert(stock_market_timezone) # convert string to datetime
+    df['time'] = pd.to_datetime(df['time'], utc=True).dt.tz_convert(stock_market_timezone)
     # print(df)
     return df
 
@@ -221,17 +176,32 @@ def get_ohlcv_candle_history(self, symbol, start_date, end_date, candle_interval
 
 if __name__ == '__main__':
 
-    output_dir_name = f"price_data_for_1_year_on_daily_intervals_from_{start_date}_to_{end_date}_of_shortable_alpaca_stocks"
-    output_dir_path = os.path.join(DATA_PATH, output_dir_name)
-    if not os.path.exists(output_dir_path):
-        os.makedirs(output_dir_path)
-
-    for i, row in df0.iterrows():
-        # if i < 1975: continue # for testing purposes only, also this script sometimes gets stuck
-        ticker = row['ticker']
-        print(f"ticker {i + 1} of {df0.shape[0]}: {ticker}")
-        df = get_price_history(ticker)
-        if isinstance(df, pd.DataFrame):
-            df.to_csv(os.path.join(output_dir_path, f"{ticker}.csv"), index=False)
-        time.sleep(1)
-
+    # bars are kept in data/bar_cache (see bar_cache.py) so each run only downloads
+    # the days that aren't cached yet instead of re-downloading the whole year
+    # skip tickers in the csv that aren't on Alpaca anymore (looked up in the cached list of assets)
+    tickers = asset_cache.get_many(df0['ticker'].tolist())['symbol'].tolist()
+    bar_cache = BarCache(HEADERS, feed=exchange)
+    bar_cache.update(
+        tickers,
+        start_date,
+        end_date,
+        interval,
+        adjustment='all',
+        verbose=True)
+
+    # pack every ticker's bars into memory mapped columns for cross sectional scans (see bar_store.py)
+    build_bar_store_from_cache(bar_cache, tickers, interval, adjustment='all', verbose=True)
+
+    # # to save 1 csv per ticker instead, see get_price_history_in_bulk.py
+    # from get_price_history_in_bulk import download_price_history_in_bulk
+    # output_dir_name = f"price_data_for_1_year_on_daily_intervals_from_{start_date}_to_{end_date}_of_shortable_alpaca_stocks"
+    # output_dir_path = os.path.join(DATA_PATH, output_dir_name)
+    # download_price_history_in_bulk(
+    #     df0['ticker'].tolist(),
+    #     start_date,
+    #     end_date,
+    #     output_dir_path,
+    #     HEADERS,
+    #     interval=interval,
+    #     adjustment='all',
+    #     exchange=exchange)
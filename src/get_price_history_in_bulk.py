@@ -0,0 +1,254 @@
+'''
+
+	Description:
+		pipeline to get price history of many US equities on Alpaca at once
+        by putting many ticker symbols in each request to the stocks/bars endpoint
+        (it accepts a comma separated list of symbols) and querying the pages of
+        different batches of symbols concurrently within the API rate limit
+
+        each page is written to disk as soon as it arrives (1 csv per ticker)
+        so the whole universe never has to fit in memory
+
+        progress is checkpointed after every page (see download_manifest.py),
+        so if the download dies halfway through, running it again resumes it
+
+	Sources:
+        https://docs.alpaca.markets/reference/stockbars
+		https://docs.alpaca.markets/docs/market-data-faq
+
+	'''
+
+# standard libraries
+import os
+import json
+import sys
+import time
+import threading
+import pathlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+REPO_PATH = str(pathlib.Path(__file__).resolve().parent.parent)
+DATA_PATH = os.path.join(REPO_PATH, "data", "price_data")
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+import requests
+from rate_budget import RateBudget
+from bar_pager import iter_bar_pages
+from download_manifest import DownloadManifest
+
+
+SYMBOLS_PER_REQUEST = 100 # more symbols per request = fewer requests, but keep the url a reasonable length
+MANIFEST_FILENAME = 'manifest.json'
+
+def write_bars_to_csv(ticker, columns, output_dir_path):
+    # append 1 page worth of bars for 1 ticker to its csv
+    # the header is only written when the file is created
+    filepath = os.path.join(output_dir_path, f"{ticker}.csv")
+    df = pd.DataFrame(columns)
+    df['time'] = np.datetime_as_string(columns['time'], unit='s', timezone='UTC') # same format as the API, ex: 2024-01-02T05:00:00Z
+    df.to_csv(filepath, mode='a', header=not os.path.exists(filepath), index=False)
+
+def truncate_csv(filepath, rows):
+    # drop rows written after the last checkpoint (they'll be downloaded again)
+    # returns False if the file has fewer rows than the checkpoint says it should
+    if rows == 0:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return True
+    if not os.path.exists(filepath):
+        return False
+    df = pd.read_csv(filepath, nrows=rows)
+    if df.shape[0] < rows:
+        return False
+    df.to_csv(filepath, index=False)
+    return True
+
+def download_batch(
+    batch_id,
+    tickers,
+    page_token,
+    output_dir_path,
+    params,
+    headers,
+    budget,
+    session,
+    manifest):
+
+    ''' download every page for 1 batch of tickers, starting at page_token
+        pages of the same batch have to be queried one after another (each page gives the token for the next one)
+        the manifest is updated after each page is written
+        returns number of requests made
+        '''
+    num_requests = 0
+    for chunk, next_page_token in iter_bar_pages(
+        tickers, headers=headers, budget=budget, session=session, page_token=page_token, **params):
+        num_requests += 1
+        for ticker, columns in chunk.items():
+            write_bars_to_csv(ticker, columns, output_dir_path)
+        manifest.page_done(
+            batch_id,
+            {ticker : len(columns['time']) for ticker, columns in chunk.items()},
+            next_page_token,
+            output_dir_path)
+    return num_requests
+
+def download_price_history_in_bulk(
+    tickers,
+    start_date,
+    end_date,
+    output_dir_path,
+    headers,
+    interval='1Day',
+    adjustment='all',
+    exchange='iex',
+    symbols_per_request=SYMBOLS_PER_REQUEST,
+    max_workers=4,
+    budget=None,
+    resume=True,
+    verbose=True):
+
+    ''' download_price_history_in_bulk()
+        description:
+            get price history of every ticker in tickers and save it to 1 csv per ticker in output_dir_path
+            progress is checkpointed to output_dir_path/manifest.json (see download_manifest.py),
+            running it again with the same args only downloads what didn't finish (or failed) last time
+        args:
+            tickers - list of strings - ticker symbols to get price history of
+            start_date - string - YYYY-MM-DD
+            end_date - string - YYYY-MM-DD
+            output_dir_path - string - directory the csv files are written to
+            headers - dictionary - API key headers
+            interval - string - see here for valid intervals: https://docs.alpaca.markets/reference/stockbars
+            adjustment - string - 'raw', 'split', 'dividend', or 'all'
+            exchange - string - 'iex' or 'sip'
+            symbols_per_request - int - number of ticker symbols put in each request
+            max_workers - int - number of batches queried at the same time
+            budget - RateBudget - shared API rate limit, a new one is made if None
+            resume - boolean - continue from the manifest of a previous run, if False start over
+        returns:
+            dictionary with:
+                tickers_found - list of tickers that had price data
+                tickers_not_found - list of tickers that didn't have price data
+                tickers_failed - list of tickers that failed to download (run again to retry them)
+                num_requests - number of API requests made
+                seconds - how long it took
+                symbols_per_second - number of tickers downloaded per second
+        '''
+    if budget == None:
+        budget = RateBudget()
+    if not os.path.exists(output_dir_path):
+        os.makedirs(output_dir_path)
+    tickers = sorted(set(tickers))
+    params = {
+        'start'      : start_date,
+        'end'        : end_date,
+        'timeframe'  : interval,
+        'adjustment' : adjustment,
+        'feed'       : exchange,
+    }
+    manifest_filepath = os.path.join(output_dir_path, MANIFEST_FILENAME)
+    if not resume and os.path.exists(manifest_filepath):
+        os.remove(manifest_filepath)
+    manifest = DownloadManifest(manifest_filepath, params)
+
+    # batches interrupted last time continue from their last page token
+    # (after dropping any rows written after the last checkpoint)
+    jobs = []
+    for batch_id, batch in manifest.unfinished_batches().items():
+        for ticker in batch['symbols']:
+            if manifest.is_complete(ticker):
+                continue
+            if not truncate_csv(os.path.join(output_dir_path, f"{ticker}.csv"), manifest.symbols[ticker]['rows']):
+                for ticker in batch['symbols']:
+                    truncate_csv(os.path.join(output_dir_path, f"{ticker}.csv"), 0)
+                manifest.restart_batch(batch_id)
+                break
+        jobs.append((batch_id, batch['symbols'], manifest.batches[batch_id]['page_token']))
+
+    # tickers not downloaded yet (or whose csv changed since it was downloaded) go in new batches
+    redownload = set(manifest.verify(output_dir_path))
+    new_tickers = [ticker for ticker in tickers if ticker not in manifest.symbols or ticker in redownload]
+    for ticker in new_tickers:
+        # remove csv files from a previous run so pages aren't appended twice
+        truncate_csv(os.path.join(output_dir_path, f"{ticker}.csv"), 0)
+    for i in range(0, len(new_tickers), symbols_per_request):
+        batch = new_tickers[i:i + symbols_per_request]
+        jobs.append((manifest.add_batch(batch), batch, None))
+    num_skipped = sum(manifest.is_complete(ticker) for ticker in tickers)
+    if verbose and num_skipped > 0:
+        print(f"resuming: {num_skipped} of {len(tickers)} ticker(s) already downloaded, {len(jobs)} batch(es) left")
+
+    num_requests = 0
+    num_done = 0
+    start_time = time.time()
+    # 1 session per thread so each thread reuses its own connection
+    thread_local = threading.local()
+    def run_batch(batch_id, batch, page_token):
+        if not hasattr(thread_local, 'session'):
+            thread_local.session = requests.Session()
+        try:
+            return download_batch(batch_id, batch, page_token, output_dir_path, params, headers, budget, thread_local.session, manifest)
+        except Exception as e:
+            # the rest of the batches keep going, this 1 is retried next run
+            manifest.batch_failed(batch_id, repr(e))
+            if verbose:
+                print(f"batch {batch_id} failed: {repr(e)}")
+            return 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_batch, *job) : job[1] for job in jobs}
+        for i, future in enumerate(as_completed(futures)):
+            num_requests += future.result()
+            num_done += len(futures[future])
+            if verbose:
+                seconds = time.time() - start_time
+                print(f"batch {i + 1} of {len(jobs)} finished: {num_done} ticker(s) in {'%.1f' % seconds} second(s) ({'%.2f' % (num_done / seconds)} symbols/sec), {num_requests} request(s) used")
+    seconds = time.time() - start_time
+    statuses = {ticker : manifest.symbols[ticker]['status'] for ticker in tickers}
+    report = {
+        'tickers_found'      : [ticker for ticker, status in statuses.items() if status == 'done'],
+        'tickers_not_found'  : [ticker for ticker, status in statuses.items() if status == 'no_data'],
+        'tickers_failed'     : [ticker for ticker, status in statuses.items() if status not in ('done', 'no_data')],
+        'num_requests'       : num_requests,
+        'seconds'            : seconds,
+        'symbols_per_second' : num_done / seconds if seconds > 0 else float('inf'),
+    }
+    if verbose:
+        print(f"\ndownloaded price history of {len(report['tickers_found'])} of {len(tickers)} ticker(s) in {'%.1f' % seconds} second(s)")
+        print(f"{'%.2f' % report['symbols_per_second']} symbols/sec, {num_requests} request(s) used")
+        if len(report['tickers_not_found']) > 0:
+            print(f"no price data found for {len(report['tickers_not_found'])} ticker(s)")
+        if len(report['tickers_failed']) > 0:
+            print(f"{len(report['tickers_failed'])} ticker(s) failed, run again to retry them")
+    return report
+
+
+
+if __name__ == '__main__':
+
+    # API constants
+    LIVE_TRADING = False
+    with open('credentials.json') as f:
+        creds = json.load(f)
+    API_KEY    = creds['live_trading' if LIVE_TRADING else 'paper_trading']['API_KEY_ID']
+    API_SECRET = creds['live_trading' if LIVE_TRADING else 'paper_trading']['SECRET_KEY']
+    HEADERS = {
+        "accept": "application/json",
+        "APCA-API-KEY-ID": API_KEY,
+        "APCA-API-SECRET-KEY": API_SECRET
+    }
+
+    input_filename = "all_shortable_alpaca_stocks.csv"
+    tickers = pd.read_csv(os.path.join(REPO_PATH, "data", "ticker_data", input_filename))['ticker'].tolist()
+
+    now = datetime.now()
+    end_date = now.strftime('%Y-%m-%d')
+    start_date = (now - timedelta(days=365)).strftime('%Y-%m-%d') # one year ago
+    output_dir_name = f"price_data_for_1_year_on_daily_intervals_from_{start_date}_to_{end_date}_of_shortable_alpaca_stocks"
+    download_price_history_in_bulk(
+        tickers,
+        start_date,
+        end_date,
+        os.path.join(DATA_PATH, output_dir_name),
+        HEADERS)
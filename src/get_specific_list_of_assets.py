@@ -6,6 +6,9 @@
         get list of assets instead of just one
         FAILED TO DO THIS :(
         i had to just get all the assets though and filter for the list i need in one api call
+
+        now the list of all assets is cached on disk (see asset_cache.py),
+        so getting a list of assets is a few dictionary lookups and only downloads the list once a day
 	
 	sources:
 	
@@ -35,6 +38,7 @@ DATA_PATH = os.path.join(REPO_PATH, "data", "ticker_data")
 from alpaca.trading.client import TradingClient
 from alpaca.trading.requests import GetAssetsRequest
 from alpaca.trading.enums import AssetClass
+from asset_cache import AssetCache
 
 
 # API constants
@@ -51,12 +55,9 @@ trading_client = TradingClient(API_KEY, API_SECRET)
 # search for stock assets
 # https://alpaca.markets/sdks/python/api_reference/trading/assets.html
 assets_to_get = ['AAPL', 'JNJ', 'CVX']
-search_params = GetAssetsRequest(asset_class=AssetClass.US_EQUITY)
-assets = {asset.symbol : asset for asset in \
-    trading_client.get_all_assets(search_params)}
-for symbol in assets_to_get:
-	asset = assets[symbol]
-	print(asset)
+asset_cache = AssetCache(trading_client, asset_class=AssetClass.US_EQUITY)
+assets = asset_cache.get_many(assets_to_get)
+print(assets)
 
 
 # # THIS FAILED
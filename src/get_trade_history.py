@@ -9,14 +9,14 @@
             ctrl f "get_stock_trades"
         https://alpaca.markets/sdks/python/api_reference/data/stock/requests.html#alpaca.data.requests.StockTradesRequest
         https://alpaca.markets/sdks/python/api_reference/data/enums.html#alpaca.data.enums.DataFeed
+        https://docs.alpaca.markets/reference/stocktrades
 
 '''
 
 import json
-from datetime import datetime, timedelta
-from alpaca.data.requests import StockTradesRequest
-from alpaca.data.enums import DataFeed
-from alpaca.data import StockHistoricalDataClient
+from datetime import datetime, timedelta, timezone
+from tick_store import TickStore
+from trade_downloader import download_trades
 
 
 # Alpaca API Constants
@@ -34,48 +34,28 @@ HEADERS = {
     "APCA-API-SECRET-KEY": API_SECRET,
 }
 
-data_client = StockHistoricalDataClient(API_KEY, API_SECRET)
-
 
+# the window is split into 1 hour chunks that are downloaded in parallel into the tick store (see trade_downloader.py),
+# instead of 1 data_client.get_stock_trades() call that turns every trade into a model object,
+# and only what isn't in the store yet is downloaded
 tickers = ["AAPL"]
-end_time = datetime.now()
+end_time = datetime.now(timezone.utc)
 start_time = end_time - timedelta(hours=1)
-request_params = StockTradesRequest(
-    symbol_or_symbols=tickers, # must be a list, see NOTE below for why
-    start=start_time,
-    end=end_time,
-    feed=DataFeed.IEX)
-all_trades = data_client.get_stock_trades(request_params)
-# print(type(all_trades)) # <class 'alpaca.data.models.trades.TradeSet'>
-print()
-print('%d ticker symbol(s):' % len(tickers))
+store = TickStore(feed='iex')
+report, stats = download_trades(tickers, start_time, end_time, headers=HEADERS, store=store, feed='iex', verbose=True)
+print(f'\n{report}\n')
 for symbol in tickers:
-    try:
-        trades = all_trades.data[symbol]
-        num_trades = len(trades)
-    except KeyError:
-        num_trades = 0
-    print(f'    found {num_trades} trade(s) for ticker: {symbol}')
-    if num_trades > 0:
-        for i, trade in enumerate(trades):
-            print(f'        trade {i + 1} of {len(trades)}:')
-            print(f'            {trade.symbol}') # str
-            print(f'            {trade.timestamp}') # datetime
-            print(f'            {trade.exchange}') # Optional[Union[Exchange, str]]
-            print(f'            {trade.price}') # float
-            print(f'            {trade.size}') # float
-            print(f'            {trade.id}') # int
-            print(f'            {trade.conditions}') # Optional[List[str]]
-            print(f'            {trade.tape}') # Optional[str]
-            # source: file at:
-            # /home/luke/rooms/money/exchanges_and_data_sources/exchanges/alpaca/alpaca-algo-trading-utils/src/virt_env/lib/python3.11/site-packages/alpaca/data/models/trades.py
+    df = store.frame(symbol, start_time, end_time) # columns: time, price, size, exchange, id, conditions, tape
+    print(f'{len(df)} trade(s) for ticker: {symbol}')
+    if len(df) > 0:
+        print(df)
 print()
 
 
 
 
 
-''' NOTE:
+''' NOTE (from when this script used data_client.get_stock_trades()):
 
 idk why but symbol_or_symbols needs to be a list of strings instead of just a string.
 the docs say it can also be just a string but when setting it to for example "AAPL"
@@ -0,0 +1,255 @@
+'''
+
+	Description:
+		local copy of the account's open orders and positions, kept up to date by the trade_updates stream
+        (see trade_updates.py), so a strategy can read them without a REST request each time
+
+        1. subscribe to the trade update listener, then seed the book with get_orders() (1 request per page of
+           500 orders, see get_all_orders()) and 1 get_all_positions()
+           (updates that arrive meanwhile are held and applied after, so none are lost)
+        2. each trade update then changes the book:
+            new, accepted, pending_*, partial_fill, restated - the order is (still) open, its latest state is saved
+            fill, canceled, expired, rejected, replaced      - the order is removed from the open orders
+            fill, partial_fill                               - the position of the symbol is set to position_qty
+                                                               of the update (so applying an update twice is harmless)
+           or seed it with an account snapshot (see account_snapshot.py) fetched with the other startup requests,
+           then the updates received since the snapshot was requested are replayed on top of it
+        3. every reconcile_interval seconds the book is compared to REST and replaced with it,
+           in case an update was missed (ex: the websocket reconnected), the differences found are counted
+
+        positions are dictionaries:
+            symbol          - ticker symbol
+            qty             - number of shares, negative for short positions
+            avg_entry_price - average entry price of the shares held
+            updated_at      - epoch seconds of the last change
+
+	Sources:
+        https://docs.alpaca.markets/docs/websocket-streaming#trade-updates
+        https://alpaca.markets/sdks/python/api_reference/trading/models.html#alpaca.trading.models.TradeUpdate
+
+	'''
+
+# standard libraries
+import time
+import threading
+from datetime import timedelta
+import traceback
+from collections import deque
+
+# non-standard libraries
+from alpaca.trading.requests import GetOrdersRequest
+from alpaca.trading.enums import QueryOrderStatus
+from alpaca.common.enums import Sort
+from rate_budget import RateBudget
+from trade_updates import event_name, DONE_EVENTS
+
+
+RECONCILE_INTERVAL = 60.0 # seconds
+QTY_TOLERANCE = 1e-9 # fractional shares
+RECENT_UPDATES = 10000 # kept to replay on top of a snapshot
+MAX_ORDERS_PER_PAGE = 500 # max "limit" of get_orders()
+
+def get_all_orders(trading_client, budget, status=QueryOrderStatus.OPEN, limit=MAX_ORDERS_PER_PAGE):
+    # every order with status, get_orders() returns at most limit orders so they're paged from newest to oldest
+    # with "until" (exclusive), set just after the oldest order of the last page in case other orders were submitted
+    # at the same time as it (the orders seen twice are skipped)
+    orders = {} # order id -> alpaca.trading.models.Order
+    until = None
+    while True:
+        page = budget.call(trading_client.get_orders,
+            filter=GetOrdersRequest(status=status, limit=limit, until=until, direction=Sort.DESC))
+        num_new_orders = 0
+        for order in page:
+            if str(order.id) not in orders:
+                orders[str(order.id)] = order
+                num_new_orders += 1
+        if len(page) < limit:
+            break
+        if num_new_orders == 0:
+            print(f'WARNING: {limit} or more orders were submitted at {until}, only {len(orders)} order(s) were gotten')
+            break
+        until = min(order.submitted_at or order.created_at for order in page) + timedelta(microseconds=1)
+    return list(orders.values())
+
+def position_from_rest(position):
+    # alpaca.trading.models.Position -> position dictionary
+    qty = abs(float(position.qty))
+    return {
+        'symbol'          : position.symbol,
+        'qty'             : -qty if getattr(position.side, 'value', position.side) == 'short' else qty,
+        'avg_entry_price' : float(position.avg_entry_price),
+        'updated_at'      : time.time(),
+    }
+
+def apply_fill(position, side, fill_qty, fill_price, position_qty=None):
+    # position dictionary after a fill (a new dictionary, position isn't modified)
+    old_qty = position['qty']
+    signed_fill_qty = fill_qty if side == 'buy' else -fill_qty
+    new_qty = position_qty if position_qty != None else old_qty + signed_fill_qty
+    if abs(new_qty) < QTY_TOLERANCE:
+        avg_entry_price = 0.0
+    elif old_qty * new_qty < 0 or abs(old_qty) < QTY_TOLERANCE:
+        # opened or flipped to the other side, every share held was bought at the fill price
+        avg_entry_price = fill_price
+    elif abs(new_qty) > abs(old_qty):
+        # added to the position
+        avg_entry_price = (abs(old_qty) * position['avg_entry_price'] + (abs(new_qty) - abs(old_qty)) * fill_price) / abs(new_qty)
+    else:
+        # reduced the position, the entry price of what's left doesn't change
+        avg_entry_price = position['avg_entry_price']
+    return {
+        'symbol'          : position['symbol'],
+        'qty'             : new_qty,
+        'avg_entry_price' : avg_entry_price,
+        'updated_at'      : time.time(),
+    }
+
+class OrderBook:
+
+    def __init__(self, trading_client, listener, budget=None, reconcile_interval=RECONCILE_INTERVAL):
+
+        ''' OrderBook()
+            args:
+                trading_client - alpaca.trading.client.TradingClient - to seed and reconcile the book
+                listener - TradeUpdateListener - started listener of the trade_updates stream (see trade_updates.py)
+                budget - RateBudget - shared API rate limit (see rate_budget.py)
+                reconcile_interval - float - seconds between reconciles with REST (None to never reconcile)
+            '''
+        self.trading_client = trading_client
+        self.budget = budget if budget != None else RateBudget()
+        self.reconcile_interval = reconcile_interval
+        self.lock = threading.RLock()
+        self.orders = {} # order id -> alpaca.trading.models.Order of every open order
+        self.positions = {} # symbol -> position dictionary
+        self.seeding = False
+        self.held_updates = []
+        self.recent_updates = deque(maxlen=RECENT_UPDATES) # (epoch seconds received, update)
+        self.num_updates = 0
+        self.num_reconciles = 0
+        self.num_differences = 0 # found by reconcile()
+        self.reconcile_thread = None
+        self.stop_event = threading.Event()
+        listener.subscribe(self.on_trade_update)
+
+    ####### reading #######
+
+    def position(self, symbol):
+        # position dictionary of symbol, or None if there's no position
+        return self.positions.get(symbol)
+
+    def qty(self, symbol):
+        # number of shares held of symbol (negative if short, 0 if none)
+        position = self.positions.get(symbol)
+        return 0.0 if position == None else position['qty']
+
+    def all_positions(self):
+        with self.lock:
+            return list(self.positions.values())
+
+    def open_orders(self, symbol=None):
+        # open orders (alpaca.trading.models.Order), of 1 symbol if symbol isn't None
+        with self.lock:
+            return [order for order in self.orders.values() if symbol == None or order.symbol == symbol]
+
+    def open_order_ids(self, symbol=None):
+        return [order.id for order in self.open_orders(symbol)]
+
+    ####### updating #######
+
+    def fetch(self, snapshot=None):
+        # (open orders, positions) from REST, or from an AccountSnapshot (see account_snapshot.py)
+        if snapshot != None:
+            orders, positions = snapshot.orders, snapshot.positions
+        else:
+            orders = get_all_orders(self.trading_client, self.budget)
+            positions = self.budget.call(self.trading_client.get_all_positions)
+        return {str(order.id) : order for order in orders}, \
+            {position.symbol : position_from_rest(position) for position in positions}
+
+    def on_trade_update(self, update):
+        with self.lock:
+            self.recent_updates.append((time.time(), update))
+            if self.seeding:
+                self.held_updates.append(update)
+                return
+            self.apply(update)
+
+    def apply(self, update, fetched_at=None):
+        # caller must hold self.lock
+        # fetched_at - epoch seconds the REST snapshot was requested, when replaying updates held during it
+        event = event_name(update)
+        order = update.order
+        order_id = str(order.id)
+        self.num_updates += 1
+        if event in DONE_EVENTS:
+            self.orders.pop(order_id, None)
+        elif fetched_at != None and order_id not in self.orders and \
+            update.timestamp != None and update.timestamp.timestamp() < fetched_at:
+            # older than the snapshot, which already says the order isn't open anymore
+            pass
+        else:
+            self.orders[order_id] = order
+        if event in ('fill', 'partial_fill') and update.qty != None and update.price != None:
+            symbol = order.symbol
+            position = self.positions.get(symbol, {'symbol' : symbol, 'qty' : 0.0, 'avg_entry_price' : 0.0})
+            position = apply_fill(
+                position,
+                getattr(order.side, 'value', order.side),
+                float(update.qty),
+                float(update.price),
+                position_qty=None if update.position_qty == None else float(update.position_qty))
+            if abs(position['qty']) < QTY_TOLERANCE:
+                self.positions.pop(symbol, None)
+            else:
+                self.positions[symbol] = position
+
+    def reconcile(self, verbose=False, snapshot=None):
+        # replace the book with REST (or snapshot), returns the number of orders and positions that were different
+        # updates that come in while REST is queried are held and applied after, so none are lost
+        with self.lock:
+            self.seeding = True
+        fetched_at = time.time() if snapshot == None else snapshot.requested_at
+        try:
+            orders, positions = self.fetch(snapshot)
+        finally:
+            with self.lock:
+                self.seeding = False
+                held_updates, self.held_updates = self.held_updates, []
+                if snapshot != None:
+                    # the held updates are in recent_updates too
+                    held_updates = [update for received_at, update in self.recent_updates if received_at >= fetched_at]
+        with self.lock:
+            differences = len(set(orders) ^ set(self.orders))
+            for symbol in set(positions) | set(self.positions):
+                if abs(positions.get(symbol, {'qty' : 0.0})['qty'] - self.qty(symbol)) > QTY_TOLERANCE:
+                    differences += 1
+            self.orders, self.positions = orders, positions
+            for update in held_updates:
+                self.apply(update, fetched_at)
+            self.num_reconciles += 1
+            if self.num_reconciles > 1: # the 1st is the seed
+                self.num_differences += differences
+        if verbose and self.num_reconciles > 1 and differences > 0:
+            print(f'order book was off by {differences} order(s) / position(s), replaced it with REST')
+        return differences
+
+    def start(self, snapshot=None):
+        # seed the book (from snapshot if it isn't None), and reconcile it in a daemon thread every reconcile_interval seconds
+        self.reconcile(snapshot=snapshot)
+        if self.reconcile_interval == None or self.reconcile_thread != None:
+            return
+        def reconcile_forever():
+            while not self.stop_event.wait(self.reconcile_interval):
+                try:
+                    self.reconcile(verbose=True)
+                except Exception:
+                    print(f'\nException in order book reconcile!!!')
+                    print(f'{traceback.format_exc()}')
+        self.reconcile_thread = threading.Thread(target=reconcile_forever, daemon=True)
+        self.reconcile_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.reconcile_thread != None:
+            self.reconcile_thread.join()
+            self.reconcile_thread = None
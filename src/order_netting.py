@@ -0,0 +1,382 @@
+'''
+
+	Description:
+		nets the orders a strategy wants ("intents") per symbol over a short window before anything is sent,
+        so a burst of adjustments to 1 symbol costs 1 API call instead of 1 submit_order() each
+
+        an intent is an order spec (see bulk_orders.py) with a qty (notional intents can't be netted),
+        ex: buy 10 AAPL, then 1 ms later sell 4 AAPL, then buy 2 AAPL at a limit of 190.00
+
+        the 1st intent of a symbol opens its window, and when window seconds have passed every intent of the symbol
+        in it is netted into 1 signed qty (the last intent sets the type, limit_price, and time_in_force), and then:
+            net qty is 0, no working order                           - nothing is sent
+            no working order                                         - 1 submit_order()
+            unfilled working limit order on the same side, and the
+            last intent is a limit order with a whole number of shares - 1 replace_order_by_id() with the new qty and limit_price
+            working order that can't be replaced                     - cancel_order_by_id(), then once the order is done
+                                                                       (the trade_updates stream says so, or get_order_by_id()
+                                                                       after cancel_timeout seconds), 1 submit_order() of
+                                                                       what's left of it at its final filled_qty + the net qty
+                                                                       (if not 0). it can keep filling until the cancel goes thru,
+                                                                       so if it still isn't done only the net qty is submitted
+        the "working order" of a symbol is the last order sent by the netter that the trade_updates stream
+        (see trade_updates.py) hasn't said is done. if it fills before it can be replaced / canceled,
+        only the net qty is submitted
+
+        metrics() counts the intents, the API calls sent for them, and the calls saved (intents - calls)
+
+	Sources:
+        https://alpaca.markets/sdks/python/api_reference/trading/orders.html#replace-order-by-id
+        https://docs.alpaca.markets/docs/orders-at-alpaca#replacing-orders
+
+	'''
+
+# standard libraries
+import time
+import uuid
+import heapq
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# non-standard libraries
+from alpaca.trading.requests import ReplaceOrderRequest
+from rate_budget import RateBudget
+from trade_updates import event_name, DONE_EVENTS
+from bulk_orders import validate_order_spec, submit_order_spec, is_fractional
+
+
+WINDOW = 0.005 # seconds
+MAX_WORKERS = 16
+MAX_DONE_ORDER_IDS = 10000
+CANCEL_TIMEOUT = 2.0 # seconds to wait for the stream to confirm a cancel before asking the API
+QTY_TOLERANCE = 1e-9 # fractional shares
+DONE_STATUSES = ('filled', 'canceled', 'expired', 'rejected', 'replaced', 'done_for_day')
+
+class OrderNetter:
+
+    def __init__(
+        self,
+        trading_client,
+        listener=None,
+        budget=None,
+        tracer=None,
+        window=WINDOW,
+        max_workers=MAX_WORKERS,
+        cancel_timeout=CANCEL_TIMEOUT):
+
+        ''' OrderNetter()
+            args:
+                trading_client - alpaca.trading.client.TradingClient (or SimulatedBroker, see simulated_broker.py)
+                listener - TradeUpdateListener - to know when a working order is done (see trade_updates.py),
+                    without it working orders are only found to be done when replacing / canceling them fails
+                budget - RateBudget - shared API rate limit (see rate_budget.py)
+                tracer - OrderTracer - optional, to trace the orders submitted (see order_tracing.py)
+                window - float - seconds to collect the intents of a symbol before netting them
+                max_workers - int - number of symbols sent at once
+                cancel_timeout - float - seconds to wait for the stream to confirm a canceled working order is done
+            '''
+        self.trading_client = trading_client
+        self.listener = listener
+        self.budget = budget if budget != None else RateBudget()
+        self.tracer = tracer
+        self.window = window
+        self.max_workers = max_workers
+        self.cancel_timeout = cancel_timeout
+        self.condition = threading.Condition()
+        self.pending = {} # symbol -> netted intent of its open window
+        self.deadlines = [] # heap of (epoch seconds a window closes, symbol)
+        self.working = {} # symbol -> working order dictionary
+        self.done_order_ids = {} # id -> final filled_qty of the latest orders the stream said are done
+        self.symbol_locks = {} # symbol -> lock held while its netted intent is sent
+        self.results = [] # 1 dictionary per netted window (see flush_symbol)
+        self.counts = {'intents' : 0, 'windows' : 0, 'netted_to_zero' : 0, 'api_calls' : 0, 'submits' : 0, 'replaces' : 0, 'cancels' : 0, 'errors' : 0}
+        self.thread = None
+        self.executor = None
+        self.stopped = False
+        if listener != None:
+            listener.subscribe(self.on_trade_update)
+
+    ####### intents #######
+
+    def submit(self, spec):
+
+        ''' submit()
+            description:
+                add an intent to the open window of its symbol (opening 1 if there isn't 1)
+            args:
+                spec - dictionary - order spec with a qty (see bulk_orders.py)
+            '''
+        errors = validate_order_spec(spec)
+        if spec.get('qty') == None:
+            errors.append('intents need a qty, notional orders cannot be netted')
+        if len(errors) > 0:
+            raise ValueError('; '.join(errors))
+        signed_qty = float(spec['qty']) if spec['side'] == 'buy' else -float(spec['qty'])
+        with self.condition:
+            self.counts['intents'] += 1
+            intent = self.pending.get(spec['symbol'])
+            if intent == None:
+                intent = {'symbol' : spec['symbol'], 'qty' : 0.0, 'num_intents' : 0, 'opened_at' : time.time()}
+                self.pending[spec['symbol']] = intent
+                heapq.heappush(self.deadlines, (intent['opened_at'] + self.window, spec['symbol']))
+                self.condition.notify()
+            intent['qty'] += signed_qty
+            intent['num_intents'] += 1
+            intent['type'] = spec.get('type', 'market')
+            intent['limit_price'] = spec.get('limit_price')
+            intent['time_in_force'] = spec.get('time_in_force', 'day')
+            intent['extended_hours'] = spec.get('extended_hours')
+
+    def flush(self, symbol=None):
+        # net and send the open windows now (of 1 symbol if symbol isn't None), in this thread
+        with self.condition:
+            symbols = list(self.pending) if symbol == None else [symbol] if symbol in self.pending else []
+            intents = [self.pending.pop(symbol) for symbol in symbols]
+        return [self.flush_symbol(intent) for intent in intents]
+
+    ####### sending #######
+
+    def flush_symbol(self, intent):
+
+        ''' flush_symbol()
+            description:
+                send the netted intent of 1 symbol (see the description at the top of this file)
+            args:
+                intent - dictionary - netted intent, popped from self.pending
+            returns:
+                dictionary - symbol, num_intents, net_qty, action ('none', 'submit', 'replace', 'cancel', 'cancel+submit'),
+                    api_calls, order (alpaca.trading.models.Order sent or replaced, if any), error (None if it worked)
+            '''
+        symbol = intent['symbol']
+        with self.condition:
+            lock = self.symbol_locks.setdefault(symbol, threading.Lock())
+        with lock:
+            result = {
+                'symbol'      : symbol,
+                'num_intents' : intent['num_intents'],
+                'net_qty'     : intent['qty'],
+                'action'      : 'none',
+                'api_calls'   : 0,
+                'order'       : None,
+                'error'       : None,
+            }
+            with self.condition:
+                working = self.working.get(symbol)
+            net_qty = intent['qty']
+            if working != None:
+                # only the unfilled part of the working order is still open
+                remaining_qty = working['qty'] - (1.0 if working['qty'] > 0 else -1.0) * working['filled_qty']
+                combined_qty = remaining_qty + net_qty
+                if abs(combined_qty) > QTY_TOLERANCE and self.can_replace(working, intent, combined_qty):
+                    result['action'] = 'replace'
+                    result['api_calls'] += 1
+                    try:
+                        self.replace(working, intent, combined_qty, result)
+                        return self.record(result)
+                    except Exception as e:
+                        # the working order filled / was canceled first, so only the new intents are left to send
+                        result['error'] = str(e)
+                        with self.condition:
+                            if self.working.get(symbol) is working:
+                                del self.working[symbol]
+                else:
+                    result['action'] = 'cancel'
+                    result['api_calls'] += 1
+                    try:
+                        self.budget.call(self.trading_client.cancel_order_by_id, working['order_id'])
+                        with self.condition:
+                            self.counts['cancels'] += 1
+                    except Exception as e:
+                        # it's done already (ex: filled), what it filled is still needed below
+                        result['error'] = str(e)
+                    # the order fills until the cancel goes thru, so what's left of it is only known once it's done
+                    filled_qty = self.final_filled_qty(working, result)
+                    if filled_qty != None:
+                        net_qty = working['qty'] - (1.0 if working['qty'] > 0 else -1.0) * filled_qty + net_qty
+                    else:
+                        result['error'] = f'{working["order_id"]} isn\'t done yet, only the net qty is submitted'
+                    with self.condition:
+                        if self.working.get(symbol) is working:
+                            del self.working[symbol]
+            if abs(net_qty) > QTY_TOLERANCE:
+                result['action'] = 'submit' if result['action'] == 'none' else f'{result["action"]}+submit'
+                result['api_calls'] += 1
+                self.send(symbol, net_qty, intent, result)
+            return self.record(result)
+
+    def final_filled_qty(self, working, result):
+        # filled_qty of a working order once it's done (from the stream, or get_order_by_id() if it doesn't say so in time),
+        # None if it still isn't done
+        order_id = working['order_id']
+        if self.listener != None:
+            with self.condition:
+                if self.condition.wait_for(lambda : order_id in self.done_order_ids, timeout=self.cancel_timeout):
+                    return self.done_order_ids[order_id]
+        result['api_calls'] += 1
+        try:
+            order = self.budget.call(self.trading_client.get_order_by_id, order_id)
+        except Exception as e:
+            result['error'] = str(e)
+            return None
+        if getattr(order.status, 'value', order.status) not in DONE_STATUSES:
+            return None
+        return float(order.filled_qty or 0.0)
+
+    def can_replace(self, working, intent, combined_qty):
+        # Alpaca can't change the side, type, or filled part of an order, and replaces whole numbers of shares
+        return working['type'] == 'limit' and intent['type'] == 'limit' and \
+            working['filled_qty'] == 0 and (working['qty'] > 0) == (combined_qty > 0) and \
+            not is_fractional(abs(combined_qty)) and intent['time_in_force'] == working['time_in_force']
+
+    def replace(self, working, intent, combined_qty, result):
+        client_order_id = str(uuid.uuid4())
+        order = self.budget.call(self.trading_client.replace_order_by_id, working['order_id'], ReplaceOrderRequest(
+            qty=int(round(abs(combined_qty))),
+            limit_price=intent['limit_price'],
+            client_order_id=client_order_id))
+        with self.condition:
+            self.counts['replaces'] += 1
+            if str(order.id) not in self.done_order_ids:
+                self.working[intent['symbol']] = dict(working,
+                    order_id=str(order.id), client_order_id=client_order_id, qty=combined_qty, limit_price=intent['limit_price'])
+            elif self.working.get(intent['symbol']) is working:
+                del self.working[intent['symbol']]
+        result['order'] = order
+
+    def send(self, symbol, net_qty, intent, result):
+        spec = {
+            'symbol'         : symbol,
+            'side'           : 'buy' if net_qty > 0 else 'sell',
+            'qty'            : abs(net_qty),
+            'type'           : intent['type'],
+            'limit_price'    : intent['limit_price'],
+            'time_in_force'  : intent['time_in_force'],
+            'extended_hours' : intent['extended_hours'],
+        }
+        submitted = submit_order_spec(self.trading_client, spec, str(uuid.uuid4()), self.budget, self.tracer)
+        result['order'] = submitted['order']
+        if submitted['status'] != 'submitted':
+            result['error'] = submitted['error']
+            return
+        with self.condition:
+            self.counts['submits'] += 1
+            # the stream can say the order is done before the response to submit_order() comes back
+            if getattr(submitted['order'].status, 'value', submitted['order'].status) not in DONE_STATUSES and \
+                str(submitted['order'].id) not in self.done_order_ids:
+                self.working[symbol] = {
+                    'order_id'        : str(submitted['order'].id),
+                    'client_order_id' : submitted['client_order_id'],
+                    'qty'             : net_qty,
+                    'filled_qty'      : 0.0,
+                    'type'            : intent['type'],
+                    'limit_price'     : intent['limit_price'],
+                    'time_in_force'   : intent['time_in_force'],
+                }
+
+    def record(self, result):
+        with self.condition:
+            self.counts['windows'] += 1
+            self.counts['api_calls'] += result['api_calls']
+            if result['api_calls'] == 0:
+                self.counts['netted_to_zero'] += 1
+            if result['error'] != None:
+                self.counts['errors'] += 1
+            self.results.append(result)
+        return result
+
+    def on_trade_update(self, update):
+        # forget working orders once they're done, and note partial fills (which can't be replaced)
+        event = event_name(update)
+        order = update.order
+        with self.condition:
+            if event in DONE_EVENTS:
+                if len(self.done_order_ids) >= MAX_DONE_ORDER_IDS:
+                    self.done_order_ids.pop(next(iter(self.done_order_ids)))
+                self.done_order_ids[str(order.id)] = float(order.filled_qty or 0.0)
+                self.condition.notify_all() # a flush can be waiting for a canceled order to be done
+            working = self.working.get(order.symbol)
+            if working == None or working['order_id'] != str(order.id):
+                return
+            if event in DONE_EVENTS:
+                del self.working[order.symbol]
+            elif event == 'partial_fill' and order.filled_qty != None:
+                working['filled_qty'] = float(order.filled_qty)
+
+    def metrics(self):
+        # counts of intents, windows, and API calls, and the calls saved by netting
+        with self.condition:
+            counts = dict(self.counts)
+        counts['api_calls_saved'] = counts['intents'] - counts['api_calls']
+        return counts
+
+    ####### background thread #######
+
+    def start(self):
+        # send each window when it closes from a daemon thread, symbols are sent from a pool of max_workers threads
+        if self.thread != None:
+            return
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        def flush_forever():
+            with self.condition:
+                while not self.stopped:
+                    if len(self.deadlines) == 0:
+                        self.condition.wait()
+                        continue
+                    wait = self.deadlines[0][0] - time.time()
+                    if wait > 0:
+                        self.condition.wait(wait)
+                        continue
+                    _, symbol = heapq.heappop(self.deadlines)
+                    intent = self.pending.pop(symbol, None) # None if it was flushed already
+                    if intent != None:
+                        self.executor.submit(self.flush_in_background, intent)
+        self.thread = threading.Thread(target=flush_forever, daemon=True)
+        self.thread.start()
+
+    def flush_in_background(self, intent):
+        try:
+            self.flush_symbol(intent)
+        except Exception:
+            print(f'\nException in order netter flush!!!')
+            print(f'{traceback.format_exc()}')
+
+    def stop(self):
+        # send what's left, then stop the background thread
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+            self.executor.shutdown(wait=True)
+        self.flush()
+
+
+
+if __name__ == '__main__':
+
+    # a working limit buy of 10 that's 6 filled, netted with 1 more share to buy, is canceled,
+    # and what's left of it + 1 is submitted. 2 more shares fill after the partial_fill update
+    # and before the cancel goes thru, so what's left is 10 - 8 = 2 (not 4), and 3 shares are submitted
+    from simulated_broker import SimulatedBroker
+    from trade_updates import TradeUpdateListener
+    broker = SimulatedBroker()
+    listener = TradeUpdateListener()
+    broker.listener = listener
+    broker.set_quote('AAPL', 100.00, 100.10)
+    netter = OrderNetter(broker, listener, budget=RateBudget(calls_per_minute=1e9))
+    netter.submit({'symbol' : 'AAPL', 'side' : 'buy', 'qty' : 10, 'type' : 'limit', 'limit_price' : 99.00})
+    working_order_id = str(netter.flush()[0]['order'].id)
+    with broker.lock:
+        # the simulated broker fills whole orders, so the partial fills are made by hand
+        # (the order stays open, so it can still be canceled)
+        order = broker.orders[working_order_id]
+        order['filled_qty'] = 6.0
+        broker.send_update('partial_fill', order, price=99.00, qty=6.0, position_qty=6.0)
+        order['filled_qty'] = 8.0 # its update is still on the way when the cancel is sent
+    netter.submit({'symbol' : 'AAPL', 'side' : 'buy', 'qty' : 1, 'type' : 'limit', 'limit_price' : 99.00})
+    result = netter.flush()[0]
+    print(f'{result["action"]}: {result["order"].side.value} {result["order"].qty} shares')
+    assert result['action'] == 'cancel+submit' and float(result['order'].qty) == 3.0, result
+    print(netter.metrics())
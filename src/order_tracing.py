@@ -0,0 +1,174 @@
+'''
+
+	Description:
+		measures how long each stage of an order's life takes:
+            submit -> ack (REST response) -> pending_new / accepted / new -> partial_fill -> fill
+
+        the time each order was sent and acknowledged is recorded by whatever submits it (see bulk_orders.py),
+        and the trade_updates stream (see trade_updates.py) gives the time of every other stage.
+        the 2 are joined by client_order_id, and the 1st time an order reaches each stage is its "mark".
+        once both marks of a stage (see STAGES) are known, 1 latency sample is recorded with:
+            client_order_id
+            symbol
+            order_type      - 'market', 'limit', ...
+            side            - 'buy' or 'sell'
+            hour            - hour of the day in New York when the order was sent (0 - 23)
+            stage           - ex: 'submit->fill'
+            latency         - seconds
+            stream_delay    - seconds from the broker's timestamp of the update to receiving it
+                              (NaN for stages that don't end in a stream update). includes clock skew
+                              between this computer and Alpaca, so it's only useful to compare over time
+
+        summary() and histograms() group the samples by any of symbol, order_type, side, hour, and stage,
+        and export() saves them to a csv for analysis
+
+        all times are time.time() of this computer, so the stages measure
+        our own overhead + the network + Alpaca, as seen from here
+
+	Sources:
+        https://docs.alpaca.markets/docs/websocket-streaming#trade-updates
+        https://docs.alpaca.markets/docs/orders-at-alpaca#order-lifecycle
+
+	'''
+
+# standard libraries
+import os
+import time
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from trade_updates import event_name
+
+
+STOCK_MARKET_TIMEZONE = 'America/New_York'
+STAGES = [
+    ('submit', 'ack'),
+    ('submit', 'pending_new'),
+    ('submit', 'accepted'),
+    ('submit', 'new'),
+    ('new', 'partial_fill'),
+    ('new', 'fill'),
+    ('submit', 'fill'),
+    ('submit', 'canceled'),
+]
+SAMPLE_COLUMNS = ['client_order_id', 'symbol', 'order_type', 'side', 'hour', 'stage', 'latency', 'stream_delay']
+LATENCY_BINS = np.logspace(-3, 2, 51) # 1 ms to 100 s
+
+class OrderTracer:
+
+    def __init__(self, listener=None, max_open_traces=100000):
+        # listener - TradeUpdateListener - the tracer subscribes to its updates (see trade_updates.py)
+        self.lock = threading.Lock()
+        self.traces = {} # client_order_id -> {'info' : dictionary, 'marks' : {mark : time}, 'delays' : {mark : seconds}, 'recorded' : set of stages}
+        self.samples = []
+        self.max_open_traces = max_open_traces
+        if listener != None:
+            listener.subscribe(self.on_trade_update)
+
+    def trace(self, client_order_id):
+        # caller must hold self.lock
+        trace = self.traces.get(client_order_id)
+        if trace == None:
+            if len(self.traces) >= self.max_open_traces:
+                # forget the oldest trace (dictionaries keep insertion order)
+                self.traces.pop(next(iter(self.traces)))
+            trace = {'info' : {}, 'marks' : {}, 'delays' : {}, 'recorded' : set()}
+            self.traces[client_order_id] = trace
+        return trace
+
+    def mark(self, client_order_id, mark, at, info=None, delay=np.nan):
+        # record the 1st time an order reached a stage, and any stage that's now complete
+        with self.lock:
+            trace = self.trace(client_order_id)
+            if info != None:
+                for key, value in info.items():
+                    trace['info'].setdefault(key, value)
+            if mark not in trace['marks']:
+                trace['marks'][mark] = at
+                trace['delays'][mark] = delay
+            info = trace['info']
+            if 'symbol' not in info:
+                return # not enough known about the order yet to file its samples
+            for start, end in STAGES:
+                stage = f'{start}->{end}'
+                if stage in trace['recorded'] or start not in trace['marks'] or end not in trace['marks']:
+                    continue
+                trace['recorded'].add(stage)
+                self.samples.append((
+                    client_order_id,
+                    info['symbol'],
+                    info.get('order_type'),
+                    info.get('side'),
+                    info.get('hour'),
+                    stage,
+                    trace['marks'][end] - trace['marks'][start],
+                    trace['delays'][end],
+                ))
+
+    def record_submit(self, client_order_id, symbol, order_type, side, submitted_at, acked_at=None):
+
+        ''' record_submit()
+            description:
+                record when an order was sent, and when the REST response came back
+            args:
+                client_order_id - string - client_order_id sent with the order
+                symbol - string - ticker symbol
+                order_type - string - 'market', 'limit', ...
+                side - string - 'buy' or 'sell'
+                submitted_at - float - epoch seconds the request was sent
+                acked_at - float - epoch seconds the response was received (None if it failed)
+            '''
+        info = {
+            'symbol'     : symbol,
+            'order_type' : order_type,
+            'side'       : side,
+            'hour'       : datetime.fromtimestamp(submitted_at, ZoneInfo(STOCK_MARKET_TIMEZONE)).hour,
+        }
+        self.mark(client_order_id, 'submit', submitted_at, info)
+        if acked_at != None:
+            self.mark(client_order_id, 'ack', acked_at)
+
+    def on_trade_update(self, update):
+        received_at = time.time()
+        order = update.order
+        if order.client_order_id == None:
+            return
+        delay = np.nan if update.timestamp == None else received_at - update.timestamp.timestamp()
+        info = {
+            'symbol'     : order.symbol,
+            'order_type' : getattr(order.order_type or order.type, 'value', order.order_type or order.type),
+            'side'       : getattr(order.side, 'value', order.side),
+        }
+        # the hour comes from record_submit(), orders submitted elsewhere use the hour of their 1st update
+        if order.submitted_at != None:
+            info['hour'] = order.submitted_at.astimezone(ZoneInfo(STOCK_MARKET_TIMEZONE)).hour
+        self.mark(str(order.client_order_id), event_name(update), received_at, info, delay)
+
+    def frame(self):
+        # every latency sample as a pandas dataframe with SAMPLE_COLUMNS
+        with self.lock:
+            return pd.DataFrame(self.samples, columns=SAMPLE_COLUMNS)
+
+    def summary(self, by=('stage', 'order_type')):
+        # count, mean, and percentiles of latency, grouped by the columns in by
+        df = self.frame()
+        return df.groupby(list(by))['latency'].describe(percentiles=[0.5, 0.9, 0.99])
+
+    def histograms(self, by=('stage', 'order_type'), bins=LATENCY_BINS):
+        # latency histogram of each group: dictionary - group -> numpy array of counts per bin of bins
+        df = self.frame()
+        return {group : np.histogram(latency.to_numpy(), bins=bins)[0] \
+            for group, latency in df.groupby(list(by))['latency']}
+
+    def export(self, filepath, clear=False):
+        # append the samples to a csv, and forget them if clear is True
+        df = self.frame()
+        df.to_csv(filepath, mode='a', index=False, header=not os.path.exists(filepath))
+        if clear:
+            with self.lock:
+                self.samples = self.samples[len(df):]
+        return df
@@ -1,7 +1,20 @@
-import json, time
+import os, json, time
 from alpaca.trading.client import TradingClient
-from alpaca.trading.requests import MarketOrderRequest, LimitOrderRequest, GetOrdersRequest
-from alpaca.trading.enums import OrderSide, TimeInForce, QueryOrderStatus, OrderType
+from alpaca.trading.enums import OrderType
+from rate_budget import RateBudget
+from bulk_orders import submit_orders_in_bulk
+from alpaca.trading.stream import TradingStream
+from trade_updates import TradeUpdateListener
+from order_book import OrderBook
+from order_tracing import OrderTracer
+from pre_trade_risk import PreTradeRisk
+from asset_cache import AssetCache, ASSET_CACHE_PATH
+from close_and_cancel import close_positions_in_parallel, cancel_orders_in_parallel, cancel_all_orders_and_confirm
+from simulated_broker import SimulatedBroker
+from exit_engine import ExitEngine
+from order_netting import OrderNetter
+from pnl_engine import PnLEngine
+from account_snapshot import fetch_account_snapshot
 
 
 '''
@@ -32,12 +45,113 @@ from alpaca.trading.enums import OrderSide, TimeInForce, QueryOrderStatus, Order
 
 # API constants
 LIVE_TRADING = False
+SIMULATED = False # True to place orders on a local simulated broker instead of Alpaca (see simulated_broker.py)
 with open('credentials.json') as f:
 	creds = json.load(f)
 ENDPOINT   = creds['live_trading' if LIVE_TRADING else 'paper_trading']['ENDPOINT']
 API_KEY    = creds['live_trading' if LIVE_TRADING else 'paper_trading']['API_KEY_ID']
 API_SECRET = creds['live_trading' if LIVE_TRADING else 'paper_trading']['SECRET_KEY']
-trading_client = TradingClient(API_KEY, API_SECRET, paper=not LIVE_TRADING)
+trading_client = TradingClient(API_KEY, API_SECRET, paper=not LIVE_TRADING) if not SIMULATED else \
+    SimulatedBroker() # orders fill on quotes given with trading_client.set_quote() / trading_client.replay()
+budget = RateBudget() # shared by every call made from more than 1 thread
+trade_update_listener = None
+def get_trade_update_listener():
+    # the trade_updates stream is only connected the 1st time something needs to wait for an order (see trade_updates.py)
+    global trade_update_listener
+    if trade_update_listener == None:
+        if SIMULATED:
+            trade_update_listener = TradeUpdateListener() # fed by the simulated broker
+            trading_client.listener = trade_update_listener
+        else:
+            trade_update_listener = TradeUpdateListener(TradingStream(API_KEY, API_SECRET, paper=not LIVE_TRADING))
+            trade_update_listener.start()
+    return trade_update_listener
+order_tracer = None
+def get_order_tracer():
+    # latency of each stage of every order placed from here (see order_tracing.py)
+    # ex: print(get_order_tracer().summary()), get_order_tracer().export('order_latency.csv')
+    global order_tracer
+    if order_tracer == None:
+        order_tracer = OrderTracer(get_trade_update_listener())
+    return order_tracer
+order_book = None
+def get_order_book():
+    # local open orders and positions kept current by the trade_updates stream (see order_book.py)
+    # ex: get_order_book().qty('AAPL'), get_order_book().open_orders('AAPL')
+    global order_book
+    if order_book == None:
+        order_book = OrderBook(trading_client, get_trade_update_listener(), budget=budget)
+        order_book.start()
+    return order_book
+asset_cache = None
+def get_asset_cache():
+    # shortable / easy_to_borrow / fractionable flags of every asset (see asset_cache.py)
+    # when SIMULATED they're the simulated broker's assets (no API calls), in their own directory
+    # and reloaded on every refresh since a new symbol is added with each 1st quote of it
+    global asset_cache
+    if asset_cache == None:
+        if SIMULATED:
+            asset_cache = AssetCache(trading_client, cache_path=os.path.join(ASSET_CACHE_PATH, 'simulated'), ttl=0, budget=budget)
+        else:
+            asset_cache = AssetCache(trading_client, budget=budget)
+    return asset_cache
+pre_trade_risk = None
+def get_pre_trade_risk():
+    # buying power, exposure, PDT, and shortability checks done locally before each order (see pre_trade_risk.py)
+    global pre_trade_risk
+    if pre_trade_risk == None:
+        pre_trade_risk = PreTradeRisk(trading_client, get_order_book(), listener=get_trade_update_listener(),
+            asset_cache=get_asset_cache(), budget=budget)
+        pre_trade_risk.start()
+    return pre_trade_risk
+exit_engine = None
+def get_exit_engine():
+    # stops, take profits, trailing stops, time exits, OCO groups, and brackets run locally on a quote stream (see exit_engine.py)
+    # ex: get_exit_engine().bracket({'symbol' : 'AAPL', 'side' : 'buy', 'qty' : 1}, stop_price=180.00, trail_percent=1.0)
+    #     then feed it quotes with StockDataStream.subscribe_quotes(get_exit_engine().on_stream_quote, 'AAPL')
+    global exit_engine
+    if exit_engine == None:
+        exit_engine = ExitEngine(trading_client, get_trade_update_listener(), order_book=get_order_book(),
+            budget=budget, tracer=get_order_tracer())
+        exit_engine.start()
+    return exit_engine
+order_netter = None
+def get_order_netter():
+    # nets the orders of each symbol over a few milliseconds into 1 submit / replace / cancel (see order_netting.py)
+    # ex: get_order_netter().submit({'symbol' : 'AAPL', 'side' : 'buy', 'qty' : 1}), print(get_order_netter().metrics())
+    global order_netter
+    if order_netter == None:
+        order_netter = OrderNetter(trading_client, get_trade_update_listener(), budget=budget, tracer=get_order_tracer())
+        order_netter.start()
+    return order_netter
+pnl_engine = None
+def get_pnl_engine():
+    # P&L and exposure of every position, updated on each quote without a REST request (see pnl_engine.py)
+    # ex: StockDataStream.subscribe_quotes(get_pnl_engine().on_stream_quote, *get_pnl_engine().symbols()),
+    #     then get_pnl_engine().totals() or get_pnl_engine().positions_frame() instead of get_all_positions()
+    global pnl_engine
+    if pnl_engine == None:
+        pnl_engine = PnLEngine(trading_client, get_trade_update_listener(), budget=budget)
+        pnl_engine.start()
+    return pnl_engine
+def warm_start():
+    # start the order book, pre trade risk, and P&L engine from 1 account snapshot (account, positions, and open orders
+    # requested at once, see account_snapshot.py) instead of 4 requests 1 after another, returns the snapshot
+    global order_book, pre_trade_risk, pnl_engine
+    listener = get_trade_update_listener()
+    new_order_book = OrderBook(trading_client, listener, budget=budget) if order_book == None else None
+    new_pnl_engine = PnLEngine(trading_client, listener, budget=budget) if pnl_engine == None else None
+    snapshot = fetch_account_snapshot(trading_client, budget=budget)
+    if new_order_book != None:
+        new_order_book.start(snapshot)
+        order_book = new_order_book
+    if pre_trade_risk == None:
+        pre_trade_risk = PreTradeRisk(trading_client, order_book, listener=listener, asset_cache=get_asset_cache(), budget=budget)
+        pre_trade_risk.start(snapshot)
+    if new_pnl_engine != None:
+        new_pnl_engine.start(snapshot)
+        pnl_engine = new_pnl_engine
+    return snapshot
 
 
 
@@ -50,16 +164,17 @@ def get_all_positions(verbose=False):
     #     https://docs.alpaca.markets/docs/working-with-positions
     #     https://alpaca.markets/sdks/python/api_reference/trading/positions.html
     # position class https://alpaca.markets/sdks/python/api_reference/trading/models.html#alpaca.trading.models.Position
-    # other fields of potential interest:
-    # market_value: Total dollar amount of the position.
-    # qty_available: Total number of shares available minus open orders.
-    # usd: Represents the position in USD values.
-    portfolio = trading_client.get_all_positions()
+    # the positions are read from the order book (see get_order_book), not REST, so this doesn't cost a request
+    # (after the 1st call, which connects the trade_updates stream and seeds the book)
+    # each position is a dictionary with symbol, qty (negative if short), avg_entry_price, and updated_at,
+    # see get_pnl_engine for market value and P/L
+    portfolio = get_order_book().all_positions()
 
     # Print the quantity of shares for each position.
     if verbose: print(f'\n{len(portfolio)} position(s) in portfolio:')
     for i, position in enumerate(portfolio):
-        if verbose: print(f"    position {i + 1} of {len(portfolio)}: {position.side.value} {position.qty} shares of {position.symbol} on the exchange {position.exchange.value}. P/L = ${'%.4f' % float(position.unrealized_pl)} = {'%.4f' % (100 * float(position.unrealized_plpc))} %")
+        if verbose: print(f"    position {i + 1} of {len(portfolio)}: {'long' if position['qty'] > 0 else 'short'} {abs(position['qty'])} shares of {position['symbol']} at an average entry price of ${'%.4f' % position['avg_entry_price']}")
+    return portfolio
 
 def close_all_positions(verbose=False):
     responses = trading_client.close_all_positions(
@@ -77,26 +192,22 @@ def close_all_positions(verbose=False):
             print(f'        {response.body.type.value} order to {response.body.side.value} {amount} of {response.body.symbol}{limit_price}')
             print(f'        status = {response.body.status.value}')
 
-def close_position_by_ticker(verbose=False):
-    # todo: close position by ticker
+def close_position_by_ticker(symbols=None, verbose=False):
+    # close positions by symbol (defaults to every position) all at once,
+    # and wait for the closing orders to fill on the trade_updates stream (see close_and_cancel.py)
     # source: https://alpaca.markets/sdks/python/api_reference/trading/positions.html#close-a-position
-
-    portfolio = trading_client.get_all_positions()
-    if verbose: print(f'\n{len(portfolio)} position(s) in portfolio:')
-    for i, position in enumerate(portfolio):
-
-        # close position by symbol
-        # source: https://alpaca.markets/sdks/python/api_reference/trading/positions.html#close-a-position
-        order = trading_client.close_position(position.symbol) # return type = Order
-        # source: https://alpaca.markets/sdks/python/api_reference/trading/models.html#alpaca.trading.models.Order
-
-        if verbose: print(f"    closed position {i + 1} of {len(portfolio)}: {position.side.value} {position.qty} shares of {position.symbol} on the exchange {position.exchange.value}. P/L = ${'%.4f' % float(position.unrealized_pl)} = {'%.4f' % (100 * float(position.unrealized_plpc))} %. order id = {order.id}")
+    return close_positions_in_parallel(
+        trading_client,
+        get_trade_update_listener(),
+        symbols=symbols,
+        budget=budget,
+        verbose=verbose)
 
 
 
 ####### orders #######
 
-def place_market_order(verbose=False):
+def place_market_order(trace=False, verbose=False):
 
     ''' market order argument details
 
@@ -112,45 +223,68 @@ def place_market_order(verbose=False):
 
         '''
 	
-    # preparing order
-    market_order_data = MarketOrderRequest(
-        symbol="AAPL",
-        # qty=0.023,
-        notional=50.00,
-        side=OrderSide.BUY,
-        time_in_force=TimeInForce.DAY)
-
-    # place order
-    market_order = trading_client.submit_order(order_data=market_order_data)
-
-def place_limit_order(verbose=False):
-
-    # preparing order
-    limit_order_data = LimitOrderRequest(
-        # symbol="BTC/USD",
-        # limit_price=55000, # way lower than current price, so that it isn't filled (for testing purposes)
-        symbol="TSLA",
-        limit_price=485.00,
-        side=OrderSide.SELL,
-        qty=1.00,
-        # notional=1.00, # alpaca.common.exceptions.APIError: {"code":42210000,"message":"fractional orders cannot be sold short"}        qty=1.00,
-        # time_in_force=TimeInForce.FOK,
-        # time_in_force=TimeInForce.GTC
-        time_in_force=TimeInForce.DAY) # alpaca.common.exceptions.APIError: {"code":42210000,"message":"fractional orders must be DAY orders"}
-
-    # place order
-    limit_order = trading_client.submit_order(order_data=limit_order_data)
+    # preparing order (see bulk_orders.spec_to_request for how it becomes a MarketOrderRequest)
+    market_order_spec = {
+        'symbol'        : "AAPL",
+        # 'qty'           : 0.023,
+        'notional'      : 50.00,
+        'side'          : 'buy',
+        'type'          : 'market',
+        'time_in_force' : 'day'}
+
+    # place order (only traced / risk checked if trace is True, that connects the trade_updates stream and seeds the
+    # order book and account, which isn't worth it for 1 order)
+    [result] = place_orders([market_order_spec], trace=trace, check_risk=trace, verbose=verbose)
+    market_order = result['order']
+    return market_order
+
+def place_limit_order(trace=False, verbose=False):
+
+    # preparing order (see bulk_orders.spec_to_request for how it becomes a LimitOrderRequest)
+    limit_order_spec = {
+        # 'symbol'        : "BTC/USD",
+        # 'limit_price'   : 55000, # way lower than current price, so that it isn't filled (for testing purposes)
+        'symbol'        : "TSLA",
+        'limit_price'   : 485.00,
+        'side'          : 'sell',
+        'qty'           : 1.00,
+        # 'notional'      : 1.00, # alpaca.common.exceptions.APIError: {"code":42210000,"message":"fractional orders cannot be sold short"}
+        'type'          : 'limit',
+        # 'time_in_force' : 'fok',
+        # 'time_in_force' : 'gtc',
+        'time_in_force' : 'day'} # alpaca.common.exceptions.APIError: {"code":42210000,"message":"fractional orders must be DAY orders"}
+
+    # place order (see place_market_order for trace)
+    [result] = place_orders([limit_order_spec], trace=trace, check_risk=trace, verbose=verbose)
+    limit_order = result['order']
+    return limit_order
+
+def place_orders(specs, prices=None, trace=True, check_risk=True, verbose=False):
+    # many orders at once (ex: a whole portfolio rebalance), validated locally then submitted concurrently
+    # see bulk_orders.py for the keys of each order spec and of each result
+    # ex: place_orders([
+    #         {'symbol' : 'AAPL', 'side' : 'buy', 'notional' : 50.00},
+    #         {'symbol' : 'TSLA', 'side' : 'sell', 'qty' : 1, 'type' : 'limit', 'limit_price' : 485.00},
+    #     ])
+    # the latency of each stage of each order is traced if trace is True (see get_order_tracer)
+    # and each order is checked against the account before it's sent if check_risk is True (see get_pre_trade_risk),
+    # prices (symbol -> expected price) is needed to check qty orders without a limit_price
+    # (both connect the trade_updates stream the 1st time, and risk also seeds the order book and account)
+    return submit_orders_in_bulk(
+        trading_client,
+        specs,
+        budget=budget,
+        tracer=get_order_tracer() if trace else None,
+        risk=get_pre_trade_risk() if check_risk else None,
+        prices=prices,
+        verbose=verbose)
 
 def get_all_orders(verbose=False):
-     
-    # params to filter orders by
-    request_params = GetOrdersRequest(
-        status=QueryOrderStatus.OPEN,
-        # side=OrderSide.SELL
-    )
-
-    # orders that satisfy params
-    orders = trading_client.get_orders(filter=request_params)
+
+    # open orders from the order book (see get_order_book), not REST, so this doesn't cost a request
+    # (after the 1st call, which connects the trade_updates stream and seeds the book)
+    # ex: orders of 1 symbol: get_order_book().open_orders('AAPL')
+    orders = get_order_book().open_orders()
     if verbose: print(f'\n{len(orders)} order(s) placed:\n')
     for i, order in enumerate(orders):
         if verbose:
@@ -193,16 +327,19 @@ def get_all_orders(verbose=False):
 
 def cancel_all_orders(verbose=False):
     # source: https://alpaca.markets/sdks/python/api_reference/trading/orders.html#
-    trading_client.cancel_orders()
-    time.sleep(1.0) # takes a second to update Alpaca's database for my account
+    # returns once the trade_updates stream says each order was canceled (instead of sleeping 1 second)
+    return cancel_all_orders_and_confirm(trading_client, get_trade_update_listener(), budget=budget, verbose=verbose)
 
-def cancel_orders_by_id(verbose=False):
-    orders = get_all_orders(verbose=False)
-    if verbose and len(orders) > 0: print('\ncanceling %d orders by id:' % len(orders))
-    for order in orders:
-        order_id = order.id
-        trading_client.cancel_order_by_id(order_id)
-        if verbose: print('\tcanceled order: %s' % order_id)
+def cancel_orders_by_id(order_ids=None, verbose=False):
+    # cancel orders by id (defaults to every open order) all at once, and wait for the canceled updates
+    if order_ids == None:
+        order_ids = get_order_book().open_order_ids() # no REST request
+    return cancel_orders_in_parallel(
+        trading_client,
+        get_trade_update_listener(),
+        order_ids,
+        budget=budget,
+        verbose=verbose)
 
 
 
@@ -212,6 +349,7 @@ if __name__ == '__main__':
 
     # place_market_order(verbose=True)
     # place_limit_order(verbose=True)
+    # place_orders([{'symbol' : symbol, 'side' : 'buy', 'notional' : 10.00} for symbol in ['AAPL', 'JNJ', 'CVX']], verbose=True)
     # cancel_all_orders(verbose=True)
     # cancel_orders_by_id(verbose=True)
     close_all_positions(verbose=True)
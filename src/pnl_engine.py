@@ -0,0 +1,290 @@
+'''
+
+	Description:
+		real time mark to market P&L and exposure of the portfolio, updated on every quote / trade of a held symbol,
+        instead of calling get_all_positions() and reading each position's unrealized_pl (which is stale and costs a request)
+
+        positions are held in numpy arrays, 1 slot per symbol (see self.slots):
+            qty             - number of shares, negative for short positions
+            avg_entry_price - average entry price
+            mark            - latest price (mid of the latest quote, or the latest trade)
+            market_value    - qty * mark
+            cost_basis      - qty * avg_entry_price
+        and the portfolio totals (market value long / short, cost basis, unrealized and realized P&L) are kept
+        as running sums. a tick only changes the market value of its own symbol, so it's applied by subtracting
+        the symbol's old market value from the totals and adding the new 1: O(1) however many positions there are.
+        the totals are recomputed from the arrays every resync_interval ticks so float rounding can't pile up
+
+        the engine is seeded with 1 get_all_positions() (or an account snapshot, see account_snapshot.py) and kept current
+        by the fills of the trade_updates stream (see trade_updates.py), so it never needs another REST request.
+        the fills received since the positions were requested are replayed on top of them when it's seeded,
+        so a fill that comes in while seeding isn't overwritten by the older positions
+
+        example:
+            engine = PnLEngine(trading_client, listener)
+            engine.start()
+            wss_client.subscribe_quotes(engine.on_stream_quote, *engine.symbols())
+            print(engine.totals())
+
+	Sources:
+        https://alpaca.markets/sdks/python/api_reference/trading/models.html#alpaca.trading.models.Position
+        https://docs.alpaca.markets/docs/websocket-streaming#trade-updates
+        https://alpaca.markets/sdks/python/api_reference/data/models.html#quote
+
+	'''
+
+# standard libraries
+import time
+import threading
+from collections import deque
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from rate_budget import RateBudget
+from trade_updates import event_name
+from order_book import position_from_rest, apply_fill, QTY_TOLERANCE
+
+
+INITIAL_CAPACITY = 256 # slots, doubled when they run out
+RESYNC_INTERVAL = 100000 # ticks
+RECENT_FILLS = 10000 # kept to replay on top of the positions when seeding
+ARRAYS = ['qty', 'avg_entry_price', 'mark', 'market_value', 'cost_basis']
+
+class PnLEngine:
+
+    def __init__(self, trading_client=None, listener=None, budget=None, resync_interval=RESYNC_INTERVAL):
+
+        ''' PnLEngine()
+            args:
+                trading_client - alpaca.trading.client.TradingClient - to seed the positions (None to start empty)
+                listener - TradeUpdateListener - fills update the positions (see trade_updates.py)
+                budget - RateBudget - shared API rate limit (see rate_budget.py)
+                resync_interval - int - ticks between recomputing the totals from the arrays
+            '''
+        self.trading_client = trading_client
+        self.budget = budget if budget != None else RateBudget()
+        self.resync_interval = resync_interval
+        self.lock = threading.Lock()
+        self.slots = {} # symbol -> index in the arrays
+        self.slot_symbols = [] # index in the arrays -> symbol
+        self.arrays = {name : np.zeros(INITIAL_CAPACITY) for name in ARRAYS}
+        self.arrays['mark'][:] = np.nan
+        self.long_market_value = 0.0
+        self.short_market_value = 0.0 # negative
+        self.cost_basis = 0.0
+        self.realized_pl = 0.0 # since the engine started
+        self.recent_fills = deque(maxlen=RECENT_FILLS) # (epoch seconds received, update, realized P&L it added)
+        self.num_ticks = 0
+        self.updated_at = None
+        if listener != None:
+            listener.subscribe(self.on_trade_update)
+
+    ####### positions #######
+
+    def slot(self, symbol):
+        # caller must hold self.lock
+        # index of symbol in the arrays, a new slot is made (growing the arrays if they're full) if it has none
+        i = self.slots.get(symbol)
+        if i == None:
+            i = len(self.slot_symbols)
+            if i == len(self.arrays['qty']):
+                for name in ARRAYS:
+                    grown = np.zeros(2 * i) if name != 'mark' else np.full(2 * i, np.nan)
+                    grown[:i] = self.arrays[name]
+                    self.arrays[name] = grown
+            self.slots[symbol] = i
+            self.slot_symbols.append(symbol)
+        return i
+
+    def set_position(self, i, qty, avg_entry_price, mark=None):
+        # caller must hold self.lock
+        # change a slot's position, and its contribution to the totals
+        arrays = self.arrays
+        self.add_to_totals(i, -1)
+        arrays['qty'][i] = qty
+        arrays['avg_entry_price'][i] = avg_entry_price
+        if mark != None:
+            arrays['mark'][i] = mark
+        if np.isnan(arrays['mark'][i]):
+            arrays['mark'][i] = avg_entry_price # no price yet, so no unrealized P&L
+        arrays['market_value'][i] = qty * arrays['mark'][i]
+        arrays['cost_basis'][i] = qty * avg_entry_price
+        self.add_to_totals(i, 1)
+
+    def add_to_totals(self, i, sign):
+        # caller must hold self.lock
+        market_value = float(self.arrays['market_value'][i])
+        if market_value > 0:
+            self.long_market_value += sign * market_value
+        else:
+            self.short_market_value += sign * market_value
+        self.cost_basis += sign * float(self.arrays['cost_basis'][i])
+
+    def seed(self, snapshot=None):
+        # replace the positions with get_all_positions() (1 request), or the positions of an AccountSnapshot
+        # (see account_snapshot.py), using each position's current_price as its mark,
+        # then replay the fills received since they were requested
+        fetched_at = time.time() if snapshot == None else snapshot.requested_at
+        positions = snapshot.positions if snapshot != None else self.budget.call(self.trading_client.get_all_positions)
+        with self.lock:
+            for i in range(len(self.slot_symbols)):
+                self.set_position(i, 0.0, 0.0)
+            for position in positions:
+                seeded = position_from_rest(position)
+                mark = None if position.current_price == None else float(position.current_price)
+                self.set_position(self.slot(position.symbol), seeded['qty'], seeded['avg_entry_price'], mark)
+            recent_fills = list(self.recent_fills)
+            self.recent_fills.clear()
+            for received_at, update, realized_pl in recent_fills:
+                if received_at >= fetched_at:
+                    # its realized P&L was counted against the old positions, it's counted again against the new ones
+                    self.realized_pl -= realized_pl
+                    realized_pl = self.apply_fill_update(update)
+                self.recent_fills.append((received_at, update, realized_pl))
+            self.resync()
+
+    def start(self, snapshot=None):
+        self.seed(snapshot)
+
+    def on_trade_update(self, update):
+        # apply a fill to its symbol's position and the realized P&L
+        if event_name(update) not in ('fill', 'partial_fill') or update.qty == None or update.price == None:
+            return
+        with self.lock:
+            self.recent_fills.append((time.time(), update, self.apply_fill_update(update)))
+
+    def apply_fill_update(self, update):
+        # caller must hold self.lock
+        # returns the realized P&L of the fill
+        order = update.order
+        side = getattr(order.side, 'value', order.side)
+        fill_qty, fill_price = float(update.qty), float(update.price)
+        i = self.slot(order.symbol)
+        arrays = self.arrays
+        old_qty, old_avg_entry_price = arrays['qty'][i], arrays['avg_entry_price'][i]
+        position = apply_fill(
+            {'symbol' : order.symbol, 'qty' : old_qty, 'avg_entry_price' : old_avg_entry_price},
+            side,
+            fill_qty,
+            fill_price,
+            position_qty=None if update.position_qty == None else float(update.position_qty))
+        # the part of the fill that reduced the position realized (fill price - entry price) per share
+        realized_pl = 0.0
+        signed_fill_qty = fill_qty if side == 'buy' else -fill_qty
+        if old_qty * signed_fill_qty < 0:
+            closed_qty = min(abs(signed_fill_qty), abs(old_qty))
+            realized_pl = float(closed_qty * (fill_price - old_avg_entry_price) * np.sign(old_qty))
+        self.realized_pl += realized_pl
+        new_qty = 0.0 if abs(position['qty']) < QTY_TOLERANCE else position['qty']
+        self.set_position(i, new_qty, position['avg_entry_price'], fill_price)
+        self.updated_at = time.time()
+        return realized_pl
+
+    ####### ticks #######
+
+    def on_price(self, symbol, price):
+        # new mark of symbol, O(1)
+        i = self.slots.get(symbol)
+        if i == None or not price > 0:
+            return
+        with self.lock:
+            arrays = self.arrays
+            old_market_value = float(arrays['market_value'][i])
+            market_value = float(arrays['qty'][i]) * price
+            arrays['mark'][i] = price
+            arrays['market_value'][i] = market_value
+            if market_value > 0 or old_market_value > 0:
+                self.long_market_value += max(market_value, 0.0) - max(old_market_value, 0.0)
+            if market_value < 0 or old_market_value < 0:
+                self.short_market_value += min(market_value, 0.0) - min(old_market_value, 0.0)
+            self.num_ticks += 1
+            if self.num_ticks % self.resync_interval == 0:
+                self.resync()
+        self.updated_at = time.time()
+
+    def on_quote(self, symbol, bid, ask):
+        # mark at the mid of the quote (or the side that isn't empty)
+        bid, ask = float(bid), float(ask)
+        self.on_price(symbol, (bid + ask) / 2 if bid > 0 and ask > 0 else max(bid, ask))
+
+    async def on_stream_quote(self, quote):
+        # quote handler for alpaca.data.live.StockDataStream.subscribe_quotes()
+        self.on_quote(quote.symbol, quote.bid_price, quote.ask_price)
+
+    async def on_stream_trade(self, trade):
+        # trade handler for alpaca.data.live.StockDataStream.subscribe_trades()
+        self.on_price(trade.symbol, float(trade.price))
+
+    def resync(self):
+        # caller must hold self.lock
+        # recompute the totals from the arrays, to drop the rounding error of the running sums
+        n = len(self.slot_symbols)
+        market_value = self.arrays['market_value'][:n]
+        self.long_market_value = float(market_value[market_value > 0].sum())
+        self.short_market_value = float(market_value[market_value < 0].sum())
+        self.cost_basis = float(self.arrays['cost_basis'][:n].sum())
+
+    ####### reading #######
+
+    def symbols(self):
+        # symbols with an open position
+        with self.lock:
+            return [symbol for symbol, i in self.slots.items() if self.arrays['qty'][i] != 0]
+
+    def totals(self):
+        # portfolio totals as a dictionary
+        with self.lock:
+            market_value = self.long_market_value + self.short_market_value
+            return {
+                'long_market_value'  : self.long_market_value,
+                'short_market_value' : self.short_market_value,
+                'net_exposure'       : market_value,
+                'gross_exposure'     : self.long_market_value - self.short_market_value,
+                'cost_basis'         : self.cost_basis,
+                'unrealized_pl'      : market_value - self.cost_basis,
+                'realized_pl'        : self.realized_pl,
+                'num_positions'      : int(np.count_nonzero(self.arrays['qty'][:len(self.slot_symbols)])),
+                'num_ticks'          : self.num_ticks,
+                'updated_at'         : self.updated_at,
+            }
+
+    def unrealized_pl(self, symbol):
+        i = self.slots.get(symbol)
+        if i == None:
+            return 0.0
+        return float(self.arrays['market_value'][i] - self.arrays['cost_basis'][i])
+
+    def positions_frame(self):
+        # every open position with the same P&L fields as alpaca.trading.models.Position
+        with self.lock:
+            n = len(self.slot_symbols)
+            df = pd.DataFrame({name : self.arrays[name][:n].copy() for name in ARRAYS},
+                index=pd.Index(self.slot_symbols, name='symbol'))
+        df = df[df['qty'] != 0]
+        df['side'] = np.where(df['qty'] > 0, 'long', 'short')
+        df['unrealized_pl'] = df['market_value'] - df['cost_basis']
+        df['unrealized_plpc'] = df['unrealized_pl'] / df['cost_basis'].abs()
+        return df
+
+
+
+if __name__ == '__main__':
+
+    # benchmark: ticks of 10 symbols in a portfolio of 100,000 positions
+    engine = PnLEngine()
+    rng = np.random.default_rng(0)
+    num_positions = 100000
+    with engine.lock:
+        for i in range(num_positions):
+            engine.set_position(engine.slot(f'S{i}'), float(rng.choice([-1, 1]) * rng.integers(1, 100)), 100.0)
+    num_ticks = 1000000
+    symbols = [f'S{i}' for i in rng.integers(0, 10, num_ticks)]
+    prices = 100 + np.cumsum(rng.normal(0, 0.01, num_ticks))
+    start_time = time.time()
+    for symbol, price in zip(symbols, prices.tolist()):
+        engine.on_price(symbol, price)
+    seconds = time.time() - start_time
+    print(f'{num_ticks} ticks on a portfolio of {num_positions} positions in {"%.2f" % seconds} second(s) ' + \
+        f'({"%.2f" % (1e6 * seconds / num_ticks)} microseconds per tick)')
+    print(engine.totals())
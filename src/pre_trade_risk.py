@@ -0,0 +1,265 @@
+'''
+
+	Description:
+		checks an order against the account's limits locally before it's sent,
+        instead of calling get_account() (see get_account_details.py) before every order or skipping the check
+
+        the account is kept in memory:
+            account fields - buying power, equity, daytrade_count, ... from get_account(),
+                             refreshed every refresh_interval seconds in a daemon thread
+            positions      - from the order book (see order_book.py), kept current by the trade_updates stream
+            asset flags    - shortable, easy_to_borrow, fractionable of every asset from the asset cache (see asset_cache.py)
+            reservations   - buying power used by orders approved since the last refresh
+                             (Alpaca counts open orders in buying_power, but only once it's refreshed),
+                             released when an order is canceled / expired / rejected
+
+        check() returns what's wrong with an order (an order spec, see bulk_orders.py), by these rules:
+            blocked        - the account can't trade
+            size           - qty > max_order_qty
+            notional       - qty * price > max_order_notional
+            exposure       - the position after the order would be worth more than max_position_notional
+            buying power   - the part of the order that opens / adds to a position costs more than the buying power left
+            PDT            - the order would close a position opened today, the account has < $25,000 of equity
+                             and already has 3 day trades in the last 5 days
+            shortability   - the order would open / add to a short position of a stock that isn't shortable and
+                             easy to borrow (or that isn't in the asset cache, or there's no asset cache, so it's unknown),
+                             in an account without shorting, or with fractional shares
+        every rule is a few dictionary lookups and some arithmetic, so a check takes microseconds
+
+	Sources:
+        https://alpaca.markets/sdks/python/api_reference/trading/models.html#alpaca.trading.models.TradeAccount
+        https://docs.alpaca.markets/docs/user-protection#pattern-day-trader-pdt-protection
+        https://docs.alpaca.markets/docs/margin-and-short-selling
+
+	'''
+
+# standard libraries
+import time
+import threading
+import traceback
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# non-standard libraries
+import numpy as np
+from rate_budget import RateBudget
+from trade_updates import event_name
+from bulk_orders import is_fractional
+
+
+STOCK_MARKET_TIMEZONE = 'America/New_York'
+REFRESH_INTERVAL = 60.0 # seconds
+PDT_MIN_EQUITY = 25000.0
+PDT_MAX_DAYTRADES = 3
+RELEASE_EVENTS = ('canceled', 'expired', 'rejected', 'replaced', 'done_for_day')
+
+def new_york_date():
+    return datetime.now(ZoneInfo(STOCK_MARKET_TIMEZONE)).date()
+
+class PreTradeRisk:
+
+    def __init__(
+        self,
+        trading_client,
+        order_book,
+        listener=None,
+        asset_cache=None,
+        budget=None,
+        max_order_qty=np.inf,
+        max_order_notional=np.inf,
+        max_position_notional=np.inf,
+        refresh_interval=REFRESH_INTERVAL):
+
+        ''' PreTradeRisk()
+            args:
+                trading_client - alpaca.trading.client.TradingClient - to refresh the account
+                order_book - OrderBook - positions (see order_book.py)
+                listener - TradeUpdateListener - to release reservations and track day trades (see trade_updates.py)
+                asset_cache - AssetCache - shortable / easy_to_borrow / fractionable flags (see asset_cache.py)
+                budget - RateBudget - shared API rate limit (see rate_budget.py)
+                max_order_qty - float - max shares per order
+                max_order_notional - float - max dollars per order
+                max_position_notional - float - max dollars of 1 position (long or short)
+                refresh_interval - float - seconds between get_account() refreshes (None to never refresh)
+            '''
+        self.trading_client = trading_client
+        self.order_book = order_book
+        self.asset_cache = asset_cache
+        self.budget = budget if budget != None else RateBudget()
+        self.max_order_qty = max_order_qty
+        self.max_order_notional = max_order_notional
+        self.max_position_notional = max_position_notional
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.account = {}
+        self.asset_flags = {} # symbol -> (shortable, easy_to_borrow, fractionable)
+        self.reservations = {} # client_order_id -> dollars of buying power
+        self.reserved = 0.0
+        self.opened_today = set() # symbols with a fill that opened / added to a position today
+        self.today = new_york_date()
+        self.num_checks = 0
+        self.num_rejections = 0
+        self.refresh_thread = None
+        self.stop_event = threading.Event()
+        if listener != None:
+            listener.subscribe(self.on_trade_update)
+
+    ####### state #######
+
+    def refresh(self, snapshot=None):
+        # get_account() (1 request, or the account of an AccountSnapshot, see account_snapshot.py) and reload the asset flags,
+        # reservations of approved orders are dropped since Alpaca's buying power now counts them
+        account = snapshot.account if snapshot != None else self.budget.call(self.trading_client.get_account)
+        asset_flags = None
+        if self.asset_cache != None:
+            df = self.asset_cache.frame()
+            asset_flags = dict(zip(df['symbol'], zip(df['shortable'], df['easy_to_borrow'], df['fractionable'])))
+        with self.lock:
+            self.account = {
+                'buying_power'      : float(account.buying_power or 0.0),
+                'equity'            : float(account.equity or 0.0),
+                'daytrade_count'    : int(account.daytrade_count or 0),
+                'trading_blocked'   : bool(account.trading_blocked or account.account_blocked or account.trade_suspended_by_user),
+                'shorting_enabled'  : bool(account.shorting_enabled),
+                'multiplier'        : float(account.multiplier or 1.0),
+                'refreshed_at'      : time.time(),
+            }
+            if asset_flags != None:
+                self.asset_flags = asset_flags
+            self.reservations = {}
+            self.reserved = 0.0
+
+    def start(self, snapshot=None):
+        # refresh now (from snapshot if it isn't None), then every refresh_interval seconds in a daemon thread
+        self.refresh(snapshot)
+        if self.refresh_interval == None or self.refresh_thread != None:
+            return
+        def refresh_forever():
+            while not self.stop_event.wait(self.refresh_interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    print(f'\nException in pre trade risk refresh!!!')
+                    print(f'{traceback.format_exc()}')
+        self.refresh_thread = threading.Thread(target=refresh_forever, daemon=True)
+        self.refresh_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.refresh_thread != None:
+            self.refresh_thread.join()
+            self.refresh_thread = None
+
+    def on_trade_update(self, update):
+        event = event_name(update)
+        order = update.order
+        with self.lock:
+            if event in RELEASE_EVENTS:
+                # release what's left of the reservation (the filled part was spent)
+                reservation = self.reservations.pop(str(order.client_order_id), 0.0)
+                if order.qty != None and float(order.qty) > 0 and order.filled_qty != None:
+                    reservation *= 1.0 - min(float(order.filled_qty) / float(order.qty), 1.0)
+                self.reserved -= reservation
+            if event in ('fill', 'partial_fill') and update.position_qty != None and update.qty != None:
+                if self.today != new_york_date():
+                    self.today = new_york_date()
+                    self.opened_today = set()
+                side = getattr(order.side, 'value', order.side)
+                position_qty = float(update.position_qty)
+                fill_qty = float(update.qty) if side == 'buy' else -float(update.qty)
+                if abs(position_qty) > abs(position_qty - fill_qty):
+                    self.opened_today.add(order.symbol)
+
+    ####### checks #######
+
+    def check(self, spec, price=None):
+
+        ''' check()
+            description:
+                what's wrong with an order, without calling the API
+            args:
+                spec - dictionary - order spec (see bulk_orders.py)
+                price - float - expected price per share, required for orders without a limit_price
+            returns:
+                list of strings - the rules the order breaks (empty if it passes)
+            '''
+        with self.lock:
+            return self.evaluate(spec, price)[0]
+
+    def evaluate(self, spec, price=None):
+        # caller must hold self.lock
+        # returns (list of the rules the order breaks, dollars of buying power it would use)
+        errors = []
+        account = self.account
+        symbol = spec['symbol']
+        side = spec['side']
+        price = spec.get('limit_price') or price
+        if spec.get('qty') != None:
+            qty = float(spec['qty'])
+            if price == None:
+                return ['price is required to check a qty order without a limit_price'], 0.0
+            notional = qty * float(price)
+        else:
+            # without a price the qty is unknown, and every check on it (and on shorting) would be skipped
+            if price == None:
+                return ['price is required to check a notional order without a limit_price'], 0.0
+            notional = float(spec['notional'])
+            qty = notional / float(price)
+        signed_qty = qty if side == 'buy' else -qty
+        position_qty = self.order_book.qty(symbol)
+        new_position_qty = position_qty + signed_qty
+
+        if account.get('trading_blocked'):
+            errors.append('account is blocked from trading')
+        if qty > self.max_order_qty:
+            errors.append(f'qty {qty} > max_order_qty {self.max_order_qty}')
+        if notional > self.max_order_notional:
+            errors.append(f'notional ${"%.2f" % notional} > max_order_notional ${"%.2f" % self.max_order_notional}')
+        if abs(new_position_qty) * float(price) > self.max_position_notional:
+            errors.append(f'position of ${"%.2f" % (abs(new_position_qty) * float(price))} in {symbol} > ' + \
+                f'max_position_notional ${"%.2f" % self.max_position_notional}')
+
+        # only the part of the order that opens or adds to a position uses buying power
+        closing_qty = min(abs(signed_qty), abs(position_qty)) if position_qty * signed_qty < 0 else 0.0
+        opening_notional = notional * (1.0 - closing_qty / qty) if qty > 0 else notional
+        buying_power_left = account.get('buying_power', 0.0) - self.reserved
+        if opening_notional > buying_power_left:
+            errors.append(f'opening notional ${"%.2f" % opening_notional} > buying power left ${"%.2f" % buying_power_left}')
+
+        # a sell of a long position (or buy of a short) opened today is a day trade
+        if closing_qty > 0 and symbol in self.opened_today and \
+            account.get('equity', 0.0) < PDT_MIN_EQUITY and account.get('daytrade_count', 0) >= PDT_MAX_DAYTRADES:
+            errors.append(f'closing {symbol} today would be a day trade #{account["daytrade_count"] + 1} with equity < ${PDT_MIN_EQUITY:,.0f}')
+
+        # opening or adding to a short
+        if new_position_qty < min(position_qty, 0.0):
+            shortable, easy_to_borrow, _ = self.asset_flags.get(symbol, (None, None, None))
+            if not account.get('shorting_enabled', True):
+                errors.append('shorting is not enabled on the account')
+            if shortable == None or easy_to_borrow == None:
+                # rejected rather than let thru unchecked
+                errors.append(f'{symbol} can\'t be shorted: its shortable / easy to borrow flags are unknown' + \
+                    (' (no asset cache)' if self.asset_cache == None else ''))
+            elif not (shortable and easy_to_borrow):
+                errors.append(f'{symbol} is not shortable / easy to borrow')
+            if spec.get('notional') != None or is_fractional(spec.get('qty')):
+                errors.append('fractional orders cannot be sold short')
+        return errors, opening_notional
+
+    def approve(self, spec, price=None):
+        # check() the order, and if it passes reserve its buying power until it's done or the next refresh
+        # (in 1 hold of the lock, so 2 threads can't both be approved with the same buying power)
+        with self.lock:
+            errors, opening_notional = self.evaluate(spec, price)
+            self.num_checks += 1
+            if len(errors) > 0:
+                self.num_rejections += 1
+            elif spec.get('client_order_id') != None:
+                self.reservations[spec['client_order_id']] = opening_notional
+                self.reserved += opening_notional
+        return errors
+
+    def release(self, client_order_id):
+        # give back the buying power of an approved order that wasn't sent (or was rejected by the API)
+        with self.lock:
+            self.reserved -= self.reservations.pop(client_order_id, 0.0)
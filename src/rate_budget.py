@@ -0,0 +1,110 @@
+import time
+import threading
+import requests
+
+
+'''
+
+    Description:
+
+        Thread safe version of the rate limiting done in query_api_without_surpassing_rate_limit.py so
+        multiple threads can share one API rate limit (200 requests per minute on the free tier, 1000 per
+        minute on the paid tier).
+
+        Calls are spaced with a token bucket so that bursts up to the per minute limit are allowed but the
+        long run average never goes over it. The X-Ratelimit-Remaining and X-Ratelimit-Reset headers of each
+        response are also read, and if Alpaca says there are no calls left (or returns a 429) every thread
+        waits until X-Ratelimit-Reset before querying again, like Dan recommended here:
+        https://forum.alpaca.markets/t/executing-orders/12029/2
+
+        alpaca-py doesn't expose the response headers, so calls made with alpaca-py clients should call
+        budget.acquire() before each call and budget.wait_for_reset() if an APIError with status code 429
+        is raised, which is what budget.call() does, ex:
+            order = budget.call(trading_client.submit_order, order_data=market_order_data)
+
+    '''
+
+class RateBudget:
+
+    def __init__(self, calls_per_minute=200, max_retries=5):
+        self.calls_per_minute = calls_per_minute
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.tokens = float(calls_per_minute)
+        self.last_refill_time = time.monotonic()
+        self.ratelimit_remaining = calls_per_minute
+        self.ratelimit_reset = 0 # epoch seconds
+        self.num_api_calls = 0
+        self.num_rate_limit_errors = 0
+
+    def acquire(self):
+        # block until one more API call fits in the budget
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    float(self.calls_per_minute),
+                    self.tokens + (now - self.last_refill_time) * self.calls_per_minute / 60.0)
+                self.last_refill_time = now
+                seconds_till_reset = self.ratelimit_reset - time.time()
+                if self.ratelimit_remaining <= 0 and seconds_till_reset > 0:
+                    wait = seconds_till_reset
+                elif self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    self.ratelimit_remaining -= 1
+                    self.num_api_calls += 1
+                    return
+                else:
+                    wait = (1.0 - self.tokens) * 60.0 / self.calls_per_minute
+            time.sleep(wait)
+
+    def update(self, response_headers):
+        # sync the budget with what Alpaca says is left
+        try:
+            ratelimit_remaining = int(response_headers['X-Ratelimit-Remaining'])
+            ratelimit_reset = int(response_headers['X-Ratelimit-Reset'])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self.lock:
+            if ratelimit_reset > self.ratelimit_reset:
+                self.ratelimit_remaining = ratelimit_remaining
+            else:
+                self.ratelimit_remaining = min(self.ratelimit_remaining, ratelimit_remaining)
+            self.ratelimit_reset = max(self.ratelimit_reset, ratelimit_reset)
+
+    def wait_for_reset(self, response_headers=None):
+        # called after a 429, every thread pauses until X-Ratelimit-Reset
+        with self.lock:
+            self.num_rate_limit_errors += 1
+            self.ratelimit_remaining = 0
+            if response_headers is not None and 'X-Ratelimit-Reset' in response_headers:
+                self.ratelimit_reset = max(self.ratelimit_reset, int(response_headers['X-Ratelimit-Reset']))
+            if self.ratelimit_reset <= time.time():
+                self.ratelimit_reset = int(time.time()) + 1
+            seconds_till_reset = self.ratelimit_reset - time.time()
+        time.sleep(max(seconds_till_reset, 0))
+
+    def get(self, url, session=None, **kwargs):
+        # rate limited drop in for requests.get()
+        # returns the response, raises requests.exceptions.HTTPError on non 429 errors
+        for _ in range(self.max_retries + 1):
+            self.acquire()
+            response = (session or requests).get(url, **kwargs)
+            self.update(response.headers)
+            if response.status_code == 429:
+                self.wait_for_reset(response.headers)
+                continue
+            response.raise_for_status()
+            return response
+        response.raise_for_status()
+
+    def call(self, function, *args, **kwargs):
+        # rate limited call of an alpaca-py client method, retried after X-Ratelimit-Reset on a 429
+        for i in range(self.max_retries + 1):
+            self.acquire()
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                if getattr(e, 'status_code', None) != 429 or i == self.max_retries:
+                    raise
+                self.wait_for_reset()
@@ -0,0 +1,206 @@
+'''
+
+	Description:
+		builds coarser bars (N minutes, N hours, 1 day, 1 week) out of the 1 minute bars
+        in the local bar cache (see bar_cache.py), so getting 5Min, 15Min and 1Day bars of
+        the same symbol only needs the 1Min bars to be downloaded once
+
+        everything is done with numpy on whole columns (no python loops over bars):
+            1. each 1 minute bar gets a bucket number from its New York wall clock time
+            2. the bucket boundaries are where the bucket number changes
+            3. open/close are the first/last bar of each bucket and
+               high/low/volume/number_of_trades/vwap are reduced with np.*.reduceat()
+
+        alignment (same as the bars the API returns):
+            N minute / N hour bars - start at multiples of N minutes / hours after midnight New York time
+            daily bars             - 1 bar per New York trading date, stamped at midnight New York time
+            weekly bars            - start on Monday at midnight New York time
+
+        extended hours:
+            with extended_hours=False only bars in the regular session are used
+            (9:30 am to 4:00 pm New York time, or the open/close of each day from
+            the Alpaca calendar if one is given, which handles early closes)
+            with extended_hours=True pre market (from 4:00 am) and after hours (until 8:00 pm)
+            bars are included too, a daily bar then covers the whole 4:00 am to 8:00 pm session
+
+	Sources:
+        https://docs.alpaca.markets/reference/stockbars
+        https://docs.alpaca.markets/reference/getcalendar-1
+        https://docs.alpaca.markets/docs/orders-at-alpaca#extended-hours-trading
+
+	'''
+
+# standard libraries
+import re
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from bar_pager import concat_chunks, REORDERED_COLUMNS
+
+
+STOCK_MARKET_TIMEZONE = 'America/New_York'
+NS_PER_MINUTE = 60 * 1000 * 1000 * 1000
+NS_PER_DAY = 24 * 60 * NS_PER_MINUTE
+REGULAR_SESSION_OPEN = 9 * 60 + 30 # minutes after midnight New York time
+REGULAR_SESSION_CLOSE = 16 * 60
+EXTENDED_SESSION_OPEN = 4 * 60
+EXTENDED_SESSION_CLOSE = 20 * 60
+
+def to_local_ns(times):
+    # UTC datetime64 array -> int64 nanoseconds of the New York wall clock time
+    times = pd.DatetimeIndex(times).as_unit('ns')
+    return times.tz_localize('UTC').tz_convert(STOCK_MARKET_TIMEZONE).tz_localize(None).asi8
+
+def session_mask(local_ns, extended_hours=True, calendar=None):
+
+    ''' session_mask()
+        description:
+            boolean mask of which bars are in the trading session
+        args:
+            local_ns - numpy int64 array - New York wall clock times (see to_local_ns())
+            extended_hours - boolean - include pre market and after hours bars
+            calendar - pandas dataframe - optional, from GET /v2/calendar with columns:
+                date - YYYY-MM-DD
+                open - HH:MM (regular session open)
+                close - HH:MM (regular session close, 13:00 on early close days)
+                session_open - HHMM (optional, extended session open)
+                session_close - HHMM (optional, extended session close)
+                days that aren't in the calendar (weekends, holidays) are excluded
+        '''
+    minute_of_day = (local_ns % NS_PER_DAY) // NS_PER_MINUTE
+    if calendar is None:
+        if extended_hours:
+            return (minute_of_day >= EXTENDED_SESSION_OPEN) & (minute_of_day < EXTENDED_SESSION_CLOSE)
+        return (minute_of_day >= REGULAR_SESSION_OPEN) & (minute_of_day < REGULAR_SESSION_CLOSE)
+    # look up each bar's day in the calendar with a sorted search instead of a dictionary lookup per bar
+    def to_minutes(values):
+        values = values.astype(str).str.replace(':', '').str.zfill(4)
+        return values.str[:2].astype(int).values * 60 + values.str[2:].astype(int).values
+    calendar_days = pd.to_datetime(calendar['date']).values.astype('datetime64[D]').astype(np.int64)
+    if extended_hours:
+        opens = to_minutes(calendar['session_open']) if 'session_open' in calendar else \
+            np.full(len(calendar), EXTENDED_SESSION_OPEN)
+        closes = to_minutes(calendar['session_close']) if 'session_close' in calendar else \
+            np.full(len(calendar), EXTENDED_SESSION_CLOSE)
+    else:
+        opens = to_minutes(calendar['open'])
+        closes = to_minutes(calendar['close'])
+    order = np.argsort(calendar_days)
+    calendar_days, opens, closes = calendar_days[order], opens[order], closes[order]
+    if len(calendar_days) == 0:
+        return np.zeros(len(local_ns), dtype=bool)
+    days = local_ns // NS_PER_DAY
+    i = np.clip(np.searchsorted(calendar_days, days), 0, len(calendar_days) - 1)
+    return (calendar_days[i] == days) & (minute_of_day >= opens[i]) & (minute_of_day < closes[i])
+
+def bucket_starts(local_ns, timeframe):
+    # New York wall clock start time (int64 ns) of the bucket each bar belongs to
+    match = re.fullmatch(r'(\d+)(Min|T|Hour|H|Day|D|Week|W)', timeframe)
+    if match == None:
+        raise ValueError(f'can not resample to timeframe: {timeframe}')
+    n, unit = int(match.group(1)), match.group(2)
+    if unit in ('Min', 'T', 'Hour', 'H'):
+        bucket_ns = n * NS_PER_MINUTE * (60 if unit in ('Hour', 'H') else 1)
+        if bucket_ns > NS_PER_DAY or NS_PER_DAY % bucket_ns != 0:
+            raise ValueError(f'intraday timeframe must evenly divide a day: {timeframe}')
+        return local_ns - local_ns % bucket_ns
+    if unit in ('Day', 'D'):
+        if n != 1:
+            raise ValueError(f'only 1 day bars are supported: {timeframe}')
+        return local_ns - local_ns % NS_PER_DAY
+    if n != 1:
+        raise ValueError(f'only 1 week bars are supported: {timeframe}')
+    days = local_ns // NS_PER_DAY
+    mondays = days - (days + 3) % 7 # 1970-01-01 was a Thursday
+    return mondays * NS_PER_DAY
+
+def resample_columns(columns, timeframe, extended_hours=True, calendar=None):
+
+    ''' resample_columns()
+        description:
+            resample 1 minute bars to a coarser timeframe
+        args:
+            columns - dictionary of numpy arrays - 1 minute bars sorted by time (see bar_pager.REORDERED_COLUMNS)
+            timeframe - string - ex: '5Min', '15Min', '1Hour', '1Day', '1Week'
+            extended_hours - boolean - include pre market and after hours bars
+            calendar - pandas dataframe - optional, see session_mask()
+        returns:
+            dictionary of numpy arrays - the resampled bars, time is the (UTC) start of each bar
+        '''
+    if len(columns['time']) == 0:
+        return concat_chunks([])
+    local_ns = to_local_ns(columns['time'])
+    mask = session_mask(local_ns, extended_hours, calendar)
+    if not mask.all():
+        columns = {column : values[mask] for column, values in columns.items()}
+        local_ns = local_ns[mask]
+    if len(local_ns) == 0:
+        return concat_chunks([])
+    starts_local = bucket_starts(local_ns, timeframe)
+    first = np.concatenate(([0], np.flatnonzero(np.diff(starts_local)) + 1))
+    last = np.concatenate((first[1:], [len(starts_local)])) - 1
+    # local -> UTC, only done once per bucket
+    # (a bucket can start at a different UTC offset than its first bar, ex: midnight on daylight savings days)
+    # ambiguous / nonexistent times only happen between 1 am and 3 am, before any session opens
+    bar_times = pd.DatetimeIndex(starts_local[first].astype('datetime64[ns]')).tz_localize(
+        STOCK_MARKET_TIMEZONE, ambiguous=True, nonexistent='shift_forward').tz_convert('UTC').tz_localize(None).values
+    volume = np.add.reduceat(columns['volume'], first)
+    price_volume = np.add.reduceat(columns['volumn_weighted_average_price'] * columns['volume'], first)
+    close = columns['close'][last]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = np.where(volume > 0, price_volume / volume, close)
+    return {
+        "time"                          : bar_times,
+        "open"                          : columns['open'][first],
+        "high"                          : np.maximum.reduceat(columns['high'], first),
+        "low"                           : np.minimum.reduceat(columns['low'], first),
+        "close"                         : close,
+        "number_of_trades"              : np.add.reduceat(columns['number_of_trades'], first),
+        "volume"                        : volume,
+        "volumn_weighted_average_price" : vwap,
+    }
+
+def get_resampled_bars(
+    bar_cache,
+    symbols,
+    start,
+    end,
+    timeframe,
+    adjustment='raw',
+    extended_hours=True,
+    calendar=None,
+    download_missing=True):
+
+    ''' get_resampled_bars()
+        description:
+            get bars of each symbol at any coarser timeframe from the cached 1 minute bars
+            once the 1 minute bars are cached this makes 0 API calls
+        args:
+            bar_cache - BarCache - see bar_cache.py
+            symbols - string or list of strings - ticker symbol(s)
+            start - string / datetime - start of the date range
+            end - string / datetime - end of the date range
+            timeframe - string - ex: '5Min', '15Min', '1Hour', '1Day', '1Week'
+            adjustment - string - 'raw', 'split', 'dividend', or 'all'
+            extended_hours - boolean - include pre market and after hours bars
+            calendar - pandas dataframe - optional, see session_mask()
+            download_missing - boolean - download 1 minute bars that aren't cached yet first
+        returns:
+            dictionary with:
+                keys - string - each symbol requested that has bars
+                values - pandas dataframe - with columns bar_pager.REORDERED_COLUMNS, time is in New York time
+        '''
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    if download_missing:
+        bar_cache.update(symbols, start, end, '1Min', adjustment)
+    dfs = {}
+    for symbol in symbols:
+        columns = bar_cache.load_range(symbol, start, end, '1Min', adjustment)
+        resampled = resample_columns(columns, timeframe, extended_hours, calendar)
+        if len(resampled['time']) > 0:
+            df = pd.DataFrame(resampled)[REORDERED_COLUMNS]
+            df['time'] = df['time'].dt.tz_localize('UTC').dt.tz_convert(STOCK_MARKET_TIMEZONE)
+            dfs[symbol] = df
+    return dfs
@@ -0,0 +1,149 @@
+'''
+
+	Description:
+		screens the whole universe of stocks by liquidity
+        (replaces the ticker by ticker loop of select_tickers.sort_stocks_by_average_volume)
+
+        1. daily bars of every stock are downloaded in multi-symbol batches
+           into the local bar cache (see bar_cache.py), only the days that aren't cached yet
+        2. the bars of every stock are concatenated into 1 array per column and
+           the per stock sums are done in 1 pass with np.add.reduceat()
+        3. stocks with too few bars or too low of a price are dropped,
+           the rest are ranked by average volume and saved to 1 csv in 1 write
+
+        columns of the output:
+            ticker
+            num_bars              - number of daily bars in the window
+            average_volume        - average daily volume (shares)
+            average_price         - average daily close
+            average_dollar_volume - average of close * volume of each day
+
+	Sources:
+        https://docs.alpaca.markets/reference/stockbars
+
+	'''
+
+# standard libraries
+import os
+import json
+import time
+import pathlib
+from datetime import datetime, timedelta, timezone
+REPO_PATH = str(pathlib.Path(__file__).resolve().parent.parent)
+DATA_PATH = os.path.join(REPO_PATH, "data", "ticker_data")
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from bar_cache import BarCache
+
+
+def compute_liquidity(bar_cache, stocks, start, end, adjustment='split'):
+
+    ''' compute_liquidity()
+        description:
+            average volume, price, and dollar volume of each stock from the cached daily bars (no downloading)
+        args:
+            bar_cache - BarCache - see bar_cache.py
+            stocks - list of strings - ticker symbols
+            start - datetime - start of the window
+            end - datetime - end of the window
+            adjustment - string - 'raw', 'split', 'dividend', or 'all'
+        returns:
+            pandas dataframe - 1 row per stock with the columns in the description at the top of this file
+        '''
+    closes, volumes, lengths = [], [], []
+    for ticker in stocks:
+        columns = bar_cache.load_range(ticker, start, end, '1Day', adjustment)
+        closes.append(columns['close'])
+        volumes.append(columns['volume'])
+        lengths.append(len(columns['close']))
+    lengths = np.array(lengths, dtype=np.int64)
+    close = np.concatenate(closes + [np.array([])])
+    volume = np.concatenate(volumes + [np.array([])])
+    # sums of each stock's slice, stocks without bars are skipped since reduceat needs non empty slices
+    has_bars = lengths > 0
+    starts = (np.cumsum(lengths) - lengths)[has_bars]
+    num_bars = lengths[has_bars]
+    average_volume = np.full(len(stocks), np.nan)
+    average_price = np.full(len(stocks), np.nan)
+    average_dollar_volume = np.full(len(stocks), np.nan)
+    if len(starts) > 0:
+        average_volume[has_bars] = np.add.reduceat(volume, starts) / num_bars
+        average_price[has_bars] = np.add.reduceat(close, starts) / num_bars
+        average_dollar_volume[has_bars] = np.add.reduceat(close * volume, starts) / num_bars
+    return pd.DataFrame({
+        'ticker'                : stocks,
+        'num_bars'              : lengths,
+        'average_volume'        : average_volume,
+        'average_price'         : average_price,
+        'average_dollar_volume' : average_dollar_volume,
+    })
+
+def screen_stocks(
+    stocks,
+    bar_cache,
+    days=31,
+    min_bars=10,
+    min_average_price=1.00,
+    adjustment='split',
+    output_filepath=None,
+    verbose=True):
+
+    ''' screen_stocks()
+        description:
+            rank stocks by average daily volume over the last number of days
+        args:
+            stocks - list of strings - ticker symbols
+            bar_cache - BarCache - see bar_cache.py
+            days - int - number of calendar days to average over
+            min_bars - int - stocks with fewer daily bars than this are dropped
+            min_average_price - float - stocks with a lower average close than this are dropped
+            adjustment - string - 'raw', 'split', 'dividend', or 'all'
+            output_filepath - string - optional, csv to save the ranked stocks to
+        returns:
+            pandas dataframe - the stocks that passed, sorted by average volume (descending)
+        '''
+    stocks = sorted(set(stocks))
+    end_date = datetime.now(tz=timezone.utc)
+    start_date = end_date - timedelta(days=days)
+    start_time = time.time()
+    num_requests = bar_cache.update(stocks, start_date, end_date, '1Day', adjustment, verbose=verbose)
+    df = compute_liquidity(bar_cache, stocks, start_date, end_date, adjustment)
+    too_few_bars = df['num_bars'] < min_bars
+    too_cheap = ~too_few_bars & (df['average_price'] < min_average_price)
+    df = df[~too_few_bars & ~too_cheap] \
+        .sort_values(by='average_volume', ascending=False) \
+        .reset_index(drop=True)
+    if output_filepath != None:
+        df.to_csv(output_filepath)
+    if verbose:
+        print(f'screened {len(stocks)} stock(s) in {"%.1f" % (time.time() - start_time)} second(s) with {num_requests} request(s)')
+        print(f'    skipped {too_few_bars.sum()} stock(s) with < {min_bars} daily bars')
+        print(f'    skipped {too_cheap.sum()} stock(s) with average price < ${"%.2f" % min_average_price}')
+        print(f'    {df.shape[0]} stock(s) left')
+    return df
+
+
+
+if __name__ == '__main__':
+
+    # API constants
+    LIVE_TRADING = False
+    with open('credentials.json') as f:
+        creds = json.load(f)
+    API_KEY    = creds['live_trading' if LIVE_TRADING else 'paper_trading']['API_KEY_ID']
+    API_SECRET = creds['live_trading' if LIVE_TRADING else 'paper_trading']['SECRET_KEY']
+    HEADERS = {
+        "accept": "application/json",
+        "APCA-API-KEY-ID": API_KEY,
+        "APCA-API-SECRET-KEY": API_SECRET
+    }
+
+    input_filename = "all_shortable_alpaca_stocks.csv"
+    stocks = pd.read_csv(os.path.join(DATA_PATH, input_filename))['ticker'].tolist()
+    df = screen_stocks(
+        stocks,
+        BarCache(HEADERS),
+        output_filepath=os.path.join(DATA_PATH, 'stocks_on_alpaca_sorted_by_average_volume.csv'))
+    print(df)
@@ -15,6 +15,13 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import alpaca_trade_api as tradeapi
 from alpaca_trade_api.rest import TimeFrame, TimeFrameUnit, URL
+from bar_cache import BarCache, to_utc_datetime64
+from screen_stocks import screen_stocks
+from bar_store import build_bar_store_from_cache, STORE_PATH
+from compute_features import compute_features
+from alpaca.trading.client import TradingClient
+from asset_cache import AssetCache
+from asset_filter import filter_assets, ACTIVE, TRADABLE, MARGINABLE, SHORTABLE, EASY_TO_BORROW, FRACTIONABLE
 
 # repo path constants
 import pathlib
@@ -31,8 +38,14 @@ with open(os.path.join(DATA_PATH, 'credentials.json')) as f:
 ENDPOINT   = creds['live_trading' if LIVE_TRADING else 'paper_trading']['ENDPOINT']
 API_KEY    = creds['live_trading' if LIVE_TRADING else 'paper_trading']['API_KEY_ID']
 API_SECRET = creds['live_trading' if LIVE_TRADING else 'paper_trading']['SECRET_KEY']
+HEADERS = {
+    "accept": "application/json",
+    "APCA-API-KEY-ID": API_KEY,
+    "APCA-API-SECRET-KEY": API_SECRET
+}
 
 alpaca = tradeapi.REST(API_KEY, API_SECRET, URL(ENDPOINT), 'v2')
+asset_cache = AssetCache(TradingClient(API_KEY, API_SECRET)) # see asset_cache.py
 # tickers = ["AAPL", "MSFT"]
 # df = alpaca.get_bars(tickers, TimeFrame.Hour, "2021-06-08", "2021-06-08", adjustment='raw').df
 # print(df)
@@ -40,14 +53,14 @@ alpaca = tradeapi.REST(API_KEY, API_SECRET, URL(ENDPOINT), 'v2')
 # returns list of tickers
 def get_all_available_alpaca_stocks():
 	stock_category = 'all'
-	active_assets = alpaca.list_assets(
-		status='active', asset_class='us_equity')
-	return [asset.symbol for asset in active_assets if \
-		asset.tradable and \
-		asset.marginable and \
-		asset.shortable and \
-		asset.easy_to_borrow and \
-		asset.fractionable], stock_category
+	universe = asset_cache.frame() # see asset_filter.py
+	return filter_assets(universe,
+		ACTIVE & \
+		TRADABLE & \
+		MARGINABLE & \
+		SHORTABLE & \
+		EASY_TO_BORROW & \
+		FRACTIONABLE)['symbol'].tolist(), stock_category
 def get_all_sec_stocks_on_alpaca():
     filepath = os.path.join(DATA_PATH, 'ticker_data', 'all_sec_stocks_on_alpaca.csv')
     stock_category = 'all'
@@ -57,9 +70,7 @@ def get_all_sec_stocks_on_alpaca():
         available_tickers, _ = get_all_available_alpaca_stocks()
         sec_stocks_filepath = os.path.join(DATA_PATH, 'ticker_data', 'all_SEC_tickers.csv')
         df = pd.read_csv(sec_stocks_filepath, index_col=0)
-        sec_stocks = df['ticker'].tolist()
-        stocks = set(available_tickers).intersection(set(sec_stocks))
-        all_sec_stocks_on_alpaca = df[df['ticker'].isin(stocks)]
+        all_sec_stocks_on_alpaca = df[df['ticker'].isin(set(available_tickers))]
         all_sec_stocks_on_alpaca.to_csv(filepath)
     return all_sec_stocks_on_alpaca, stock_category
 
@@ -70,43 +81,16 @@ def sort_stocks_by_average_volume(stocks, plot=False, exclude_sp500_stocks=False
         sorted_stocks_df = pd.read_csv(filepath, index_col=0)
         sorted_stocks = sorted_stocks_df['ticker'].tolist()
     except:
-        average_volumes = {}
-        end_date = datetime.now(tz=timezone.utc)#tz=tzlocal())
-        # end_date = datetime(2022, 5, 30, tzinfo=timezone.utc) # they only have data for the past few months :(
-        # end_date_str = datetime.strftime(current_time, '%Y-%m-%d %H:%M:%S %Z')
-        start_date = end_date - timedelta(days=31)
-        interval = 'minute'
-        for i, ticker in enumerate(stocks):
-            raw_price_history = get_price_history(
-                ticker,
-                start_date,
-                end_date,
-                interval)
-            input()
-            volumes = [candle['volume'] for candle in raw_price_history['candles']]
-            # print('volumes', volumes)
-            # input()
-            if len(volumes) < 100:
-                print('ticker %d of %d: %s\tskipping b/c len(volumes) of %d < 100' % (
-                    i+1, len(stocks), ticker, len(volumes)))
-            else:
-                prices = [candle['close'] for candle in raw_price_history['candles']]
-                # print('prices', prices)
-                # input()
-                average_price = round(float(sum(prices)) / len(prices), 2)
-                if average_price < 1.00:
-                    print('ticker %d of %d: %s\tskipping b/c average_price of $%.2f < $1.00' % (
-                        i+1, len(stocks), ticker, average_price))
-                else:
-                    average_volumes[ticker] = round(float(sum(volumes)) / len(volumes), 2)
-                    print('ticker %d of %d: %s\taverage %s volume = $%.2f' % (
-                        i+1, len(stocks), ticker, interval, average_volumes[ticker]))
-            time.sleep(1)
-        sorted_average_volumes = sorted(average_volumes.items(), key=lambda x : x[1], reverse=True)
-        sorted_stocks = [ticker for ticker, volume in sorted_average_volumes]
+        # daily bars of every stock are downloaded in multi-symbol batches and averaged with numpy, see screen_stocks.py
+        # (this used to download 31 days of minute bars 1 ticker at a time with a 1 second sleep between each)
+        interval = 'day'
+        screened_df = screen_stocks(stocks, BarCache(HEADERS), days=31, min_bars=10, min_average_price=1.00)
+        sorted_stocks = screened_df['ticker'].tolist()
+        average_volumes = dict(zip(sorted_stocks, screened_df['average_volume']))
+        sorted_average_volumes = list(average_volumes.items())
         if plot: # plot used to verify sufficient volume in non sp500 stocks
             bars = [volume for ticker, volume in sorted_average_volumes]
-            sp500_stocks = pd.read_csv('sp500_tickers.csv')['ticker'].tolist()
+            sp500_stocks = set(pd.read_csv('sp500_tickers.csv')['ticker'])
             colors = ['red' if ticker in sp500_stocks else 'blue' for ticker in sorted_stocks]
             fig, ax = plt.subplots(1, 1)
             mng = plt.get_current_fig_manager()
@@ -124,24 +108,38 @@ def sort_stocks_by_average_volume(stocks, plot=False, exclude_sp500_stocks=False
             ax.format_coord = format_coord
             plt.show()
         if exclude_sp500_stocks:
-            sp500_stocks = pd.read_csv('sp500_tickers.csv')['ticker'].tolist()
+            sp500_stocks = set(pd.read_csv('sp500_tickers.csv')['ticker']) # set, so each "not in" is a hash lookup
             sorted_stocks = [ticker for ticker in sorted_stocks if ticker not in sp500_stocks]
             print('\nnon-sp500 tickers sorted descending volume:')
             for i, ticker in enumerate(sorted_stocks):
                 print('    ticker %d of %d\t%s average %s volume = $%.2f' % (
                     i+1, len(sorted_stocks), ticker, interval, average_volumes[ticker]))
-        sorted_stocks_df = pd.DataFrame(columns=df.columns.tolist()+['volume'])
         all_stocks_filepath = os.path.join(DATA_PATH, 'ticker_data', 'all_SEC_tickers.csv')
         df = pd.read_csv(all_stocks_filepath, index_col=0)
-        for ticker in sorted_stocks:
-            df2 = df[df['ticker'] == ticker].copy()
-            df2['volume'] = average_volumes[ticker]
-            sorted_stocks_df = pd.concat([sorted_stocks_df, df2])
-        sorted_stocks_df.reset_index(inplace=True, drop=True)
+        sorted_stocks_df = pd.DataFrame({'ticker' : sorted_stocks}).merge(df, on='ticker', how='left')
+        sorted_stocks_df = sorted_stocks_df[df.columns.tolist()]
+        sorted_stocks_df['volume'] = sorted_stocks_df['ticker'].map(average_volumes)
         sorted_stocks_df.to_csv(filepath)
     # print(sorted_stocks)
     # print(sorted_stocks_df)
     return sorted_stocks
+def rank_stocks_by_features(stocks, days=90, sort_by='average_dollar_volume', max_workers=None):
+    # volatility, ATR, spread, dollar volume, and beta of every stock, computed on a process pool (see compute_features.py)
+    end_date = datetime.now(tz=timezone.utc)
+    start_date = end_date - timedelta(days=days)
+    bar_cache = BarCache(HEADERS)
+    bar_cache.update(list(stocks) + ['SPY'], start_date, end_date, '1Day', adjustment='all', verbose=True)
+    # in its own store, data/bar_store/1Day/all is the whole universe (see get_price_history.py)
+    store = build_bar_store_from_cache(bar_cache, list(stocks) + ['SPY'], '1Day', adjustment='all',
+        store_path=os.path.join(STORE_PATH, '1Day', 'all_selected'))
+    # the store has every cached bar, so only the bars of the last days are used
+    # (and 1 bar before them is needed for the previous close of the 1st bar)
+    bars_in_window = len(store.times) - int(np.searchsorted(store.times, to_utc_datetime64(start_date)))
+    num_bars = min(bars_in_window, len(store.times) - 1)
+    filepath = os.path.join(DATA_PATH, 'ticker_data', 'stocks_on_alpaca_ranked_by_features.csv')
+    df = compute_features(store.store_path, symbols=stocks, num_bars=num_bars, sort_by=sort_by, max_workers=max_workers)
+    df.to_csv(filepath, index=False)
+    return df
 def get_price_history( # TO DO: debug this
     ticker,
     start_date,
@@ -257,6 +255,7 @@ if __name__ == '__main__':
     stocks, _ = get_all_sec_stocks_on_alpaca()
     # stocks, _ = get_all_available_alpaca_stocks()
     stocks = sort_stocks_by_average_volume(stocks, plot=False, exclude_sp500_stocks=True)
+    # features_df = rank_stocks_by_features(stocks)
     # stocks = pd.read_csv('stocks_on_td_ameritrade_sorted_by_average_volume.csv', index_col=0)['ticker'].tolist()
     # n = 500
     # stocks = stocks[:n]
@@ -0,0 +1,565 @@
+'''
+
+	Description:
+		local stand-in for alpaca.trading.client.TradingClient that fills orders against
+        recorded or replayed quotes, so order placing code (ex: place_order.py, bulk_orders.py, close_and_cancel.py)
+        can be tested offline, outside of market hours, without the API rate limit
+
+        implements the part of TradingClient used in this repo:
+            submit_order, replace_order_by_id, get_orders, get_order_by_id, cancel_orders, cancel_order_by_id,
+            get_all_positions, get_open_position, close_position, close_all_positions, get_account, get_all_assets
+        and returns the same alpaca-py models (Order, Position, TradeAccount, ...), errors are raised as
+        SimulatedAPIError (an alpaca.common.exceptions.APIError with a status_code like the real 1)
+
+        quotes come from set_quote() (ex: from a live quote stream) or replay() (ex: quotes.csv saved by
+        realtime_stock_spreads_from_async_streams_using_multiprocessing.py), and the clock of the broker is
+        the timestamp of the latest quote
+
+        matching:
+            market orders - buy at the ask, sell at the bid of the 1st quote after they reach the market
+            limit orders  - buy once the ask <= limit_price, sell once the bid >= limit_price, at the ask / bid
+            ioc / fok     - canceled if they can't fill on the 1st quote they see
+            orders reach the market latency seconds (of quote time) after they're submitted,
+            so with latency > 0 an order can only fill on a later quote, like it would live
+            every order fills completely (quote sizes are ignored)
+
+        assets are every symbol with a quote or set with set_asset(), tradable, marginable, shortable, easy to borrow,
+        and fractionable unless set_asset() says otherwise, so an AssetCache (see asset_cache.py) works offline too
+
+        every change is also sent to a TradeUpdateListener (see trade_updates.py) as a TradeUpdate
+        ('new', 'fill', 'canceled', 'expired', 'replaced'), like the trade_updates stream, so the order book,
+        tracer, risk checks, and close / cancel confirmations work the same as live
+
+        example:
+            listener = TradeUpdateListener()
+            broker = SimulatedBroker(cash=100000, latency=0.05, listener=listener)
+            broker.set_quote('AAPL', 189.99, 190.01)
+            results = submit_orders_in_bulk(broker, specs, asset_cache=None)
+            broker.replay('quotes.csv')
+
+	Sources:
+        https://alpaca.markets/sdks/python/api_reference/trading_api.html
+        https://alpaca.markets/sdks/python/api_reference/trading/models.html
+        https://docs.alpaca.markets/docs/paper-trading
+
+	'''
+
+# standard libraries
+import time
+import uuid
+import threading
+from datetime import datetime, timezone
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from alpaca.common.exceptions import APIError
+from alpaca.trading.models import Order, Position, TradeAccount, ClosePositionResponse, TradeUpdate, Asset
+from alpaca.trading.requests import CancelOrderResponse, MarketOrderRequest, LimitOrderRequest
+
+
+QTY_TOLERANCE = 1e-9 # fractional shares
+QUOTE_COLUMNS = ['symbol', 'timestamp', 'bid_price', 'ask_price']
+ASSET_FLAGS = {'tradable' : True, 'marginable' : True, 'shortable' : True, 'easy_to_borrow' : True, 'fractionable' : True}
+
+class SimulatedAPIError(APIError):
+
+    def __init__(self, status_code, message):
+        super().__init__(f'{{"code":{status_code}00000,"message":"{message}"}}')
+        self._status_code = status_code
+
+    @property
+    def status_code(self):
+        return self._status_code
+
+def value_of(x):
+    # enum or string -> string, ex: OrderSide.BUY -> 'buy'
+    return getattr(x, 'value', x)
+
+def to_datetime(epoch_seconds):
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc)
+
+class SimulatedBroker:
+
+    def __init__(
+        self,
+        cash=100000.0,
+        latency=0.0,
+        listener=None,
+        shorting_enabled=True,
+        multiplier=2.0):
+
+        ''' SimulatedBroker()
+            args:
+                cash - float - starting cash
+                latency - float - seconds from submitting an order to it reaching the market (in quote time)
+                listener - TradeUpdateListener - gets a TradeUpdate for each order event (see trade_updates.py)
+                shorting_enabled - boolean - False to reject orders that open a short position
+                multiplier - float - buying power multiplier of the account (1 for a cash account)
+            '''
+        self.cash = float(cash)
+        self.latency = latency
+        self.listener = listener
+        self.shorting_enabled = shorting_enabled
+        self.multiplier = multiplier
+        self.account_id = uuid.uuid4()
+        self.lock = threading.RLock()
+        self.now = time.time() # epoch seconds of the latest quote
+        self.quotes = {} # symbol -> (bid, ask)
+        self.orders = {} # order id (string) -> order dictionary, every order ever submitted
+        self.open_order_ids = {} # symbol -> list of the ids of its open orders, oldest 1st
+        self.client_order_ids = set()
+        self.positions = {} # symbol -> {'qty' : signed float, 'avg_entry_price' : float}
+        self.reserved = 0.0 # dollars of buying power held by the open buy orders
+        self.asset_ids = {} # symbol -> made up asset id
+        self.asset_flags = {} # symbol -> flags set with set_asset() (see ASSET_FLAGS)
+        self.num_fills = 0
+
+    ####### quotes #######
+
+    def set_quote(self, symbol, bid, ask, timestamp=None):
+        # new quote of symbol, which fills any open order of symbol it can
+        # timestamp - datetime or epoch seconds, defaults to now
+        with self.lock:
+            if timestamp == None:
+                self.now = max(self.now, time.time())
+            else:
+                self.now = timestamp.timestamp() if isinstance(timestamp, datetime) else float(timestamp)
+            self.quotes[symbol] = (float(bid), float(ask))
+            self.match(symbol)
+
+    def replay(self, quotes, callback=None):
+
+        ''' replay()
+            description:
+                feed recorded quotes to the broker in time order
+            args:
+                quotes - pandas dataframe or csv filepath - with QUOTE_COLUMNS
+                    (ex: quotes.csv from realtime_stock_spreads_from_async_streams_using_multiprocessing.py)
+                callback - function - optional, callback(broker, symbol, bid, ask, timestamp) after each quote,
+                    where a strategy can place and cancel orders
+            returns:
+                int - number of quotes replayed
+            '''
+        df = pd.read_csv(quotes) if isinstance(quotes, str) else quotes
+        df = df[QUOTE_COLUMNS].dropna()
+        times = pd.to_datetime(df['timestamp'], utc=True, format='mixed').dt.tz_convert(None)
+        epochs = times.to_numpy().astype('datetime64[ns]').astype(np.int64) / 1e9
+        order = np.argsort(epochs, kind='stable')
+        symbols = df['symbol'].to_numpy()[order]
+        bids = df['bid_price'].to_numpy(dtype=float)[order]
+        asks = df['ask_price'].to_numpy(dtype=float)[order]
+        epochs = epochs[order]
+        for symbol, bid, ask, timestamp in zip(symbols, bids, asks, epochs):
+            self.set_quote(symbol, bid, ask, timestamp)
+            if callback != None:
+                callback(self, symbol, bid, ask, timestamp)
+        return len(symbols)
+
+    def price(self, symbol):
+        # mid price of the latest quote of symbol, or None if it has no quote
+        quote = self.quotes.get(symbol)
+        return None if quote == None else (quote[0] + quote[1]) / 2
+
+    ####### matching #######
+
+    def match(self, symbol):
+        # caller must hold self.lock
+        # fill the open orders of symbol that have reached the market and can fill at the latest quote
+        quote = self.quotes.get(symbol)
+        if quote == None or symbol not in self.open_order_ids:
+            return
+        bid, ask = quote
+        for order_id in list(self.open_order_ids[symbol]):
+            order = self.orders[order_id]
+            if order['active_at'] > self.now:
+                continue
+            price = ask if order['side'] == 'buy' else bid
+            if order['type'] == 'limit' and \
+                (price > order['limit_price'] if order['side'] == 'buy' else price < order['limit_price']):
+                if order['time_in_force'] in ('ioc', 'fok'):
+                    self.finish(order, 'canceled')
+                continue
+            if not price > 0: # 1 sided quote
+                continue
+            self.fill(order, price)
+
+    def fill(self, order, price):
+        # caller must hold self.lock
+        symbol = order['symbol']
+        qty = order['qty'] if order['qty'] != None else order['notional'] / price
+        signed_qty = qty if order['side'] == 'buy' else -qty
+        position = self.positions.get(symbol, {'qty' : 0.0, 'avg_entry_price' : 0.0})
+        old_qty = position['qty']
+        new_qty = old_qty + signed_qty
+        if abs(new_qty) < QTY_TOLERANCE:
+            self.positions.pop(symbol, None)
+        else:
+            if old_qty * new_qty < 0 or abs(old_qty) < QTY_TOLERANCE:
+                avg_entry_price = price
+            elif abs(new_qty) > abs(old_qty):
+                avg_entry_price = (abs(old_qty) * position['avg_entry_price'] + abs(signed_qty) * price) / abs(new_qty)
+            else:
+                avg_entry_price = position['avg_entry_price']
+            self.positions[symbol] = {'qty' : new_qty, 'avg_entry_price' : avg_entry_price}
+        self.cash -= signed_qty * price
+        order['filled_qty'] = qty
+        order['filled_avg_price'] = price
+        order['filled_at'] = self.now
+        self.num_fills += 1
+        self.finish(order, 'filled', event='fill', price=price, qty=qty, position_qty=new_qty)
+
+    def finish(self, order, status, event=None, **fields):
+        # caller must hold self.lock
+        # move an open order to its final status, and send its trade update
+        order['status'] = status
+        order['updated_at'] = self.now
+        self.reserved -= order['reserved']
+        if status in ('canceled', 'expired'):
+            order[f'{status}_at'] = self.now
+        open_order_ids = self.open_order_ids[order['symbol']]
+        open_order_ids.remove(order['id'])
+        if len(open_order_ids) == 0:
+            del self.open_order_ids[order['symbol']]
+        self.send_update(event or status, order, **fields)
+
+    def send_update(self, event, order, **fields):
+        # caller must hold self.lock, so the listener gets the updates in order
+        if self.listener == None:
+            return
+        self.listener.handle(TradeUpdate(event=event, order=self.order_model(order), timestamp=to_datetime(self.now), **fields))
+
+    def expire_day_orders(self):
+        # expire the open 'day' orders, like at the end of a trading day
+        with self.lock:
+            for order_id in [order_id for order_ids in self.open_order_ids.values() for order_id in order_ids]:
+                if self.orders[order_id]['time_in_force'] == 'day':
+                    self.finish(self.orders[order_id], 'expired')
+
+    def set_asset(self, symbol, **flags):
+        # ex: set_asset('GME', shortable=False), flags not given keep their values (see ASSET_FLAGS)
+        with self.lock:
+            self.asset_flags[symbol] = dict(self.asset_flags.get(symbol, ASSET_FLAGS), **flags)
+
+    ####### models #######
+
+    def asset_id(self, symbol):
+        if symbol not in self.asset_ids:
+            self.asset_ids[symbol] = uuid.uuid5(uuid.NAMESPACE_OID, symbol)
+        return self.asset_ids[symbol]
+
+    def order_model(self, order):
+        # order dictionary -> alpaca.trading.models.Order
+        return Order(
+            id=order['id'],
+            client_order_id=order['client_order_id'],
+            created_at=to_datetime(order['submitted_at']),
+            updated_at=to_datetime(order['updated_at']),
+            submitted_at=to_datetime(order['submitted_at']),
+            filled_at=None if order['filled_at'] == None else to_datetime(order['filled_at']),
+            canceled_at=None if order['canceled_at'] == None else to_datetime(order['canceled_at']),
+            expired_at=None if order['expired_at'] == None else to_datetime(order['expired_at']),
+            asset_id=self.asset_id(order['symbol']),
+            symbol=order['symbol'],
+            asset_class='us_equity',
+            qty=None if order['qty'] == None else str(order['qty']),
+            notional=None if order['notional'] == None else str(order['notional']),
+            filled_qty=str(order['filled_qty']),
+            filled_avg_price=None if order['filled_avg_price'] == None else str(order['filled_avg_price']),
+            order_class='simple',
+            order_type=order['type'],
+            type=order['type'],
+            side=order['side'],
+            time_in_force=order['time_in_force'],
+            limit_price=None if order['limit_price'] == None else str(order['limit_price']),
+            status=order['status'],
+            extended_hours=order['extended_hours'])
+
+    def position_model(self, symbol):
+        # caller must hold self.lock
+        position = self.positions[symbol]
+        qty = position['qty']
+        price = self.price(symbol) or position['avg_entry_price']
+        cost_basis = qty * position['avg_entry_price']
+        market_value = qty * price
+        return Position(
+            asset_id=self.asset_id(symbol),
+            symbol=symbol,
+            exchange='NASDAQ',
+            asset_class='us_equity',
+            avg_entry_price=str(position['avg_entry_price']),
+            qty=str(abs(qty)),
+            qty_available=str(abs(qty)),
+            side='long' if qty > 0 else 'short',
+            market_value=str(market_value),
+            cost_basis=str(cost_basis),
+            unrealized_pl=str(market_value - cost_basis),
+            unrealized_plpc=str((market_value - cost_basis) / abs(cost_basis) if cost_basis != 0 else 0.0),
+            current_price=str(price))
+
+    ####### TradingClient #######
+
+    def submit_order(self, order_data):
+        # order_data - MarketOrderRequest or LimitOrderRequest, returns alpaca.trading.models.Order
+        with self.lock:
+            order_type = value_of(order_data.type)
+            side = value_of(order_data.side)
+            symbol = order_data.symbol
+            client_order_id = order_data.client_order_id or str(uuid.uuid4())
+            if order_type not in ('market', 'limit'):
+                raise SimulatedAPIError(422, f'{order_type} orders are not simulated')
+            if client_order_id in self.client_order_ids:
+                raise SimulatedAPIError(422, 'client_order_id must be unique')
+            qty = None if order_data.qty == None else float(order_data.qty)
+            notional = None if order_data.notional == None else float(order_data.notional)
+            limit_price = None if order_type != 'limit' else float(order_data.limit_price)
+            price = limit_price or self.price(symbol)
+            position_qty = self.positions.get(symbol, {'qty' : 0.0})['qty']
+            signed_qty = (qty if qty != None else notional / price if price else 0.0) * (1 if side == 'buy' else -1)
+            if position_qty + signed_qty < min(position_qty, 0.0) - QTY_TOLERANCE:
+                if not self.shorting_enabled:
+                    raise SimulatedAPIError(403, 'account is not allowed to short')
+                if notional != None or qty != int(qty):
+                    raise SimulatedAPIError(422, 'fractional orders cannot be sold short')
+            closing_qty = min(abs(signed_qty), abs(position_qty)) if position_qty * signed_qty < 0 else 0.0
+            opening_notional = (abs(signed_qty) - closing_qty) * (price or 0.0)
+            if opening_notional > self.account_values()[0] + QTY_TOLERANCE:
+                raise SimulatedAPIError(403, 'insufficient buying power')
+            order = {
+                'id'               : str(uuid.uuid4()),
+                'client_order_id'  : client_order_id,
+                'symbol'           : symbol,
+                'side'             : side,
+                'type'             : order_type,
+                'qty'              : qty,
+                'notional'         : notional,
+                'limit_price'      : limit_price,
+                'time_in_force'    : value_of(order_data.time_in_force),
+                'extended_hours'   : bool(order_data.extended_hours),
+                'status'           : 'new',
+                'submitted_at'     : self.now,
+                'updated_at'       : self.now,
+                'active_at'        : self.now + self.latency,
+                'filled_qty'       : 0.0,
+                'filled_avg_price' : None,
+                'filled_at'        : None,
+                'canceled_at'      : None,
+                'expired_at'       : None,
+                'reserved'         : opening_notional if side == 'buy' else 0.0,
+            }
+            self.client_order_ids.add(client_order_id)
+            self.orders[order['id']] = order
+            self.reserved += order['reserved']
+            self.open_order_ids.setdefault(symbol, []).append(order['id'])
+            model = self.order_model(order) # the response is the order as it was accepted
+            self.send_update('new', order)
+            if self.latency == 0:
+                self.match(symbol)
+            return model
+
+    def replace_order_by_id(self, order_id, order_data=None):
+        # order_data - ReplaceOrderRequest - new qty / limit_price / time_in_force / client_order_id,
+        # the open order is replaced by a new order, which is returned
+        with self.lock:
+            order = self.orders.get(str(order_id))
+            if order == None:
+                raise SimulatedAPIError(404, 'order not found')
+            if order['status'] != 'new':
+                raise SimulatedAPIError(422, f'order is already in "{order["status"]}" state')
+            request_class = LimitOrderRequest if order['type'] == 'limit' else MarketOrderRequest
+            kwargs = dict(
+                symbol=order['symbol'],
+                side=order['side'],
+                qty=order['qty'] if getattr(order_data, 'qty', None) == None else order_data.qty,
+                notional=order['notional'] if getattr(order_data, 'qty', None) == None else None,
+                time_in_force=getattr(order_data, 'time_in_force', None) or order['time_in_force'],
+                client_order_id=getattr(order_data, 'client_order_id', None),
+                extended_hours=order['extended_hours'])
+            if order['type'] == 'limit':
+                kwargs['limit_price'] = getattr(order_data, 'limit_price', None) or order['limit_price']
+            # the buying power held by the replaced order is free for its replacement
+            reserved, order['reserved'] = order['reserved'], 0.0
+            self.reserved -= reserved
+            try:
+                new_order = self.submit_order(request_class(**kwargs))
+            except Exception:
+                self.reserved += reserved
+                order['reserved'] = reserved
+                raise
+            if order['status'] == 'new': # else it filled while the replacement was submitted
+                self.finish(order, 'replaced')
+            return new_order
+
+    def get_orders(self, filter=None):
+        # filter - GetOrdersRequest - status (default open), symbols, side, after, until, direction, limit (default 50)
+        status = value_of(getattr(filter, 'status', None)) or 'open'
+        symbols = getattr(filter, 'symbols', None)
+        side = value_of(getattr(filter, 'side', None))
+        after, until = getattr(filter, 'after', None), getattr(filter, 'until', None)
+        limit = getattr(filter, 'limit', None) or 50
+        with self.lock:
+            orders = []
+            for order in reversed(list(self.orders.values())): # newest 1st
+                is_open = order['status'] == 'new'
+                if (status == 'open' and not is_open) or (status == 'closed' and is_open) or \
+                    (symbols != None and order['symbol'] not in symbols) or \
+                    (side != None and order['side'] != side) or \
+                    (after != None and order['submitted_at'] <= after.timestamp()) or \
+                    (until != None and order['submitted_at'] >= until.timestamp()):
+                    continue
+                orders.append(order)
+            if value_of(getattr(filter, 'direction', None)) == 'asc':
+                orders.reverse()
+            return [self.order_model(order) for order in orders[:limit]]
+
+    def get_order_by_id(self, order_id):
+        with self.lock:
+            order = self.orders.get(str(order_id))
+            if order == None:
+                raise SimulatedAPIError(404, 'order not found')
+            return self.order_model(order)
+
+    def cancel_order_by_id(self, order_id):
+        with self.lock:
+            order = self.orders.get(str(order_id))
+            if order == None:
+                raise SimulatedAPIError(404, 'order not found')
+            if order['status'] != 'new':
+                raise SimulatedAPIError(422, f'order is already in "{order["status"]}" state')
+            self.finish(order, 'canceled')
+
+    def cancel_orders(self):
+        # cancel every open order, returns list of CancelOrderResponse
+        with self.lock:
+            order_ids = [order_id for order_ids in self.open_order_ids.values() for order_id in order_ids]
+            for order_id in order_ids:
+                self.finish(self.orders[order_id], 'canceled')
+            return [CancelOrderResponse(id=order_id, status=200) for order_id in order_ids]
+
+    def get_all_positions(self):
+        with self.lock:
+            return [self.position_model(symbol) for symbol in self.positions]
+
+    def get_open_position(self, symbol_or_asset_id):
+        with self.lock:
+            if symbol_or_asset_id not in self.positions:
+                raise SimulatedAPIError(404, 'position does not exist')
+            return self.position_model(symbol_or_asset_id)
+
+    def close_position(self, symbol_or_asset_id, close_options=None):
+        # market order for the whole position (or close_options.qty / percentage of it)
+        with self.lock:
+            if symbol_or_asset_id not in self.positions:
+                raise SimulatedAPIError(404, 'position does not exist')
+            position_qty = self.positions[symbol_or_asset_id]['qty']
+            qty = abs(position_qty)
+            if getattr(close_options, 'qty', None) != None:
+                qty = min(float(close_options.qty), qty)
+            elif getattr(close_options, 'percentage', None) != None:
+                qty = qty * float(close_options.percentage) / 100
+            return self.submit_order(MarketOrderRequest(
+                symbol=symbol_or_asset_id,
+                qty=qty,
+                side='sell' if position_qty > 0 else 'buy',
+                time_in_force='day'))
+
+    def close_all_positions(self, cancel_orders=None):
+        # returns list of ClosePositionResponse
+        with self.lock:
+            if cancel_orders:
+                self.cancel_orders()
+            responses = []
+            for symbol in list(self.positions):
+                order = self.close_position(symbol)
+                responses.append(ClosePositionResponse(order_id=order.id, status=200, symbol=symbol, body=order))
+            return responses
+
+    def get_all_assets(self, filter=None):
+        # filter - GetAssetsRequest - only us_equity assets are simulated, so it's ignored
+        with self.lock:
+            return [Asset(**{
+                'id'       : self.asset_id(symbol),
+                'symbol'   : symbol,
+                'name'     : symbol,
+                'class'    : 'us_equity', # asset_class is called "class" in the API
+                'exchange' : 'NASDAQ',
+                'status'   : 'active',
+                **self.asset_flags.get(symbol, ASSET_FLAGS)}) for symbol in sorted(set(self.quotes) | set(self.asset_flags))]
+
+    def account_values(self):
+        # caller must hold self.lock
+        # (buying power, equity), buying power = equity * multiplier - value of the positions - cost of the open buy orders
+        equity = self.cash
+        exposure = self.reserved
+        for symbol, position in self.positions.items():
+            value = position['qty'] * (self.price(symbol) or position['avg_entry_price'])
+            equity += value
+            exposure += abs(value)
+        return max(equity * self.multiplier - exposure, 0.0), equity
+
+    def get_account(self):
+        with self.lock:
+            buying_power, equity = self.account_values()
+            long_market_value = sum(max(position['qty'], 0.0) * (self.price(symbol) or position['avg_entry_price']) \
+                for symbol, position in self.positions.items())
+            return TradeAccount(
+                id=self.account_id,
+                account_number='SIMULATED',
+                status='ACTIVE',
+                currency='USD',
+                cash=str(self.cash),
+                equity=str(equity),
+                last_equity=str(equity),
+                portfolio_value=str(equity),
+                buying_power=str(buying_power),
+                regt_buying_power=str(buying_power),
+                long_market_value=str(long_market_value),
+                short_market_value=str(equity - self.cash - long_market_value),
+                multiplier=str(self.multiplier),
+                shorting_enabled=self.shorting_enabled,
+                daytrade_count=0,
+                pattern_day_trader=False,
+                trading_blocked=False,
+                transfers_blocked=False,
+                account_blocked=False,
+                trade_suspended_by_user=False)
+
+
+
+if __name__ == '__main__':
+
+    # benchmark: a random walk of quotes of 100 symbols, with a buy and a sell limit order at the touch on 1 of every 10 quotes
+    from trade_updates import TradeUpdateListener
+    from order_book import OrderBook
+    from bulk_orders import spec_to_request
+
+    listener = TradeUpdateListener()
+    broker = SimulatedBroker(cash=1e9, latency=0.01, listener=listener)
+    order_book = OrderBook(broker, listener, reconcile_interval=None)
+    order_book.start()
+    rng = np.random.default_rng(0)
+    symbols = [f'S{i}' for i in range(100)]
+    num_quotes = 50000
+    quotes = pd.DataFrame({
+        'symbol'    : rng.choice(symbols, num_quotes),
+        'timestamp' : pd.Timestamp('2024-01-02 14:30', tz='UTC') + pd.to_timedelta(np.arange(num_quotes) * 0.001, unit='s'),
+        'bid_price' : 100 + np.cumsum(rng.normal(0, 0.01, num_quotes)),
+    })
+    quotes['ask_price'] = quotes['bid_price'] + 0.02
+    num_orders = 0
+    def place_orders(broker, symbol, bid, ask, timestamp):
+        global num_orders
+        if rng.random() > 0.1:
+            return
+        for side in ('buy', 'sell'):
+            spec = {'symbol' : symbol, 'side' : side, 'qty' : 1, 'type' : 'limit',
+                'limit_price' : round(bid if side == 'buy' else ask, 2)}
+            broker.submit_order(spec_to_request(spec, str(uuid.uuid4())))
+            num_orders += 1
+    start_time = time.time()
+    broker.replay(quotes, callback=place_orders)
+    seconds = time.time() - start_time
+    print(f'replayed {num_quotes} quotes and {num_orders} orders ({broker.num_fills} fills) in {"%.2f" % seconds} second(s): ' + \
+        f'{"%.0f" % (num_orders / seconds)} orders / second')
+    print(f'order book matches the broker: {order_book.reconcile() == 0}')
+    print(broker.get_account())
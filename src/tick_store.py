@@ -0,0 +1,232 @@
+'''
+
+	Description:
+		columnar local store of historical trades (ticks) from the stocks/trades endpoint
+
+        trades are saved in 1 numpy file per symbol per chunk of time:
+            data/tick_store/trades/<feed>/<symbol>/<chunk start, YYYYMMDDTHHMMSS>.npz
+        each file holds 1 typed array per column (see TRADE_COLUMN_DTYPES), sorted by time,
+        and chunks start on a fixed grid (multiples of the chunk size since the epoch)
+        so the same time always lands in the same file however the downloads were split up
+
+        each <feed> directory has a coverage.json that records which time intervals have been downloaded
+        for each symbol (like the bar cache, see bar_cache.py), so a download only fetches what isn't covered
+        and picks up where it left off if it died halfway. a chunk is only marked covered once its file is written
+        (a chunk with no trades, ex: a night or a weekend, has no file, it's only marked covered)
+
+        load() returns the trades of a symbol between 2 times as a dictionary of numpy arrays,
+        only opening the chunk files that overlap them
+
+	Sources:
+        https://docs.alpaca.markets/reference/stocktrades
+        https://numpy.org/doc/stable/reference/generated/numpy.savez.html
+
+	'''
+
+# standard libraries
+import os
+import json
+import pathlib
+import threading
+REPO_PATH = str(pathlib.Path(__file__).resolve().parent.parent)
+TICK_STORE_PATH = os.path.join(REPO_PATH, "data", "tick_store", "trades")
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from bar_cache import to_utc_datetime64, to_rfc3339, merge_intervals
+
+
+CHUNK_SIZE = np.timedelta64(1, 'h')
+CHUNK_FILENAME_FORMAT = '%Y%m%dT%H%M%S'
+TRADE_COLUMN_NAMES = {
+    't' : "time",
+    'p' : "price",
+    's' : "size",
+    'x' : "exchange",
+    'i' : "id",
+    'c' : "conditions",
+    'z' : "tape",
+}
+TRADE_COLUMN_DTYPES = {
+    "time"       : 'datetime64[ns]', # UTC
+    "price"      : np.float64,
+    "size"       : np.float64, # float b/c fractional sizes aren't whole numbers
+    "exchange"   : str,
+    "id"         : np.int64,
+    "conditions" : str, # comma separated condition codes
+    "tape"       : str,
+}
+TRADE_COLUMNS = list(TRADE_COLUMN_DTYPES.keys())
+
+def trades_to_columns(trades):
+    # list of trade dictionaries from the API -> dictionary of typed numpy arrays
+    # numpy doesn't parse the "Z" at the end, all trade times are UTC
+    return {
+        'time'       : np.array([trade['t'].rstrip('Z') for trade in trades], dtype='datetime64[ns]'),
+        'price'      : np.array([trade['p'] for trade in trades], dtype=np.float64),
+        'size'       : np.array([trade['s'] for trade in trades], dtype=np.float64),
+        'exchange'   : np.array([trade.get('x', '') for trade in trades], dtype=str),
+        'id'         : np.array([trade.get('i', 0) for trade in trades], dtype=np.int64),
+        'conditions' : np.array([','.join(trade.get('c') or []) for trade in trades], dtype=str),
+        'tape'       : np.array([trade.get('z', '') for trade in trades], dtype=str),
+    }
+
+def concat_trades(chunks):
+    # list of column dictionaries (of the same symbol) -> 1 column dictionary
+    chunks = [chunk for chunk in chunks if len(chunk['time']) > 0]
+    if len(chunks) == 0:
+        return {column : np.array([], dtype=dtype) for column, dtype in TRADE_COLUMN_DTYPES.items()}
+    if len(chunks) == 1:
+        return chunks[0]
+    return {column : np.concatenate([chunk[column] for chunk in chunks]) for column in TRADE_COLUMNS}
+
+def select_rows(columns, mask):
+    return {column : values[mask] for column, values in columns.items()}
+
+def chunk_start(t, chunk_size=CHUNK_SIZE):
+    # start of the grid chunk that t is in
+    t = np.datetime64(t, 'ns')
+    size = int(chunk_size.astype('timedelta64[ns]').astype(np.int64))
+    return np.datetime64(int(t.astype(np.int64)) // size * size, 'ns')
+
+def split_into_chunks(start, end, chunk_size=CHUNK_SIZE):
+    # [start, end) -> list of (chunk start, start, end) of each grid chunk it overlaps, clipped to [start, end)
+    chunks = []
+    t = chunk_start(start, chunk_size)
+    while t < end:
+        chunks.append((t, max(t, start), min(t + chunk_size, end)))
+        t = t + chunk_size
+    return chunks
+
+class TickStore:
+
+    def __init__(self, store_path=TICK_STORE_PATH, feed='iex', chunk_size=CHUNK_SIZE):
+        self.dir_path = os.path.join(store_path, feed)
+        self.chunk_size = chunk_size.astype('timedelta64[ns]')
+        self.lock = threading.Lock()
+        self.file_locks = {} # chunk file path -> lock, 2 jobs can download different parts of the same chunk
+        os.makedirs(self.dir_path, exist_ok=True)
+        self.coverage = self.load_coverage()
+        self.coverage_changed = False # since it was last saved
+
+    ####### coverage #######
+
+    def load_coverage(self):
+        # returns dictionary of symbol -> list of [start, end] as numpy datetime64
+        filepath = os.path.join(self.dir_path, 'coverage.json')
+        if not os.path.exists(filepath):
+            return {}
+        with open(filepath) as f:
+            coverage = json.load(f)
+        return {symbol : [[np.datetime64(start.rstrip('Z'), 'ns'), np.datetime64(end.rstrip('Z'), 'ns')] \
+            for start, end in intervals] for symbol, intervals in coverage.items()}
+
+    def save_coverage(self):
+        # save the coverage if it changed since it was last saved
+        with self.lock:
+            if self.coverage_changed:
+                self.write_coverage()
+
+    def write_coverage(self):
+        # caller must hold self.lock
+        # written to a temp file then renamed so a crash can't leave a half written index
+        filepath = os.path.join(self.dir_path, 'coverage.json')
+        with open(filepath + '.tmp', 'w') as f:
+            json.dump({symbol : [[to_rfc3339(start), to_rfc3339(end)] for start, end in intervals] \
+                for symbol, intervals in sorted(self.coverage.items())}, f)
+        os.replace(filepath + '.tmp', filepath)
+        self.coverage_changed = False
+
+    def covered(self, symbol):
+        with self.lock:
+            return list(self.coverage.get(symbol, []))
+
+    ####### files #######
+
+    def chunk_path(self, symbol, start):
+        name = pd.Timestamp(chunk_start(start, self.chunk_size)).strftime(CHUNK_FILENAME_FORMAT)
+        return os.path.join(self.dir_path, symbol, f'{name}.npz')
+
+    def load_chunk(self, filepath):
+        if not os.path.exists(filepath):
+            return concat_trades([])
+        with np.load(filepath) as npz:
+            return {column : npz[column] for column in TRADE_COLUMNS}
+
+    def write(self, symbol, start, end, columns, covered=True, save=True):
+
+        ''' write()
+            description:
+                save the trades of symbol in [start, end) (all inside 1 chunk), replacing whatever
+                the chunk's file had in [start, end) and keeping the rest, then mark [start, end) covered
+            args:
+                symbol - string - ticker symbol
+                start - numpy datetime64 - start of the interval downloaded
+                end - numpy datetime64 - end of the interval downloaded (exclusive)
+                columns - dictionary of numpy arrays - see TRADE_COLUMNS, sorted by time
+                covered - bool - False to save the trades without marking the interval covered
+                          (ex: the interval isn't over yet, so more trades can still come)
+                save - bool - False to only mark it covered in memory until save_coverage() is called
+                       (ex: once every 100s of writes, coverage.json has every symbol's intervals)
+            returns:
+                int - number of trades saved
+            '''
+        num_trades = len(columns['time'])
+        filepath = self.chunk_path(symbol, start)
+        with self.lock:
+            file_lock = self.file_locks.setdefault(filepath, threading.Lock())
+        with file_lock:
+            existing = self.load_chunk(filepath)
+            if len(existing['time']) > 0:
+                keep = (existing['time'] < start) | (existing['time'] >= end)
+                columns = concat_trades([select_rows(existing, keep), columns])
+                columns = select_rows(columns, np.argsort(columns['time'], kind='stable'))
+            if len(columns['time']) > 0:
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                with open(filepath + '.tmp', 'wb') as f:
+                    np.savez(f, **columns)
+                os.replace(filepath + '.tmp', filepath)
+            elif os.path.exists(filepath):
+                os.remove(filepath)
+        if covered:
+            with self.lock:
+                self.coverage[symbol] = merge_intervals(self.coverage.get(symbol, []) + [[start, end]])
+                self.coverage_changed = True
+                if save:
+                    self.write_coverage()
+        return num_trades
+
+    ####### reading #######
+
+    def symbols(self):
+        return sorted(name for name in os.listdir(self.dir_path) if os.path.isdir(os.path.join(self.dir_path, name)))
+
+    def load(self, symbol, start=None, end=None):
+        # trades of symbol in [start, end) (defaults to all of them) as a dictionary of numpy arrays, sorted by time
+        dir_path = os.path.join(self.dir_path, symbol)
+        if not os.path.isdir(dir_path):
+            return concat_trades([])
+        start = None if start == None else to_utc_datetime64(start)
+        end = None if end == None else to_utc_datetime64(end)
+        chunks = []
+        for filename in sorted(os.listdir(dir_path)):
+            if not filename.endswith('.npz'):
+                continue
+            file_start = np.datetime64(pd.Timestamp(filename[:-len('.npz')]).to_datetime64(), 'ns')
+            if (end != None and file_start >= end) or (start != None and file_start + self.chunk_size <= start):
+                continue
+            chunks.append(self.load_chunk(os.path.join(dir_path, filename)))
+        columns = concat_trades(chunks)
+        mask = np.ones(len(columns['time']), dtype=bool)
+        if start != None:
+            mask &= columns['time'] >= start
+        if end != None:
+            mask &= columns['time'] < end
+        return select_rows(columns, mask)
+
+    def frame(self, symbol, start=None, end=None):
+        # same as load() as a pandas dataframe, time is in UTC
+        df = pd.DataFrame(self.load(symbol, start, end))
+        df['time'] = df['time'].dt.tz_localize('UTC')
+        return df
@@ -0,0 +1,184 @@
+'''
+
+	Description:
+		parallel download of historical trades of many symbols over days into the tick store (see tick_store.py)
+
+        get_stock_trades() (see get_trade_history.py) makes 1 request per page of 10000 trades, 1 after another,
+        and turns every trade into a model object. a day of a liquid symbol is 100s of pages, so instead
+        the requested window is split into chunks of time (on the tick store's grid, 1 hour by default)
+        and every chunk is paged through at the same time from a pool of threads, all sharing the rate budget,
+        so the download runs as fast as the rate limit allows instead of at 1 page per round trip
+
+        each page's json is turned straight into typed numpy columns (no model objects),
+        and each chunk is written to its symbol's chunk file as soon as its last page comes in
+        (chunks without trades, ex: nights and weekends, aren't written, only marked covered).
+        the coverage is saved every COVERAGE_SAVE_INTERVAL jobs and at the end, not after every chunk.
+        only the chunks not already covered by the store are downloaded, so an interrupted download
+        is resumed by running it again. symbols sharing the same missing chunk share requests
+        (symbols_per_request of them per request, the pages are sorted by symbol then time)
+
+        download_trades() returns a report of the trades downloaded of each symbol and the throughput
+
+	Sources:
+        https://docs.alpaca.markets/reference/stocktrades
+        https://docs.alpaca.markets/docs/market-data-faq
+
+	'''
+
+# standard libraries
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+# non-standard libraries
+import numpy as np
+import pandas as pd
+from rate_budget import RateBudget
+from account_snapshot import pooled_session
+from bar_cache import to_utc_datetime64, missing_intervals
+from tick_store import TickStore, trades_to_columns, concat_trades, select_rows, split_into_chunks
+
+
+TRADES_URL = "https://data.alpaca.markets/v2/stocks/trades"
+MAX_TRADES_PER_PAGE = 10000 # max "limit" allowed by the stocks/trades endpoint
+SYMBOLS_PER_REQUEST = 10
+MAX_WORKERS = 8
+COVERAGE_SAVE_INTERVAL = 100 # jobs
+
+def to_rfc3339_ns(t):
+    return np.datetime_as_string(np.datetime64(t, 'ns'), unit='ns') + 'Z'
+
+def download_chunk(symbols, start, end, headers, feed, budget, session, limit=MAX_TRADES_PER_PAGE):
+    # every page of trades of symbols in [start, end)
+    # returns (dictionary of symbol -> column dictionary, number of requests made)
+    params = {
+        'symbols' : ','.join(symbols),
+        'start'   : to_rfc3339_ns(start),
+        'end'     : to_rfc3339_ns(end),
+        'limit'   : limit,
+        'feed'    : feed,
+        'sort'    : 'asc',
+    }
+    chunks, num_requests, page_token = {}, 0, None
+    while True:
+        page_params = dict(params)
+        if page_token != None:
+            page_params['page_token'] = page_token
+        data = budget.get(TRADES_URL, session=session, headers=headers, params=page_params).json()
+        num_requests += 1
+        for symbol, trades in (data.get('trades') or {}).items():
+            if len(trades) > 0:
+                chunks.setdefault(symbol, []).append(trades_to_columns(trades))
+        page_token = data.get('next_page_token')
+        if page_token == None:
+            break
+    columns = {}
+    for symbol, symbol_chunks in chunks.items():
+        # end is inclusive for the API, the trades at end belong to the next chunk
+        symbol_columns = concat_trades(symbol_chunks)
+        columns[symbol] = select_rows(symbol_columns, symbol_columns['time'] < end)
+    return columns, num_requests
+
+def download_trades(
+    symbols,
+    start,
+    end=None,
+    headers=None,
+    store=None,
+    feed='iex',
+    budget=None,
+    session=None,
+    symbols_per_request=SYMBOLS_PER_REQUEST,
+    max_workers=MAX_WORKERS,
+    verbose=False):
+
+    ''' download_trades()
+        description:
+            download every trade of symbols in [start, end) that isn't in the tick store yet, into the tick store
+        args:
+            symbols - string or list of strings - ticker symbol(s)
+            start - string / datetime - start of the window
+            end - string / datetime - end of the window (defaults to now)
+            headers - dictionary - API key headers
+            store - TickStore - a new 1 (for feed) is made if None
+            feed - string - 'iex' or 'sip'
+            budget - RateBudget - shared API rate limit (see rate_budget.py)
+            session - requests.Session - shared by every thread, a pooled 1 is made if None
+            symbols_per_request - int - max symbols in 1 request
+            max_workers - int - chunks downloaded at the same time
+        returns:
+            tuple of:
+                report - pandas dataframe - 1 row per symbol: trades (downloaded), chunks, requests (that included it),
+                         seconds (of the requests that included it), trades_per_second
+                stats - dictionary - totals: trades, chunks, requests, seconds (wall time), trades_per_second
+        '''
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    symbols = sorted(set(symbols))
+    store = store if store != None else TickStore(feed=feed)
+    budget = budget if budget != None else RateBudget()
+    session = session if session != None else pooled_session(pool_size=max_workers)
+    start = to_utc_datetime64(start)
+    now = to_utc_datetime64(datetime.now(timezone.utc))
+    end = now if end == None else min(to_utc_datetime64(end), now)
+
+    # the missing part of each chunk of each symbol, symbols missing the exact same part share requests
+    symbols_by_interval = {}
+    for symbol in symbols:
+        for missing_start, missing_end in missing_intervals(store.covered(symbol), start, end):
+            for _, chunk_start, chunk_end in split_into_chunks(missing_start, missing_end, store.chunk_size):
+                symbols_by_interval.setdefault((chunk_start, chunk_end), []).append(symbol)
+    jobs = []
+    for (chunk_start, chunk_end), chunk_symbols in sorted(symbols_by_interval.items()):
+        for i in range(0, len(chunk_symbols), symbols_per_request):
+            jobs.append((chunk_symbols[i:i + symbols_per_request], chunk_start, chunk_end))
+    if verbose:
+        print(f'downloading {len(symbols_by_interval)} missing chunk(s) of {len(symbols)} symbol(s) in {len(jobs)} job(s)')
+
+    report = {symbol : {'trades' : 0, 'chunks' : 0, 'requests' : 0, 'seconds' : 0.0} for symbol in symbols}
+    def run(job):
+        job_symbols, chunk_start, chunk_end = job
+        job_start_time = time.time()
+        columns, num_requests = download_chunk(job_symbols, chunk_start, chunk_end, headers, feed, budget, session)
+        # trades of the last minutes can still come in, so a chunk that isn't over isn't marked covered
+        num_trades = {symbol : store.write(symbol, chunk_start, chunk_end,
+            columns.get(symbol, concat_trades([])),
+            covered=chunk_end < now - np.timedelta64(15, 'm'),
+            save=False) for symbol in job_symbols}
+        return job_symbols, num_trades, num_requests, time.time() - job_start_time
+    start_time = time.time()
+    total_trades, total_requests = 0, 0
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for i, (job_symbols, num_trades, num_requests, seconds) in enumerate(executor.map(run, jobs)):
+                for symbol in job_symbols:
+                    downloaded = num_trades[symbol]
+                    report[symbol]['trades'] += downloaded
+                    report[symbol]['chunks'] += 1
+                    report[symbol]['requests'] += num_requests
+                    report[symbol]['seconds'] += seconds
+                    total_trades += downloaded
+                total_requests += num_requests
+                if (i + 1) % COVERAGE_SAVE_INTERVAL == 0:
+                    store.save_coverage()
+                    if verbose:
+                        print(f'{i + 1} of {len(jobs)} job(s) done, {total_trades} trade(s) in {"%.1f" % (time.time() - start_time)} second(s)')
+    finally:
+        # the chunks written before an error (or Ctrl-C) stay covered
+        store.save_coverage()
+    seconds = time.time() - start_time
+
+    report = pd.DataFrame.from_dict(report, orient='index')
+    report.index.name = 'symbol'
+    report['trades_per_second'] = report['trades'] / report['seconds'].where(report['seconds'] > 0)
+    stats = {
+        'trades'            : total_trades,
+        'chunks'            : len(symbols_by_interval),
+        'requests'          : total_requests,
+        'seconds'           : seconds,
+        'trades_per_second' : total_trades / seconds if seconds > 0 else np.nan,
+    }
+    if verbose:
+        print(f'downloaded {total_trades} trade(s) of {len(symbols)} symbol(s) with {total_requests} request(s) ' + \
+            f'in {"%.2f" % seconds} second(s) ({"%.0f" % stats["trades_per_second"]} trades per second)')
+    return report, stats
@@ -0,0 +1,129 @@
+'''
+
+	Description:
+		listens to the trade_updates websocket stream of the account in a background thread,
+        so other code can wait for an order to be filled / canceled instead of sleeping or polling the API
+
+        every update is:
+            1. recorded as the latest event of its order id (new, fill, partial_fill, canceled, ...)
+            2. passed to every subscriber (see subscribe), ex: the local order book in order_book.py
+        and threads blocked in wait_for() are woken up when 1 of their orders reaches 1 of the events they wait for
+
+        updates are handled in handle(), which doesn't need a websocket,
+        so anything that makes TradeUpdate-like objects (ex: a simulated broker) can feed it too
+
+        example:
+            listener = TradeUpdateListener(TradingStream(API_KEY, API_SECRET, paper=True))
+            listener.start()
+            order = trading_client.close_position('AAPL')
+            events = listener.wait_for([order.id], DONE_EVENTS, timeout=10)
+
+	Sources:
+        https://alpaca.markets/sdks/python/api_reference/trading/stream.html
+        https://docs.alpaca.markets/docs/websocket-streaming#trade-updates
+
+	'''
+
+# standard libraries
+import time
+import threading
+import traceback
+
+
+DONE_EVENTS = ('fill', 'canceled', 'expired', 'rejected', 'replaced', 'done_for_day')
+FILLED_EVENTS = ('fill',)
+CANCELED_EVENTS = ('canceled',)
+
+def event_name(update):
+    # TradeEvent enum or string -> string, ex: TradeEvent.FILL -> 'fill'
+    return getattr(update.event, 'value', update.event)
+
+class TradeUpdateListener:
+
+    def __init__(self, trading_stream=None):
+        # trading_stream - alpaca.trading.stream.TradingStream, or None to only be fed with handle()
+        self.stream = trading_stream
+        self.condition = threading.Condition()
+        self.events_by_order_id = {} # order id -> (event, TradeUpdate, time received in epoch seconds) of the latest update
+        self.subscribers = []
+        self.num_updates = 0
+        self.thread = None
+        if self.stream != None:
+            self.stream.subscribe_trade_updates(self.on_trade_update)
+
+    async def on_trade_update(self, update):
+        # called by the TradingStream's event loop
+        self.handle(update)
+
+    def handle(self, update):
+        event = event_name(update)
+        order_id = str(update.order.id)
+        with self.condition:
+            self.events_by_order_id[order_id] = (event, update, time.time())
+            self.num_updates += 1
+            self.condition.notify_all()
+        for callback in self.subscribers:
+            try:
+                callback(update)
+            except Exception:
+                # 1 broken subscriber shouldn't stop the others or kill the stream
+                print(f'\nException in trade update subscriber!!!')
+                print(f'{traceback.format_exc()}')
+
+    def subscribe(self, callback):
+        # callback(update) is called with every TradeUpdate, from the stream's thread
+        self.subscribers.append(callback)
+
+    def start(self, timeout=10.0):
+        # run the stream in a daemon thread, and wait up to timeout seconds for it to connect
+        # (updates of orders placed before it connects are missed)
+        if self.stream == None or self.thread != None:
+            return
+        self.thread = threading.Thread(target=self.stream.run, daemon=True)
+        self.thread.start()
+        deadline = time.time() + timeout
+        while not getattr(self.stream, '_running', True) and time.time() < deadline:
+            time.sleep(0.05)
+
+    def stop(self):
+        if self.stream != None and self.thread != None:
+            self.stream.stop()
+            self.thread.join()
+            self.thread = None
+
+    def last_event(self, order_id):
+        # latest event of an order, or None if no update has been received for it
+        entry = self.events_by_order_id.get(str(order_id))
+        return None if entry == None else entry[0]
+
+    def wait_for(self, order_ids, events=DONE_EVENTS, timeout=10.0):
+
+        ''' wait_for()
+            description:
+                block until every order has had 1 of events (or timeout)
+            args:
+                order_ids - list of strings / UUIDs - order ids
+                events - tuple of strings - trade update events to wait for
+                timeout - float - max seconds to wait
+            returns:
+                dictionary - order id -> (event, seconds waited), event is None if it timed out
+            '''
+        start_time = time.time()
+        deadline = start_time + timeout
+        waiting = set(str(order_id) for order_id in order_ids)
+        results = {}
+        with self.condition:
+            while True:
+                for order_id in list(waiting):
+                    entry = self.events_by_order_id.get(order_id)
+                    if entry != None and entry[0] in events:
+                        # an update that came before wait_for() was called counts as no wait
+                        results[order_id] = (entry[0], max(entry[2] - start_time, 0.0))
+                        waiting.remove(order_id)
+                remaining = deadline - time.time()
+                if len(waiting) == 0 or remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+        for order_id in waiting:
+            results[order_id] = (None, time.time() - start_time)
+        return results